@@ -1,13 +1,20 @@
-from flask import Flask, render_template, url_for, session, redirect, request, jsonify, send_from_directory, Response, flash
+from flask import Flask, render_template, url_for, session, redirect, request, jsonify, send_from_directory, Response, flash, make_response
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import timedelta, datetime
 import time
 import json
+import math
 import random
+import secrets
+from functools import wraps
+import gevent
 from gevent import sleep
+from gevent.queue import Queue, Empty
 
 # Flask alchemy for database
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.exc import IntegrityError, TimeoutError as PoolTimeoutError
+import click
 
 from dotenv import load_dotenv
 load_dotenv()
@@ -19,17 +26,145 @@ app = Flask(__name__)
 app.secret_key = SECRET_KEY  # Change this to a secure key in production
 app.permanent_session_lifetime = timedelta(hours=4)
 
-# Database config
+# Number of reverse proxies in front of the app. Each appends to
+# X-Forwarded-For, so request.remote_addr can be taken from there; with 0
+# the header is ignored, as a client can send anything in it.
+from werkzeug.middleware.proxy_fix import ProxyFix
+TRUSTED_PROXIES = int(os.getenv('TRUSTED_PROXIES', 0))
+if TRUSTED_PROXIES:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXIES)
+
+# Database config. Pool sizes come from DB_POOL_* env vars (see dbpool.py).
+# READ_DATABASE_URL optionally points snapshot reads and polling at a read
+# replica; everything else, and every write, goes to DATABASE_URL.
+from dbpool import REPLICA, RoutingSession, PoolMetrics, engine_options, make_driver_cooperative, pool_load
 DATABASE_URL = os.getenv('DATABASE_URL')
+READ_DATABASE_URL = os.getenv('READ_DATABASE_URL')
 app.config['SQLALCHEMY_DATABASE_URI'] = DATABASE_URL
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-
-db = SQLAlchemy(app)
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(DATABASE_URL)
+if READ_DATABASE_URL:
+    app.config['SQLALCHEMY_BINDS'] = {
+        REPLICA: {'url': READ_DATABASE_URL, **engine_options(READ_DATABASE_URL, prefix='DB_READ')}
+    }
+make_driver_cooperative(DATABASE_URL)
+
+db = SQLAlchemy(app, session_options={'class_': RoutingSession})
+
+with app.app_context():
+    pool_metrics = {key or 'primary': PoolMetrics(engine) for key, engine in db.engines.items()}
+
+def reads_from_replica(view):
+    """Run the view's queries against the read replica, if one is configured"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        db.session.info['read_only'] = True
+        return view(*args, **kwargs)
+    return wrapper
+
+@app.errorhandler(PoolTimeoutError)
+def pool_exhausted(error):
+    """Every connection is busy: tell the client to come back rather than hang"""
+    read_only = db.session.info.get('read_only') and REPLICA in pool_metrics
+    pool_metrics[REPLICA if read_only else 'primary'].timed_out()
+    app.logger.warning(f"Database pool exhausted: {error}")
+    db.session.rollback()
+    response = jsonify({'success': False, 'message': 'Server busy, please retry', 'retry_after': 1})
+    response.status_code = 503
+    response.headers['Retry-After'] = '1'
+    return response
+
+# Rate limiting: {limit name: (burst capacity, tokens refilled per second)},
+# applied per route, so a page polling the timer, the courts and its next
+# game spends three separate budgets. Logged-in clients are keyed by
+# username, so players sharing the club's Wi-Fi NAT aren't throttled as one.
+# Anonymous clients are keyed by IP (behind TRUSTED_PROXIES, the one the
+# proxies saw), so anonymous spectators behind one NAT do share a budget.
+from ratelimit import RateLimiter, MemoryStore, RedisStore
+RATE_LIMITS = {
+    'mutation': (5, 0.5),  # each of join/create/leave: burst of 5, then one every 2s
+    'poll': (20, 3),       # each polled endpoint (pages poll ~2x a second)
+}
+RATE_LIMIT_STORAGE_URL = os.getenv('RATE_LIMIT_STORAGE_URL')  # e.g. redis://localhost:6379/0 to share between workers
+rate_limiter = RateLimiter(
+    RATE_LIMITS,
+    store=RedisStore(RATE_LIMIT_STORAGE_URL) if RATE_LIMIT_STORAGE_URL else MemoryStore(),
+    enabled=os.getenv('RATE_LIMIT_ENABLED', '1') != '0'
+)
+
+def rate_limited(limit_name):
+    """Reject requests over the named limit with a cheap 429 before any DB work"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            identity = session.get('user') or request.remote_addr
+            allowed, retry_after = rate_limiter.check(limit_name, identity, request.url_rule.rule)
+            if not allowed:
+                response = jsonify({
+                    'success': False,
+                    'message': 'Too many requests, please slow down',
+                    'retry_after': retry_after
+                })
+                response.status_code = 429
+                response.headers['Retry-After'] = str(math.ceil(retry_after))
+                return response
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+# Idempotency: player actions may carry a client-generated Idempotency-Key
+# header. The finished JSON response is kept for a while, so a retry of a
+# request that already succeeded is answered from memory instead of running
+# (and committing) again.
+from cache import TTLCache
+IDEMPOTENCY_TTL = 10 * 60
+idempotency_cache = TTLCache(maxsize=5000, ttl=IDEMPOTENCY_TTL)
+_in_flight_keys = set()
+
+def idempotent(view):
+    """Replay the stored response for a repeated Idempotency-Key"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get('Idempotency-Key')
+        if not key:
+            return view(*args, **kwargs)
+
+        cache_key = (session.get('user'), request.path, key[:64])
+        cached = idempotency_cache.get(cache_key)
+        if cached is not None:
+            body, status = cached
+            response = app.response_class(body, status=status, mimetype='application/json')
+            response.headers['Idempotent-Replayed'] = 'true'
+            return response
+
+        if cache_key in _in_flight_keys:
+            return jsonify({'success': False, 'message': 'This request is already being processed'}), 409
+
+        _in_flight_keys.add(cache_key)
+        try:
+            response = make_response(view(*args, **kwargs))
+        finally:
+            _in_flight_keys.discard(cache_key)
+
+        # Only completed JSON answers are worth replaying; redirects carry
+        # flashed state and throttled/failed requests should really re-run
+        if response.is_json and response.status_code < 429:
+            idempotency_cache.set(cache_key, (response.get_data(), response.status_code))
+        return response
+    return wrapper
+
+class Venue(db.Model):
+    """A hall or session with its own courts, timer and club state"""
+    id = db.Column(db.Integer, primary_key=True)
+    slug = db.Column(db.String(40), unique=True, nullable=False)
+    name = db.Column(db.String(80), nullable=False)
 
 class Court(db.Model):
+    __table_args__ = (db.UniqueConstraint('venue_id', 'name'),)
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(80), unique=True, nullable=False)
-    
+    venue_id = db.Column(db.Integer, db.ForeignKey('venue.id'), nullable=False, index=True)
+    name = db.Column(db.String(80), nullable=False)
+
     # Now we have groups both on court and in queue
     # The groups relationship is defined in the Group model
     
@@ -62,16 +197,47 @@ class QueueEntry(db.Model):
 
 class ClubState(db.Model):
     id = db.Column(db.Integer, primary_key=True)
+    venue_id = db.Column(db.Integer, db.ForeignKey('venue.id'), unique=True, nullable=False)
     is_active = db.Column(db.Boolean, default=False)
     last_modified = db.Column(db.DateTime, default=datetime.utcnow)
+    # Apply queue balancing moves on rotation instead of only suggesting them
+    auto_balance = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
+    # Merge partial queue groups on rotation, optionally across courts
+    auto_compact = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
+    compact_across_courts = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
 
 class TimerState(db.Model):
+    # A venue's timer settings. Each court runs its own clock (CourtTimer);
+    # the running-state columns below date from the single venue-wide timer
+    # and are no longer used.
     id = db.Column(db.Integer, primary_key=True)
-    duration = db.Column(db.Integer, default=900)  # 15 minutes in seconds
+    venue_id = db.Column(db.Integer, db.ForeignKey('venue.id'), unique=True, nullable=False)
+    duration = db.Column(db.Integer, default=900)  # 15 minutes in seconds, for new court timers
     remaining_time = db.Column(db.Integer, default=900)
     is_running = db.Column(db.Boolean, default=False)
     start_time = db.Column(db.Float, nullable=True)
     end_time = db.Column(db.Float, nullable=True)
+    # Starting all courts together offsets court n's first round by n * stagger_seconds,
+    # so rotations (and everyone's refresh) don't all land at the same instant
+    stagger_seconds = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Start a court's next round as soon as it rotates, keeping the stagger
+    auto_restart = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
+
+class CourtTimer(db.Model):
+    """One court's round clock"""
+    id = db.Column(db.Integer, primary_key=True)
+    court_id = db.Column(db.Integer, db.ForeignKey('court.id'), unique=True, nullable=False)
+    duration = db.Column(db.Integer, default=900)
+    remaining_time = db.Column(db.Integer, default=900)  # seconds left as of start_time
+    is_running = db.Column(db.Boolean, default=False)
+    start_time = db.Column(db.Float, nullable=True)
+    end_time = db.Column(db.Float, nullable=True)
+    
+    court = db.relationship('Court', backref=db.backref('timer', uselist=False))
+
+class SchemaInfo(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False)
 
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -81,7 +247,9 @@ class User(db.Model):
     is_checked_in = db.Column(db.Boolean, default=False)
     
     # Add the group_id foreign key to connect User to Group
-    group_id = db.Column(db.Integer, db.ForeignKey('group.id'), nullable=True)
+    group_id = db.Column(db.Integer, db.ForeignKey('group.id'), nullable=True, index=True)
+    # Epoch seconds the player last went from no group to one, for play history
+    joined_at = db.Column(db.Float, nullable=True)
     
     # Keep the old court_id for compatibility during transition
     court_id = db.Column(db.Integer, db.ForeignKey('court.id'), nullable=True)
@@ -90,10 +258,17 @@ class User(db.Model):
     queue_entry = db.relationship('QueueEntry', back_populates='user', uselist=False)
 
 class Group(db.Model):
+    # Courts' active groups and ordered queues, found without a table scan
+    __table_args__ = (db.Index('ix_group_court_queue', 'court_id', 'is_in_queue', 'queue_position'),)
     id = db.Column(db.Integer, primary_key=True)
     court_id = db.Column(db.Integer, db.ForeignKey('court.id'), nullable=True)
     is_in_queue = db.Column(db.Boolean, default=True)  # True if in queue, False if on court
     queue_position = db.Column(db.Integer, nullable=True)  # Position in queue (NULL if on court)
+    # Bumped on every membership change, see claim_group()
+    version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Epoch seconds the group was formed and went on court, for play history
+    created_at = db.Column(db.Float, nullable=True, default=time.time)
+    started_at = db.Column(db.Float, nullable=True)
     
     # Relationships
     court = db.relationship('Court', backref='groups')
@@ -112,6 +287,41 @@ class Group(db.Model):
             'players': [player.username for player in self.players],
             'is_full': self.is_full()
         }
+# Play history. Every finished game is appended to PlayHistory when its court
+# rotates (one row per player), and the rollups below are updated in the same
+# transaction, so /stats never has to scan the history.
+class PlayHistory(db.Model):
+    """One player's finished game"""
+    __table_args__ = (db.Index('ix_play_history_venue_ended', 'venue_id', 'ended_at'),)
+    id = db.Column(db.Integer, primary_key=True)
+    venue_id = db.Column(db.Integer, db.ForeignKey('venue.id'), nullable=False)
+    court_id = db.Column(db.Integer, db.ForeignKey('court.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    started_at = db.Column(db.Float, nullable=False)
+    ended_at = db.Column(db.Float, nullable=False)
+    wait_seconds = db.Column(db.Float, nullable=False, default=0)  # from joining the group to going on court
+
+class PlayerStats(db.Model):
+    """Games, play time and waiting per player and venue"""
+    __table_args__ = (db.UniqueConstraint('venue_id', 'user_id'),)
+    id = db.Column(db.Integer, primary_key=True)
+    venue_id = db.Column(db.Integer, db.ForeignKey('venue.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    games = db.Column(db.Integer, nullable=False, default=0)
+    play_seconds = db.Column(db.Float, nullable=False, default=0)
+    wait_seconds = db.Column(db.Float, nullable=False, default=0)
+    last_played = db.Column(db.Float, nullable=True)
+
+class CourtHourStats(db.Model):
+    """Games finished and seconds in play per court and clock hour"""
+    __table_args__ = (db.UniqueConstraint('court_id', 'hour'), db.Index('ix_court_hour_stats_venue_hour', 'venue_id', 'hour'))
+    id = db.Column(db.Integer, primary_key=True)
+    venue_id = db.Column(db.Integer, db.ForeignKey('venue.id'), nullable=False)
+    court_id = db.Column(db.Integer, db.ForeignKey('court.id'), nullable=False)
+    hour = db.Column(db.Integer, nullable=False)  # epoch seconds at the start of the hour
+    games = db.Column(db.Integer, nullable=False, default=0)
+    busy_seconds = db.Column(db.Float, nullable=False, default=0)
+
 def get_user_group(user):
     """Get the group a user belongs to"""
     if isinstance(user, str):
@@ -136,6 +346,443 @@ def get_next_queue_position(court):
     ).scalar()
     
     return 1 if max_position is None else max_position + 1
+
+# Authorization. The signed session cookie only carries the username; who
+# that is (user id, admin role) is kept server-side in `claims`, so
+# permission checks are a dict lookup rather than a User query on every
+# admin and timer call. A commit that changes a user's role or deletes them
+# drops their entry (see _collect_stale_claims), and
+# entries expire after CLAIMS_TTL anyway so other worker processes catch up.
+from sqlalchemy import event
+from sqlalchemy.orm import Session as OrmSession
+CLAIMS_TTL = 30
+claims = TTLCache(maxsize=10000, ttl=CLAIMS_TTL)  # username -> claims dict
+
+def current_claims():
+    """{'user_id', 'username', 'is_admin'} for the logged-in user, or None"""
+    username = session.get('user')
+    if not username:
+        return None
+    found = claims.get(username)
+    if found is None:
+        row = db.session.execute(
+            db.select(User.id, User.is_admin).where(User.username == username)
+        ).first()
+        if row is None:
+            return None
+        found = {'user_id': row.id, 'username': username, 'is_admin': bool(row.is_admin)}
+        claims.set(username, found)
+    return found
+
+def _is_admin():
+    """Helper to check admin status"""
+    user_claims = current_claims()
+    return bool(user_claims and user_claims['is_admin'])
+
+def admin_required(view):
+    """401 unless the logged-in user is an admin"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not _is_admin():
+            return jsonify({'error': 'Unauthorized'}), 401
+        return view(*args, **kwargs)
+    return wrapper
+
+def claims_changed(db_session, usernames):
+    """Drop these users' claims once db_session's transaction commits"""
+    db_session.info.setdefault('stale_claims', set()).update(usernames)
+
+@event.listens_for(OrmSession, 'before_flush')
+def _collect_stale_claims(db_session, flush_context, instances):
+    stale = set()
+    for obj in db_session.dirty:
+        if isinstance(obj, User) and db.inspect(obj).attrs.is_admin.history.has_changes():
+            stale.add(obj.username)
+    for obj in db_session.deleted:
+        if isinstance(obj, User):
+            stale.add(obj.username)
+    if stale:
+        claims_changed(db_session, stale)
+
+@event.listens_for(OrmSession, 'after_commit')
+def _drop_stale_claims(db_session):
+    for username in db_session.info.pop('stale_claims', ()):
+        claims.pop(username)
+
+@event.listens_for(OrmSession, 'after_rollback')
+def _keep_claims(db_session):
+    db_session.info.pop('stale_claims', None)
+
+# Venues. Courts, timers and club state belong to a venue; users don't, so
+# one account works at every hall. A request is about the venue named by
+# ?venue=<slug>, else the one this browser picked at /venue/<slug>, else
+# the default venue.
+DEFAULT_VENUE = ('main', 'Main Hall')  # (slug, name) created by bootstrap_db()
+venue_ids = TTLCache(maxsize=1000, ttl=60)  # slug -> id, venues are rarely added
+
+def default_venue_id():
+    return db.session.scalar(db.select(Venue.id).order_by(Venue.id).limit(1))
+
+def current_venue_id():
+    slug = request.args.get('venue') or session.get('venue') or DEFAULT_VENUE[0]
+    venue_id = venue_ids.get(slug)
+    if venue_id is None:
+        venue_id = db.session.scalar(db.select(Venue.id).where(Venue.slug == slug)) or default_venue_id()
+        venue_ids.set(slug, venue_id)
+    return venue_id
+
+def get_timer_state(venue_id):
+    return TimerState.query.filter_by(venue_id=venue_id).first()
+
+def get_club_state(venue_id):
+    return ClubState.query.filter_by(venue_id=venue_id).first()
+
+# Helpers that take db_session also run on an async session's sync view
+# (AsyncSession.run_sync, see asgi.py); they default to Flask's db.session.
+def venue_courts(venue_id, db_session=None):
+    db_session = db_session or db.session
+    return list(db_session.scalars(db.select(Court).where(Court.venue_id == venue_id).order_by(Court.id)))
+
+def court_timers(venue_id, db_session=None):
+    """The venue's CourtTimers in court order"""
+    db_session = db_session or db.session
+    return list(db_session.scalars(
+        db.select(CourtTimer).join(Court).where(Court.venue_id == venue_id).order_by(Court.id)
+    ))
+
+def timer_remaining(timer, now):
+    """Seconds left in a court's round at time now"""
+    if timer.is_running and timer.start_time is not None:
+        return max(0, timer.remaining_time - (now - timer.start_time))
+    return timer.remaining_time or 0
+
+def start_court_timer(timer, now, offset=0):
+    """Resume a paused round, or start a fresh one offset seconds longer"""
+    if timer.is_running or not 0 < timer.remaining_time < timer.duration:
+        timer.remaining_time = timer.duration + offset
+    timer.end_time = now + timer.remaining_time
+    timer.start_time = now
+    timer.is_running = True
+
+def stop_court_timer(timer, now):
+    if timer.is_running:
+        timer.remaining_time = max(0, timer.remaining_time - (now - timer.start_time))
+        timer.is_running = False
+        timer.start_time = None
+        timer.end_time = None
+
+# Shortest round the timer routes accept. A zero-length round would be over
+# the moment it started, so auto-restart would rotate the court over and over.
+MIN_ROUND_SECONDS = 30
+
+def reset_court_timer(timer, duration=None):
+    if duration is not None:
+        timer.duration = duration
+    timer.end_time = None
+    timer.start_time = None
+    timer.is_running = False
+    timer.remaining_time = timer.duration
+
+# Concurrency control for group membership. Every change to who is in a
+# group goes through claim_group(), by default a compare-and-swap on
+# Group.version, so two requests that both saw "3/4 players" can't both
+# commit. The loser rolls back and retries against fresh state.
+#
+# GROUP_CONCURRENCY=locking is pessimistic instead: groups are loaded with
+# SELECT ... FOR UPDATE (load_group_for_update), which holds off everyone
+# else until commit, so claim_group() only bumps the version and never
+# conflicts, and nothing retries. SQLite has no row locks, so there the
+# locking mode keeps the compare-and-swap.
+GROUP_CONCURRENCY = os.getenv('GROUP_CONCURRENCY', 'optimistic')
+GROUP_CAS_RETRIES = 5
+
+class GroupVersionConflict(Exception):
+    """Another request changed the group since we read it"""
+
+def row_locking():
+    return GROUP_CONCURRENCY == 'locking' and db.engine.dialect.name != 'sqlite'
+
+def for_update(query):
+    """query, locking the groups it loads in locking mode (and reading them
+    afresh, as whatever the session already held may predate the lock)"""
+    if GROUP_CONCURRENCY != 'locking':
+        return query
+    return query.with_for_update().execution_options(populate_existing=True)
+
+def load_group_for_update(group_id):
+    return db.session.scalar(for_update(db.select(Group).where(Group.id == group_id)))
+
+def claim_group(group):
+    """Bump group's version if nobody else has, otherwise raise
+    GroupVersionConflict. With row locks, the caller already holds group's
+    lock, so the bump can't conflict."""
+    update = Group.__table__.update().where(Group.id == group.id)
+    if row_locking():
+        db.session.execute(update.values(version=Group.version + 1))
+    elif db.session.execute(update.where(Group.version == group.version)
+                            .values(version=group.version + 1)).rowcount != 1:
+        raise GroupVersionConflict(group.id)
+    # Keep the identity map in step with the row we just wrote
+    db.session.expire(group, ['version'])
+
+def backoff_after_conflict(attempt):
+    db.session.rollback()
+    sleep(random.uniform(0, 0.005 * 2 ** attempt))
+
+class WaitEstimates:
+    """Estimated start time of every queue group.
+    
+    The n-th group in a court's queue (n from 0) starts when that court's
+    current round ends plus n more of its rounds. Rather than re-deriving that from the
+    database per request, the queue order and timer are kept in memory and
+    patched by the routes that change them (queueing, leaving, rotation,
+    timer controls). Changes made by other workers are picked up by a full
+    rebuild every max_age seconds. Each venue has its own instance, see
+    estimates_for().
+    """
+    
+    def __init__(self, venue_id, max_age=30):
+        self.venue_id = venue_id
+        self.max_age = max_age
+        self.built_at = None
+        self.queues = {}        # court_id -> [group_id, ...] in queue order
+        self.court_of = {}      # group_id -> court_id
+        self.court_names = {}   # court_id -> name
+        self.round_end = {}     # court_id -> epoch seconds its running round ends, None if paused
+        self.remaining = {}     # court_id -> seconds left in its round while paused
+        self.duration = {}      # court_id -> round length
+        self.positions = None   # group_id -> groups ahead of it, see groups_ahead()
+    
+    def rebuild(self, db_session=None):
+        db_session = db_session or db.session
+        self.court_names = dict(db_session.execute(
+            db.select(Court.id, Court.name).where(Court.venue_id == self.venue_id)
+        ).all())
+        self.queues = {court_id: [] for court_id in self.court_names}
+        self.court_of = {}
+        rows = db_session.execute(
+            db.select(Group.id, Group.court_id)
+            .where(Group.court_id.in_(list(self.court_names)), Group.is_in_queue == True)
+            .order_by(Group.court_id, Group.queue_position)
+        ).all()
+        for group_id, court_id in rows:
+            self.queues.setdefault(court_id, []).append(group_id)
+            self.court_of[group_id] = court_id
+        self.positions = None
+        for timer in court_timers(self.venue_id, db_session):
+            self.timer_changed(timer)
+        self.built_at = time.monotonic()
+    
+    def ensure_fresh(self, queue_group_ids=None, db_session=None):
+        """Rebuild if too old, or if queue_group_ids (what the database says
+        is queued right now) shows another worker changed the queues"""
+        if (self.built_at is None
+                or time.monotonic() - self.built_at > self.max_age
+                or (queue_group_ids is not None and set(queue_group_ids) != self.court_of.keys())):
+            self.rebuild(db_session)
+    
+    def timer_changed(self, timer):
+        """A court's CourtTimer was started, stopped or changed"""
+        if timer is None:
+            return
+        court_id = timer.court_id
+        self.duration[court_id] = timer.duration or 0
+        if timer.is_running and timer.end_time:
+            self.round_end[court_id], self.remaining[court_id] = timer.end_time, 0
+        else:
+            self.round_end[court_id], self.remaining[court_id] = None, timer.remaining_time or 0
+    
+    def group_queued(self, court_id, group_id):
+        if self.built_at is None:
+            return
+        self.queues.setdefault(court_id, []).append(group_id)
+        self.court_of[group_id] = court_id
+        if self.positions is not None:
+            self.positions[group_id] = len(self.queues[court_id]) - 1
+    
+    def group_removed(self, group_id):
+        court_id = self.court_of.pop(group_id, None)
+        if court_id is not None:
+            self.queues[court_id].remove(group_id)
+            self.positions = None
+    
+    def rotated(self, timer):
+        # The head of the court's queue went on court
+        queue = self.queues.get(timer.court_id)
+        if queue:
+            del self.court_of[queue.pop(0)]
+            self.positions = None
+        self.timer_changed(timer)
+    
+    def groups_ahead(self, group_id):
+        """How many groups are ahead of a queue group on its court. The
+        positions are worked out once per change to the queues, not per call."""
+        if self.positions is None:
+            self.positions = {group_id: ahead for queue in self.queues.values()
+                              for ahead, group_id in enumerate(queue)}
+        return self.positions[group_id]
+    
+    def clocks(self, now=None):
+        """{court_id: (seconds left in its round, round length)} for balancer.py.
+        An untimed court is taken to be as slow as the slowest timed one."""
+        now = now or time.time()
+        typical = max(self.duration.values(), default=0) or 900
+        clocks = {}
+        for court_id in self.queues:
+            duration = self.duration.get(court_id, 0)
+            if not duration:
+                clocks[court_id] = (typical, typical)
+            elif self.round_end.get(court_id) is not None:
+                clocks[court_id] = (max(self.round_end[court_id] - now, 0), duration)
+            else:
+                clocks[court_id] = (self.remaining.get(court_id, 0), duration)
+        return clocks
+    
+    def estimate(self, group_id):
+        """(starts_at, starts_in) for a queue group.
+        
+        While the timer runs starts_at is an epoch timestamp and starts_in is
+        None; while it's paused the start can't be pinned to the clock, so
+        starts_in is the number of timer seconds until it starts instead.
+        """
+        court_id = self.court_of.get(group_id)
+        if court_id is None:
+            return None, None
+        rounds_ahead = self.groups_ahead(group_id) * self.duration.get(court_id, 0)
+        if self.round_end.get(court_id) is not None:
+            return self.round_end[court_id] + rounds_ahead, None
+        return None, self.remaining.get(court_id, 0) + rounds_ahead
+
+wait_estimates = {}  # venue_id -> WaitEstimates
+
+def estimates_for(venue_id):
+    if venue_id not in wait_estimates:
+        wait_estimates[venue_id] = WaitEstimates(venue_id)
+    return wait_estimates[venue_id]
+
+from balancer import plan_moves, apply_moves, expected_wait
+
+def current_queues(venue_id):
+    """{court_id: [(group_id, player_count), ...]} in queue order for one venue"""
+    estimates = estimates_for(venue_id)
+    estimates.ensure_fresh()
+    counts = dict(db.session.execute(
+        db.select(User.group_id, db.func.count(User.id))
+        .where(User.group_id.in_(list(estimates.court_of)))
+        .group_by(User.group_id)
+    ).all())
+    return {
+        court_id: [(group_id, counts.get(group_id, 0)) for group_id in queue]
+        for court_id, queue in estimates.queues.items()
+    }
+
+def balance_queues(venue_id, apply=False):
+    """Plan (and optionally apply) moves that even out a venue's queues.
+    Expected waits are in seconds."""
+    estimates = estimates_for(venue_id)
+    queues = current_queues(venue_id)
+    clocks = estimates.clocks()
+    moves = plan_moves(queues, clocks)
+    names = estimates.court_names
+    result = {
+        'moves': [{
+            'group_id': group_id,
+            'from_court': names.get(source),
+            'to_court': names.get(target)
+        } for group_id, source, target in moves],
+        'expected_wait_before': expected_wait(queues, clocks),
+        'expected_wait_after': expected_wait(apply_moves(queues, moves), clocks),
+        'applied': False
+    }
+    if not apply or not moves:
+        return result
+    
+    # Moves only ever take the last group of a queue, so the source court's
+    # remaining positions stay contiguous. If a group was queued behind it
+    # since planning, give up rather than leave a gap.
+    try:
+        for group_id, source, target in moves:
+            group = load_group_for_update(group_id)
+            if (not group or not group.is_in_queue or group.court_id != source
+                    or group.queue_position != get_next_queue_position(group.court) - 1):
+                raise GroupVersionConflict(group_id)
+            claim_group(group)
+            next_position = get_next_queue_position(db.session.get(Court, target))
+            group.court_id = target
+            group.queue_position = next_position
+        db.session.commit()
+    except GroupVersionConflict:
+        db.session.rollback()
+        estimates.rebuild()
+        return result
+    
+    for group_id, source, target in moves:
+        estimates.group_removed(group_id)
+        estimates.group_queued(target, group_id)
+    result['applied'] = True
+    return result
+
+from compaction import plan_merges
+
+def compact_queues(venue_id, across_courts=False):
+    """Merge a venue's partial queue groups into earlier ones with room (see compaction.py).
+    
+    Runs inside the caller's transaction and doesn't commit. Raises
+    GroupVersionConflict if a touched group changed concurrently.
+    """
+    court_ids = db.select(Court.id).where(Court.venue_id == venue_id)
+    rows = db.session.execute(
+        db.select(Group.id, Group.court_id, db.func.count(User.id))
+        .outerjoin(User, User.group_id == Group.id)
+        .where(Group.court_id.in_(court_ids), Group.is_in_queue == True)
+        .group_by(Group.id, Group.court_id, Group.queue_position)
+        .order_by(Group.queue_position, Group.court_id)
+    ).all()
+    
+    if across_courts:
+        queues = [[(group_id, players) for group_id, _, players in rows]]
+    else:
+        by_court = {}
+        for group_id, court_id, players in rows:
+            by_court.setdefault(court_id, []).append((group_id, players))
+        queues = by_court.values()
+    
+    merges, empty = [], []
+    for queue in queues:
+        queue_merges, queue_empty = plan_merges(queue, MAX_PLAYERS)
+        merges += queue_merges
+        empty += queue_empty
+    
+    result = {'merged': len(merges), 'dropped': len(empty), 'queue_groups_before': len(rows)}
+    if not merges and not empty:
+        result['queue_groups_after'] = len(rows)
+        return result
+    
+    # Everyone whose membership changes gets a version bump, so a join that
+    # raced us fails its compare-and-swap instead of landing in a deleted group
+    touched = {group_id for merge in merges for group_id in merge} | set(empty)
+    for group in db.session.scalars(for_update(db.select(Group).where(Group.id.in_(touched)))):
+        claim_group(group)
+    
+    for source, target in merges:
+        db.session.execute(User.__table__.update().where(User.group_id == source).values(group_id=target))
+    dead = [source for source, _ in merges] + empty
+    db.session.execute(Group.__table__.delete().where(Group.id.in_(dead)))
+    db.session.flush()
+    db.session.expire_all()
+    
+    # Close the gaps the deleted groups left, keeping everyone's order
+    remaining = Group.query.filter(
+        Group.court_id.in_(court_ids), Group.is_in_queue == True
+    ).order_by(Group.court_id, Group.queue_position).all()
+    position_on = {}
+    for group in remaining:
+        position_on[group.court_id] = position_on.get(group.court_id, 0) + 1
+        group.queue_position = position_on[group.court_id]
+    db.session.flush()
+    
+    result['queue_groups_after'] = len(remaining)
+    return result
 # Old court model
 # courts = {f'Court {i}': {'players': [], 'queue': []} for i in range(1, 5)}  # 4 courts
 
@@ -184,23 +831,45 @@ def get_random_signature():
     ]
     return random.choice(signatures)
 
+# Built assets (see assets.py). Hashed filenames never change content, so
+# browsers may cache them forever and skip revalidation entirely.
+import mimetypes
+from assets import DIST_DIR, load_manifest
+asset_manifest = load_manifest()
+
+def asset_url(name):
+    """URL of the built bundle name, or None if assets haven't been built"""
+    hashed = asset_manifest.get(name)
+    return url_for('built_asset', filename=hashed) if hashed else None
+
+@app.route('/assets/<path:filename>')
+def built_asset(filename):
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    accepted = request.headers.get('Accept-Encoding', '')
+    
+    # Serve the precompressed variant the client can take, if we built one
+    for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if encoding in accepted and os.path.isfile(os.path.join(DIST_DIR, filename + suffix)):
+            response = send_from_directory(DIST_DIR, filename + suffix, mimetype=mimetype)
+            response.headers['Content-Encoding'] = encoding
+            break
+    else:
+        response = send_from_directory(DIST_DIR, filename, mimetype=mimetype)
+    
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
 @app.context_processor
 def inject_constants():
     return dict(MAX_PLAYERS=MAX_PLAYERS)
 
 @app.context_processor
 def inject_utilities():
-    club_state = ClubState.query.first()
-    timer_state = TimerState.query.first()
+    venue_id = current_venue_id()
+    club_state = get_club_state(venue_id)
+    timer_state = get_timer_state(venue_id)
     
-    # Check if current user is admin
-    username = session.get('user')
-    is_admin = False
-    if username:
-        user = User.query.filter_by(username=username).first()
-        if user and user.is_admin:
-            is_admin = True
-            
     return {
         'MAX_PLAYERS': MAX_PLAYERS,
         'is_user_active': is_user_active,  # Use the new helper function
@@ -210,28 +879,25 @@ def inject_utilities():
         'timer_state': timer_state,
         'is_user_on_court_or_queue': is_user_on_court_or_queue,
         'signature': get_random_signature(),
-        'is_admin': is_admin 
+        'is_admin': _is_admin(),
+        'asset_url': asset_url,
+        'venue': db.session.get(Venue, venue_id)
     }
 
 @app.route('/')
 def home():
-    # Get current username and check if club is active
-    username = session.get('user')
-    user = None
-    is_admin = False
-    if username:
-        user = User.query.filter_by(username=username).first()
-        if user and user.is_admin:
-            is_admin = True
-    
-    logged_in = user is not None
+    # Get current user and check if club is active
+    user_claims = current_claims()
+    logged_in = user_claims is not None
+    is_admin = bool(user_claims and user_claims['is_admin'])
 
     # Get club state from database
-    club_state = ClubState.query.first()
-    courts = Court.query.all()
+    venue_id = current_venue_id()
+    club_state = get_club_state(venue_id)
+    courts = venue_courts(venue_id)
 
     # If club inactive, and user not admin, show inactive page
-    if not club_state.is_active and (not user or not user.is_admin):
+    if not club_state.is_active and not is_admin:
         return render_template('inactive.html')
     
     # Otherwise, if club is active OR user is admin, show home page
@@ -284,147 +950,99 @@ def signup():
 
 @app.route('/logout', methods=['GET', 'POST'])
 def logout():
+    venue = session.get('venue')
     session.clear()
+    if venue:
+        session['venue'] = venue  # stay at the same hall
     return redirect(url_for('login'))
 
-@app.route('/join-slot/<int:group_id>', methods=['POST'])
-def join_slot(group_id):
-    if 'user' not in session:
-        flash('You must be logged in', 'error')
-        if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-            return jsonify({'success': False, 'message': 'You must be logged in'}), 401
-        return redirect(url_for('login'))
-    
-    username = session['user']
+@app.route('/venue/<slug>')
+def select_venue(slug):
+    """Switch this browser to another venue's courts"""
+    if not db.session.scalar(db.select(Venue.id).where(Venue.slug == slug)):
+        flash('Venue not found', 'error')
+        return redirect(url_for('home'))
+    session['venue'] = slug
+    return redirect(url_for('home'))
+
+# Player mutations: joining, creating and leaving groups. Each is a function
+# that checks and applies one player's change in the current transaction,
+# without committing, and returns (message, response data, effect), where
+# effect is None or a callable to run once the change is committed. It
+# raises MutationRejected when the player can't do that right now, before
+# changing anything.
+#
+# run_mutation() commits them one request at a time, or with GROUP_COMMIT_MS
+# set, hands them to a CommitBatcher (see groupcommit.py): mutations that
+# arrive within that many milliseconds of each other are applied one after
+# another in the batcher's session, each seeing the ones before it, and
+# committed together. A batch that fails as a whole (a version conflict with
+# another worker, say) is rolled back and its mutations are rerun one by
+# one, so batching never changes what a request is told. Needs gevent
+# workers.
+class MutationRejected(Exception):
+    """The player can't do that right now; the message is for them"""
+
+def join_group(username, group_id):
     user = User.query.filter_by(username=username).first()
-    group = Group.query.get(group_id)
-    
+    group = load_group_for_update(group_id)
     if not group:
-        flash('Group not found', 'error')
-        if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-            return jsonify({'success': False, 'message': 'Group not found'})
-        return redirect(url_for('home'))
-    
+        raise MutationRejected('Group not found')
     if user.group:
-        flash('You are already in a group', 'error')
-        if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-            return jsonify({'success': False, 'message': 'You are already in a group'})
-        return redirect(url_for('home'))
-    
+        raise MutationRejected('You are already in a group')
     if len(group.players) >= MAX_PLAYERS:
-        flash('Group is full', 'error')
-        if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-            return jsonify({'success': False, 'message': 'Group is full'})
-        return redirect(url_for('home'))
+        raise MutationRejected('Group is full')
     
-    # Add user to group
+    # Add user to group, unless someone else changed it in the meantime
+    claim_group(group)
     user.group = group
-    db.session.commit()
-    
-    court_name = group.court.name
-    message = f'You joined a {"court" if not group.is_in_queue else "queue"} group for {court_name}'
-    flash(message, 'success')
-    
-    if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-        return jsonify({
-            'success': True,
-            'court_id': group.court.id,
-            'group_id': group.id,
-            'message': message
-        })
-    
-    return redirect(url_for('home'))
+    user.joined_at = time.time()
+    message = f'You joined a {"court" if not group.is_in_queue else "queue"} group for {group.court.name}'
+    return message, {'court_id': group.court.id, 'group_id': group.id}, None
 
-@app.route('/create-new-group/<int:court_id>', methods=['POST'])
-def create_new_group(court_id):
-    if 'user' not in session:
-        flash('You must be logged in', 'error')
-        if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-            return jsonify({'success': False, 'message': 'You must be logged in'}), 401
-        return redirect(url_for('login'))
-    
-    username = session['user']
+def create_group(username, court_id):
     user = User.query.filter_by(username=username).first()
     court = Court.query.get(court_id)
-    
     if not court:
-        flash('Court not found', 'error')
-        if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-            return jsonify({'success': False, 'message': 'Court not found'})
-        return redirect(url_for('home'))
-    
+        raise MutationRejected('Court not found')
     if user.group:
-        flash('You are already in a group', 'error')
-        if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-            return jsonify({'success': False, 'message': 'You are already in a group'})
-        return redirect(url_for('home'))
+        raise MutationRejected('You are already in a group')
     
     # Create new group in queue
-    next_position = get_next_queue_position(court)
     new_group = Group(
         court=court,
         is_in_queue=True,
-        queue_position=next_position
+        queue_position=get_next_queue_position(court)
     )
-    
     db.session.add(new_group)
     db.session.flush()  # Flush to get the new group ID
-    
-    # Add user to the new group
     user.group = new_group
-    db.session.commit()
+    user.joined_at = new_group.created_at
     
+    venue_id, group_id = court.venue_id, new_group.id
     message = f'You created a new group in the queue for {court.name}'
-    flash(message, 'success')
-    
-    if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-        return jsonify({
-            'success': True,
-            'court_id': court.id,
-            'group_id': new_group.id,
-            'message': message
-        })
-    
-    return redirect(url_for('home'))
-@app.route('/leave-group', methods=['POST'])
-def leave_group():
-    if 'user' not in session:
-        flash('You must be logged in', 'error')
-        if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-            return jsonify({'success': False, 'message': 'You must be logged in'}), 401
-        return redirect(url_for('login'))
-    
-    username = session['user']
+    return message, {'court_id': court.id, 'group_id': group_id}, lambda: estimates_for(venue_id).group_queued(court_id, group_id)
+
+def leave_current_group(username):
     user = User.query.filter_by(username=username).first()
-    
     if not user.group:
-        flash('You are not in any group', 'error')
-        if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-            return jsonify({'success': False, 'message': 'You are not in any group'})
-        return redirect(url_for('home'))
+        raise MutationRejected('You are not in any group')
     
-    group = user.group
+    group = load_group_for_update(user.group_id)
     court = group.court
-    court_name = court.name
-    
-    # Check if group is on court and timer is running
-    timer_state = TimerState.query.first()
-    if not group.is_in_queue and timer_state.is_running:
-        flash('Cannot leave court while timer is running', 'error')
-        if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-            return jsonify({'success': False, 'message': 'Cannot leave court while timer is running'})
-        return redirect(url_for('home'))
+    was_in_queue = group.is_in_queue
+    # Check if group is on court and the court's timer is running
+    if not was_in_queue and court.timer and court.timer.is_running:
+        raise MutationRejected('Cannot leave court while timer is running')
     
-    # Remove user from group
+    claim_group(group)
     user.group = None
+    effect = None
     
-    # MODIFIED: We don't delete empty groups anymore, we keep them with empty slots
-    # We only want to reorder queue positions if it's an empty queue group at the END of the queue
-    if group.is_in_queue:
-        # Count players in the group
+    # Empty groups are kept with empty slots, except an empty queue group at
+    # the END of the queue, which is deleted
+    if was_in_queue:
         remaining_players = [p for p in group.players if p.id != user.id]
-        
-        # If this is an empty group AND it's the last group in the queue, delete it
         last_position = db.session.query(db.func.max(Group.queue_position)).filter(
             Group.court_id == court.id,
             Group.is_in_queue == True
@@ -432,41 +1050,138 @@ def leave_group():
         
         if not remaining_players and group.queue_position == last_position:
             db.session.delete(group)
+            venue_id, group_id = court.venue_id, group.id
+            effect = lambda: estimates_for(venue_id).group_removed(group_id)
+    
+    message = f'You left the {"court" if not was_in_queue else "queue"} group for {court.name}'
+    return message, {'court_id': court.id}, effect
+
+def commit_mutation(mutation, args, busy_message):
+    """Apply and commit one mutation, retrying on version conflicts.
+    Returns (success, message, data)."""
+    for attempt in range(GROUP_CAS_RETRIES):
+        try:
+            message, data, effect = mutation(*args)
+            db.session.commit()
+        except MutationRejected as rejected:
+            db.session.rollback()
+            return False, str(rejected), {}
+        except GroupVersionConflict:
+            backoff_after_conflict(attempt)
+            continue
+        if effect:
+            effect()
+        return True, message, data
+    return False, busy_message, {}
+
+def commit_mutation_batch(batch):
+    """CommitBatcher callback: apply every (mutation, args, busy_message) in
+    batch in order and commit once"""
+    with app.app_context():
+        outcomes = []
+        try:
+            for mutation, args, _ in batch:
+                try:
+                    outcomes.append(mutation(*args))
+                except MutationRejected as rejected:
+                    outcomes.append(rejected)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            results = []
+            for mutation, args, busy_message in batch:
+                try:
+                    results.append(commit_mutation(mutation, args, busy_message))
+                except Exception as error:
+                    db.session.rollback()
+                    results.append(error)
+            return results
+        
+        results = []
+        for outcome in outcomes:
+            if isinstance(outcome, MutationRejected):
+                results.append((False, str(outcome), {}))
+                continue
+            message, data, effect = outcome
+            if effect:
+                effect()
+            results.append((True, message, data))
+        return results
+
+from groupcommit import CommitBatcher
+GROUP_COMMIT_MS = float(os.getenv('GROUP_COMMIT_MS', 0))
+GROUP_COMMIT_MAX = int(os.getenv('GROUP_COMMIT_MAX', 50))  # mutations per batch
+commit_batcher = CommitBatcher(commit_mutation_batch, window=GROUP_COMMIT_MS / 1000, max_batch=GROUP_COMMIT_MAX) if GROUP_COMMIT_MS else None
+
+def run_mutation(mutation, *args, busy_message='That group is busy, please try again'):
+    if commit_batcher is not None:
+        return commit_batcher.submit((mutation, args, busy_message))
+    return commit_mutation(mutation, args, busy_message)
+
+def mutation_response(success, message, data, category='success'):
+    flash(message, category if success else 'error')
+    if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+        return jsonify({'success': success, **data, 'message': message})
+    return redirect(url_for('home'))
+
+@app.route('/join-slot/<int:group_id>', methods=['POST'])
+@idempotent
+@rate_limited('mutation')
+def join_slot(group_id):
+    if 'user' not in session:
+        flash('You must be logged in', 'error')
+        if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+            return jsonify({'success': False, 'message': 'You must be logged in'}), 401
+        return redirect(url_for('login'))
     
-    db.session.commit()
-    
-    message = f'You left the {"court" if not group.is_in_queue else "queue"} group for {court_name}'
-    flash(message, 'warning')
+    return mutation_response(*run_mutation(join_group, session['user'], group_id))
+
+@app.route('/create-new-group/<int:court_id>', methods=['POST'])
+@idempotent
+@rate_limited('mutation')
+def create_new_group(court_id):
+    if 'user' not in session:
+        flash('You must be logged in', 'error')
+        if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+            return jsonify({'success': False, 'message': 'You must be logged in'}), 401
+        return redirect(url_for('login'))
     
-    if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-        return jsonify({
-            'success': True,
-            'court_id': court.id,
-            'message': message
-        })
+    return mutation_response(*run_mutation(create_group, session['user'], court_id))
+
+@app.route('/leave-group', methods=['POST'])
+@idempotent
+@rate_limited('mutation')
+def leave_group():
+    if 'user' not in session:
+        flash('You must be logged in', 'error')
+        if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+            return jsonify({'success': False, 'message': 'You must be logged in'}), 401
+        return redirect(url_for('login'))
     
-    return redirect(url_for('home'))
+    success, message, data = run_mutation(leave_current_group, session['user'],
+                                           busy_message='Your group is busy, please try again')
+    return mutation_response(success, message, data, category='warning')
 
 @app.route('/admin')
 def admin():
     if 'user' not in session:
         return redirect(url_for('login'))
     
-    user = User.query.filter_by(username=session['user']).first()
-    if not user or not user.is_admin:
+    if not _is_admin():
         flash('You do not have permission to access the admin page', 'error')
         return redirect(url_for('home'))
     
     return render_template('admin.html', 
-                         courts=Court.query.all(),
-                         users=User.query.all())
+                         courts=venue_courts(current_venue_id()),
+                         users=User.query.all(),
+                         slow_queries=slow_queries,
+                         slow_queries_ms=SLOW_QUERY_MS,
+                         blocking_monitor=blocking_monitor)
 
 @app.route('/admin/<action>', methods=['POST'])
+@admin_required
 def admin_actions(action):
     """Consolidated admin actions endpoint"""
-    if not _is_admin():
-        return jsonify({'error': 'Unauthorized'}), 401
-    
     data = request.get_json() or {}
     
     if action == 'remove-player-from-group':
@@ -475,69 +1190,151 @@ def admin_actions(action):
         return _admin_move_player(data.get('player_id'), data.get('group_id'))
     elif action == 'create-group':
         return _admin_create_group(data.get('court_id'), data.get('is_queue', False))
+    elif action == 'balance-queues':
+        return _admin_balance_queues(bool(data.get('apply', False)))
+    elif action == 'set-auto-balance':
+        return _admin_set_auto_balance(bool(data.get('enabled', False)))
+    elif action == 'compact-queues':
+        return _admin_compact_queues(bool(data.get('across_courts', False)))
+    elif action == 'set-auto-compact':
+        return _admin_set_auto_compact(bool(data.get('enabled', False)), bool(data.get('across_courts', False)))
+    elif action == 'set-admin':
+        return _admin_set_admin(data.get('player_id'), bool(data.get('is_admin', False)))
+    elif action == 'start-profiler':
+        return _admin_start_profiler(data.get('seconds', 30), data.get('interval_ms', 5))
+    elif action == 'set-slow-query-log':
+        return _admin_set_slow_query_log(bool(data.get('enabled', False)), data.get('threshold_ms', SLOW_QUERY_MS))
+    elif action == 'set-blocking-monitor':
+        return _admin_set_blocking_monitor(bool(data.get('enabled', False)), data.get('threshold_ms', BLOCKING_MS))
     else:
         return jsonify({'success': False, 'message': 'Invalid action'}), 400
 
-def _is_admin():
-    """Helper to check admin status"""
-    if 'user' not in session:
-        return False
-    user = User.query.filter_by(username=session['user']).first()
-    return user and user.is_admin
-
 def _admin_remove_player(player_id):
     """Remove player from their group"""
     if not player_id:
         return jsonify({'success': False, 'message': 'Missing player_id'})
     
-    player = User.query.get(player_id)
-    if not player:
-        return jsonify({'success': False, 'message': 'Player not found'})
-    
-    player.group = None
-    db.session.commit()
-    return jsonify({'success': True, 'message': 'Player removed successfully'})
+    for attempt in range(GROUP_CAS_RETRIES):
+        player = User.query.get(player_id)
+        if not player:
+            return jsonify({'success': False, 'message': 'Player not found'})
+        
+        try:
+            if player.group_id:
+                claim_group(load_group_for_update(player.group_id))
+            player.group = None
+            db.session.commit()
+            return jsonify({'success': True, 'message': 'Player removed successfully'})
+        except GroupVersionConflict:
+            backoff_after_conflict(attempt)
+    return jsonify({'success': False, 'message': 'Group is busy, please try again'})
 
 def _admin_move_player(player_id, group_id):
     """Move player to a different group"""
     if not player_id or not group_id:
         return jsonify({'success': False, 'message': 'Missing required parameters'})
     
-    player = User.query.get(player_id)
-    group = Group.query.get(group_id)
-    
+    for attempt in range(GROUP_CAS_RETRIES):
+        player = User.query.get(player_id)
+        group = load_group_for_update(group_id)
+        
+        if not player:
+            return jsonify({'success': False, 'message': 'Player not found'})
+        if not group:
+            return jsonify({'success': False, 'message': 'Group not found'})
+        if len(group.players) >= MAX_PLAYERS:
+            return jsonify({'success': False, 'message': 'Group is full'})
+        
+        try:
+            # Both ends of the move change membership
+            claim_group(group)
+            old_group = load_group_for_update(player.group_id) if player.group_id else None
+            if old_group:
+                claim_group(old_group)
+            
+            # Clean up old empty group if needed
+            removed = None
+            if old_group and len(old_group.players) == 1 and old_group.is_in_queue:
+                db.session.delete(old_group)
+                removed = (old_group.court.venue_id, old_group.id)
+            
+            if not old_group:
+                player.joined_at = time.time()
+            player.group = group
+            db.session.commit()
+            # Only once it's committed, so a failed commit leaves the estimates alone
+            if removed:
+                venue_id, group_id = removed
+                estimates_for(venue_id).group_removed(group_id)
+            return jsonify({'success': True, 'message': 'Player moved successfully'})
+        except GroupVersionConflict:
+            backoff_after_conflict(attempt)
+    return jsonify({'success': False, 'message': 'Group is busy, please try again'})
+
+def _admin_set_admin(player_id, is_admin):
+    """Grant or revoke the admin role; the player's cached claims are dropped on commit"""
+    player = db.session.get(User, player_id) if player_id else None
     if not player:
         return jsonify({'success': False, 'message': 'Player not found'})
-    if not group:
-        return jsonify({'success': False, 'message': 'Group not found'})
-    if len(group.players) >= MAX_PLAYERS:
-        return jsonify({'success': False, 'message': 'Group is full'})
+    if player.username == session['user'] and not is_admin:
+        return jsonify({'success': False, 'message': 'You cannot remove your own admin role'})
     
-    # Clean up old empty group if needed
-    old_group = player.group
-    if old_group and len(old_group.players) == 1 and old_group.is_in_queue:
-        db.session.delete(old_group)
+    player.is_admin = is_admin
+    db.session.commit()
+    return jsonify({'success': True, 'message': f"{player.username} is {'now' if is_admin else 'no longer'} an admin"})
+
+def _admin_balance_queues(apply):
+    """Suggest, or apply, moves that even out queue lengths across courts"""
+    result = balance_queues(current_venue_id(), apply=apply)
+    if apply and result['moves'] and not result['applied']:
+        return jsonify({'success': False, 'message': 'Queues changed while balancing, please try again', **result})
     
-    player.group = group
+    if not result['moves']:
+        message = 'Queues are already balanced'
+    else:
+        message = f"{'Moved' if result['applied'] else 'Suggest moving'} {len(result['moves'])} group(s)"
+    return jsonify({'success': True, 'message': message, **result})
+
+def _admin_set_auto_balance(enabled):
+    """Opt in or out of applying balancing moves on every rotation"""
+    club_state = get_club_state(current_venue_id())
+    club_state.auto_balance = enabled
+    db.session.commit()
+    return jsonify({'success': True, 'auto_balance': enabled})
+
+def _admin_compact_queues(across_courts):
+    """Merge partial queue groups right now"""
+    venue_id = current_venue_id()
+    try:
+        result = compact_queues(venue_id, across_courts=across_courts)
+        db.session.commit()
+    except GroupVersionConflict:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': 'Queues changed while merging, please try again'})
+    
+    estimates_for(venue_id).rebuild()
+    message = f"Merged {result['merged']} and removed {result['dropped']} empty queue group(s)"
+    return jsonify({'success': True, 'message': message, **result})
+
+def _admin_set_auto_compact(enabled, across_courts):
+    """Opt in or out of merging partial queue groups on every rotation"""
+    club_state = get_club_state(current_venue_id())
+    club_state.auto_compact = enabled
+    club_state.compact_across_courts = across_courts
     db.session.commit()
-    return jsonify({'success': True, 'message': 'Player moved successfully'})
+    return jsonify({'success': True, 'auto_compact': enabled, 'compact_across_courts': across_courts})
+
 @app.route('/admin/remove-queue-group', methods=['POST'])
+@admin_required
 def admin_remove_queue_group():
     """Admin function to remove a queue group"""
-    if 'user' not in session:
-        return jsonify({'error': 'Unauthorized'}), 401
-    
-    current_user = User.query.filter_by(username=session['user']).first()
-    if not current_user or not current_user.is_admin:
-        return jsonify({'error': 'Unauthorized'}), 401
-    
     data = request.get_json()
     group_id = data.get('group_id')
     
     if not group_id:
         return jsonify({'success': False, 'message': 'Missing group_id'})
     
-    group = Group.query.get(group_id)
+    group = load_group_for_update(group_id)
     
     if not group:
         return jsonify({'success': False, 'message': 'Group not found'})
@@ -548,11 +1345,19 @@ def admin_remove_queue_group():
     court = group.court
     removed_position = group.queue_position
     
+    # Make sure nobody joins while we're emptying it
+    try:
+        claim_group(group)
+    except GroupVersionConflict:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': 'Group is busy, please try again'})
+    
     # Remove all players from the group first
     for player in group.players:
         player.group = None
     
     # Delete the group
+    removed_id = group.id
     db.session.delete(group)
     
     # Reorder remaining queue positions
@@ -567,6 +1372,7 @@ def admin_remove_queue_group():
         queue_group.queue_position -= 1
     
     db.session.commit()
+    estimates_for(court.venue_id).group_removed(removed_id)
     
     return jsonify({'success': True, 'message': 'Queue group removed successfully'})
 def _admin_create_group(court_id, is_queue):
@@ -586,6 +1392,8 @@ def _admin_create_group(court_id, is_queue):
     
     db.session.add(new_group)
     db.session.commit()
+    if is_queue:
+        estimates_for(court.venue_id).group_queued(court.id, new_group.id)
     
     return jsonify({
         'success': True,
@@ -593,167 +1401,355 @@ def _admin_create_group(court_id, is_queue):
         'group_id': new_group.id
     })
 
+def timer_summary(timers, now):
+    """(running, remaining) for clients that show one clock: the court
+    that rotates next, or the shortest paused round"""
+    running = [t for t in timers if t.is_running and t.end_time is not None]
+    if running:
+        return True, min(t.end_time for t in running) - now
+    return False, min((t.remaining_time or 0 for t in timers), default=0)
+
+def timers_changed(venue_id, timers):
+    estimates = estimates_for(venue_id)
+    for timer in timers:
+        estimates.timer_changed(timer)
+
 @app.route('/timer/start', methods=['POST'])
+@admin_required
 def start_timer():
-    if 'user' not in session:
-        return jsonify({'error': 'Unauthorized'}), 401
-    
-    user = User.query.filter_by(username=session['user']).first()
-    if not user or not user.is_admin:
-        return jsonify({'error': 'Unauthorized'}), 401
-    
-    timer_state = TimerState.query.first()
+    venue_id = current_venue_id()
+    stagger = get_timer_state(venue_id).stagger_seconds
+    timers = court_timers(venue_id)
     now = datetime.now().timestamp()
     
-    if not timer_state.is_running and timer_state.remaining_time > 0:
-        timer_state.end_time = now + timer_state.remaining_time
-    else:
-        timer_state.remaining_time = timer_state.duration
-        timer_state.end_time = now + timer_state.duration
-    
-    timer_state.start_time = now
-    timer_state.is_running = True
+    for index, timer in enumerate(timers):
+        start_court_timer(timer, now, offset=index * stagger)
     db.session.commit()
+    timers_changed(venue_id, timers)
+    scheduler_for(venue_id).ensure_running()
     
+    next_end = min((t.end_time for t in timers), default=now)
     return jsonify({
         'status': 'success',
-        'remaining': timer_state.remaining_time,
-        'end_time': timer_state.end_time
+        'remaining': next_end - now,
+        'end_time': next_end
     })
 
-@app.route('/timer/status')
-def get_timer_status():
-    timer_state = TimerState.query.first()
-    courts = Court.query.all()
-
-    if timer_state and timer_state.is_running and timer_state.start_time is not None:
-        now = datetime.now().timestamp()
-        elapsed = now - timer_state.start_time
-        remaining = max(0, timer_state.remaining_time - elapsed)
-
-        if remaining <= 0.1:
-            app.logger.info("⏰ Timer expired — rotating groups!")
-
-            # Mark timer as stopped
-            timer_state.is_running = False
-            timer_state.remaining_time = 0
-            timer_state.start_time = None
-            timer_state.end_time = None
-
-            # Process each court
-            for court in courts:
-                # Get active groups on court and queue groups
-                active_groups = [g for g in court.groups if not g.is_in_queue]
-                queue_groups = sorted(
-                    [g for g in court.groups if g.is_in_queue],
-                    key=lambda g: g.queue_position
-                )
-                
-                # Remove all groups from court
-                for group in active_groups:
-                    # If the group has no players, just delete it
-                    if not group.players:
-                        db.session.delete(group)
-                    else:
-                        # Otherwise mark as deleted - will be fully removed after commit
-                        db.session.delete(group)
-                
-                # Promote queue groups to court if available
-                for queue_group in queue_groups[:1]:  # Only promote first group
-                    queue_group.is_in_queue = False
-                    queue_group.queue_position = None
-                
-                # Reorder remaining queue
-                remaining_queue = queue_groups[1:] if queue_groups else []
-                for idx, group in enumerate(remaining_queue):
-                    group.queue_position = idx + 1
-                
-                # Ensure there's always an active group on the court
-                # Check if court now has any active groups
-                has_active_group = any(not g.is_in_queue for g in court.groups)
-                if not has_active_group:
-                    # Create a new empty active group
-                    new_active_group = Group(
-                        court=court,
-                        is_in_queue=False,
-                        queue_position=None
-                    )
-                    db.session.add(new_active_group)
-
-            db.session.commit()
-
-            return jsonify({
-                'running': False,
-                'remaining': 0,
-                'expired': True,
-                'courts': [court.to_dict() for court in courts]
+def hour_overlaps(start, end):
+    """[(hour, seconds of start..end within it)] for each clock hour it touches"""
+    overlaps = []
+    hour = int(start // 3600) * 3600
+    while hour < end:
+        overlaps.append((hour, min(end, hour + 3600) - max(start, hour)))
+        hour += 3600
+    return overlaps
+
+def record_games(venue_id, court, groups, now):
+    """Append the finished games of groups on court to PlayHistory and fold
+    them into the rollups, in the caller's transaction"""
+    # Play can't have started before this round did
+    round_start = now - (court.timer.duration if court.timer else 0)
+    rows = []
+    for group in groups:
+        on_court_since = group.started_at or group.created_at or round_start
+        started = min(now, max(on_court_since, round_start))
+        for player in group.players:
+            # From joining the group, or its forming for players who joined
+            # before joined_at was recorded
+            joined = player.joined_at or group.created_at
+            rows.append({
+                'venue_id': venue_id,
+                'court_id': court.id,
+                'user_id': player.id,
+                'started_at': started,
+                'ended_at': now,
+                'wait_seconds': max(0, on_court_since - joined) if joined else 0
             })
+    if not rows:
+        return 0
+    db.session.execute(db.insert(PlayHistory), rows)
+    
+    # Players: create missing rollup rows, then add this game to every one
+    user_ids = [row['user_id'] for row in rows]
+    existing = set(db.session.scalars(
+        db.select(PlayerStats.user_id).where(PlayerStats.venue_id == venue_id, PlayerStats.user_id.in_(user_ids))
+    ))
+    missing = [user_id for user_id in user_ids if user_id not in existing]
+    if missing:
+        db.session.execute(db.insert(PlayerStats), [{'venue_id': venue_id, 'user_id': user_id} for user_id in missing])
+    stats = PlayerStats.__table__.c
+    db.session.execute(
+        PlayerStats.__table__.update()
+        .where(stats.venue_id == venue_id, stats.user_id == db.bindparam('b_user_id'))
+        .values(games=stats.games + 1,
+                play_seconds=stats.play_seconds + db.bindparam('b_played'),
+                wait_seconds=stats.wait_seconds + db.bindparam('b_waited'),
+                last_played=now),
+        [{'b_user_id': row['user_id'], 'b_played': now - row['started_at'], 'b_waited': row['wait_seconds']}
+         for row in rows]
+    )
+    
+    # The court: it was busy from the earliest start, split by clock hour
+    busy = hour_overlaps(min(row['started_at'] for row in rows), now) or [(int(now // 3600) * 3600, 0)]
+    games = sum(1 for group in groups if group.players)
+    hours = [hour for hour, _ in busy]
+    existing = set(db.session.scalars(
+        db.select(CourtHourStats.hour).where(CourtHourStats.court_id == court.id, CourtHourStats.hour.in_(hours))
+    ))
+    missing = [hour for hour in hours if hour not in existing]
+    if missing:
+        db.session.execute(db.insert(CourtHourStats), [
+            {'venue_id': venue_id, 'court_id': court.id, 'hour': hour} for hour in missing
+        ])
+    stats = CourtHourStats.__table__.c
+    db.session.execute(
+        CourtHourStats.__table__.update()
+        .where(stats.court_id == court.id, stats.hour == db.bindparam('b_hour'))
+        .values(games=stats.games + db.bindparam('b_games'),
+                busy_seconds=stats.busy_seconds + db.bindparam('b_seconds')),
+        [{'b_hour': hour, 'b_games': games if hour == hours[-1] else 0, 'b_seconds': seconds}
+         for hour, seconds in busy]
+    )
+    return len(rows)
+
+def rotate_court(court_id):
+    """End one court's round: promote the head of its queue.
+    
+    Both the venue's RotationScheduler and /timer/status pollers (in any
+    worker) may get here for the same round, so the rotation is claimed with
+    a conditional UPDATE on the court's timer first. Returns False if
+    someone else already rotated, or the round isn't over.
+    """
+    venue_id = db.session.scalar(db.select(Court.venue_id).where(Court.id == court_id))
+    club_state = get_club_state(venue_id)
+    settings = get_timer_state(venue_id)
+    
+    # Fill up partial queue groups before the head gets promoted
+    compacted = False
+    if club_state.auto_compact:
+        try:
+            compaction = compact_queues(venue_id, across_courts=club_state.compact_across_courts)
+            compacted = compaction['merged'] or compaction['dropped']
+        except GroupVersionConflict:
+            # Someone joined or left mid-compaction; rotate without it
+            db.session.rollback()
+    
+    # Stop the timer (or roll it into the next round), unless another
+    # rotation beat us to it
+    now = datetime.now().timestamp()
+    if settings.auto_restart:
+        # Timers left at zero length by older versions stop instead
+        restart = CourtTimer.duration > 0
+        next_round = dict(is_running=restart, remaining_time=CourtTimer.duration,
+                          start_time=db.case((restart, now), else_=None),
+                          end_time=db.case((restart, now + CourtTimer.duration), else_=None))
+    else:
+        next_round = dict(is_running=False, remaining_time=0, start_time=None, end_time=None)
+    claimed = db.session.execute(
+        CourtTimer.__table__.update()
+        .where(CourtTimer.court_id == court_id,
+               CourtTimer.is_running == True,
+               CourtTimer.end_time <= now + 0.1)
+        .values(**next_round)
+    ).rowcount == 1
+    if not claimed:
+        db.session.rollback()
+        return False
+    
+    court = db.session.get(Court, court_id)
+    app.logger.info(f"⏰ Timer expired — rotating {court.name} at venue {venue_id}!")
+    if compacted:
+        app.logger.info(f"🧩 Merged {compaction['merged']} and dropped {compaction['dropped']} queue group(s)")
+    
+    # Get active groups on court and queue groups
+    active_groups = [g for g in court.groups if not g.is_in_queue]
+    queue_groups = sorted(
+        [g for g in court.groups if g.is_in_queue],
+        key=lambda g: g.queue_position
+    )
+    
+    # Keep a record of the games that just finished, then remove all
+    # groups from court
+    record_games(venue_id, court, active_groups, now)
+    for group in active_groups:
+        db.session.delete(group)
+    
+    # Promote the first queue group to court if there is one, otherwise
+    # make sure there's still an (empty) active group to join
+    if queue_groups:
+        queue_groups[0].is_in_queue = False
+        queue_groups[0].queue_position = None
+        queue_groups[0].started_at = now
+    else:
+        db.session.add(Group(court=court, is_in_queue=False, queue_position=None, started_at=now))
+    
+    # Reorder remaining queue
+    for idx, group in enumerate(queue_groups[1:]):
+        group.queue_position = idx + 1
+    
+    db.session.commit()
+    estimates = estimates_for(venue_id)
+    if compacted:
+        estimates.rebuild()
+    else:
+        estimates.rotated(court.timer)
+    
+    balance = balance_queues(venue_id, apply=club_state.auto_balance)
+    if balance['moves']:
+        app.logger.info(f"⚖️ Queue balancing {'applied' if balance['applied'] else 'suggests'} "
+                        f"{len(balance['moves'])} move(s), expected wait "
+                        f"{balance['expected_wait_before'] / 60:.1f} -> {balance['expected_wait_after'] / 60:.1f} min")
+    return True
+
+def running_court_timers(venue_id, now, db_session=None):
+    """[(court_id, end_time)] of the venue's running court timers"""
+    db_session = db_session or db.session
+    return db_session.execute(
+        db.select(CourtTimer.court_id, CourtTimer.end_time)
+        .join(Court)
+        .where(Court.venue_id == venue_id, CourtTimer.is_running == True, CourtTimer.end_time != None)
+    ).all()
+
+class RotationScheduler:
+    """Rotates a venue's courts the moment each one's round ends.
+    
+    A greenlet sleeps until the earliest running court timer ends, rotates
+    every court that's due in its own transaction (so staggered courts
+    rotate, and clients refresh, one at a time), and rechecks every recheck
+    seconds in case a timer was stopped or restarted. It exits once no
+    timer is running. Started by the timer routes; pollers of /timer/status
+    still rotate lazily if no scheduler is running (say, after a restart),
+    and rotate_court() makes sure only one of them wins.
+    """
+    
+    def __init__(self, venue_id, recheck=5):
+        self.venue_id = venue_id
+        self.recheck = recheck
+        self.greenlet = None
+    
+    def ensure_running(self):
+        if self.greenlet is None:
+            self.greenlet = gevent.spawn(self.run)
+    
+    def run(self):
+        try:
+            while True:
+                with app.app_context():
+                    now = datetime.now().timestamp()
+                    timers = running_court_timers(self.venue_id, now)
+                    if not timers:
+                        return
+                    due = [court_id for court_id, end_time in timers if end_time - now <= 0.1]
+                    for court_id in due:
+                        rotate_court(court_id)
+                    # Going straight round again is safe: rotate_court() never
+                    # starts a zero-length round, so the courts just rotated
+                    # are no longer due
+                    wait = 0 if due else min(end_time for _, end_time in timers) - now
+                sleep(min(wait, self.recheck))
+        except Exception:
+            app.logger.exception(f"Rotation scheduler for venue {self.venue_id} failed")
+        finally:
+            self.greenlet = None
+
+rotation_schedulers = {}  # venue_id -> RotationScheduler
+
+def scheduler_for(venue_id):
+    if venue_id not in rotation_schedulers:
+        rotation_schedulers[venue_id] = RotationScheduler(venue_id)
+    return rotation_schedulers[venue_id]
 
-        return jsonify({
-            'running': True,
-            'remaining': int(remaining),
-            'expired': False,
-            'courts': [court.to_dict() for court in courts]
-        })
-
-    # When timer not running, always reset to default time!
-    if timer_state and not timer_state.is_running and timer_state.remaining_time == 0:
-        DEFAULT_DURATION = 900  # 15 min
-        timer_state.remaining_time = DEFAULT_DURATION
-        db.session.commit()
+@app.route('/timer/status')
+@rate_limited('poll')
+def get_timer_status():
+    venue_id = current_venue_id()
+    now = datetime.now().timestamp()
+    
+    timers = running_court_timers(venue_id, now)
+    if timers:
+        scheduler_for(venue_id).ensure_running()
+    for court_id, end_time in timers:
+        if end_time - now <= 0.1:
+            rotate_court(court_id)
+    
+    status = timer_status(venue_id, now)
+    return poll_response('timer', timer_etag(status), lambda: (json.dumps(status).encode(), 'application/json'))
+
+def timer_status(venue_id, now, db_session=None):
+    """The /timer/status payload, once any due court has been rotated"""
+    db_session = db_session or db.session
+    
+    # A stopped timer at zero means that court's round just ended (here or
+    # in the scheduler); report that once, then reset it for the next round
+    timers = court_timers(venue_id, db_session)
+    expired = [t for t in timers if not t.is_running and t.remaining_time == 0 and t.duration > 0]
+    for timer in expired:
+        timer.remaining_time = timer.duration
+    if expired:
+        db_session.commit()
+        timers_changed(venue_id, expired)
+    
+    running, remaining = timer_summary(timers, now)
+    courts = db_session.scalars(
+        db.select(Court).where(Court.venue_id == venue_id).order_by(Court.id)
+        .options(db.selectinload(Court.groups).selectinload(Group.players))
+    )
+    return {
+        'running': running,
+        'remaining': int(remaining) if running or not expired else 0,
+        'expired': bool(expired),
+        'courts': [court.to_dict() for court in courts],
+        'timers': {t.court_id: {
+            'running': t.is_running,
+            'remaining': int(timer_remaining(t, now)),
+            'duration': t.duration,
+            'end_time': t.end_time
+        } for t in timers}
+    }
 
-    return jsonify({
-        'running': False,
-        'remaining': int(timer_state.remaining_time) if timer_state else 0,
-        'expired': False,
-        'courts': [court.to_dict() for court in courts]
-    })
+def timer_etag(status):
+    """ETag of a timer_status() payload. Running timers are identified by
+    when they end rather than by what's left, so the tag only changes when a
+    timer starts, stops, ends or changes, or the courts do, not every second
+    of the countdown (which clients run themselves between polls)."""
+    timers = sorted(
+        (court_id, t['running'], t['end_time'], t['duration'], None if t['running'] else t['remaining'])
+        for court_id, t in status['timers'].items()
+    )
+    key = [status['running'], status['expired'], timers, snapshot_hash(status['courts'])]
+    return hashlib.md5(json.dumps(key).encode()).hexdigest()
 
 
 @app.route('/timer/reset', methods=['POST'])
+@admin_required
 def reset_timer():
-    username = session.get('user')
-    if not username:
-        return jsonify({'error': 'Unauthorized'}), 401
-    
-    user = User.query.filter_by(username=username).first()
-    if not user or not user.is_admin:
-        return jsonify({'error': 'Unauthorized'}), 401
-    
-    timer_state = TimerState.query.first()
-    timer_state.end_time = None
-    timer_state.start_time = None
-    timer_state.is_running = False
-    timer_state.remaining_time = timer_state.duration
+    venue_id = current_venue_id()
+    timers = court_timers(venue_id)
+    for timer in timers:
+        reset_court_timer(timer)
     db.session.commit()
+    timers_changed(venue_id, timers)
     
     return jsonify({'status': 'success'})
 
 @app.route('/timer/set-duration', methods=['POST'])
+@admin_required
 def set_timer_duration():
-    username = session.get('user')
-    if not username:
-        return jsonify({'error': 'Unauthorized'}), 401
-    
-    user = User.query.filter_by(username=username).first()
-    if not user or not user.is_admin:
-        return jsonify({'error': 'Unauthorized'}), 401
-    
     try:
         data = request.get_json()
         minutes = float(data.get('minutes', 15))
         
-        if not 0 <= minutes <= 60:
-            return jsonify({'error': 'Duration must be between 0 and 60 minutes'}), 400
-        
         seconds = round(minutes * 60)
-        timer_state = TimerState.query.first()
-        timer_state.duration = seconds
-        timer_state.remaining_time = seconds
-        timer_state.is_running = False
-        timer_state.end_time = None
-        timer_state.start_time = None
+        if not MIN_ROUND_SECONDS <= seconds <= 3600:
+            return jsonify({'error': f'Duration must be between {MIN_ROUND_SECONDS / 60:g} and 60 minutes'}), 400
+        
+        venue_id = current_venue_id()
+        get_timer_state(venue_id).duration = seconds
+        timers = court_timers(venue_id)
+        for timer in timers:
+            reset_court_timer(timer, duration=seconds)
         db.session.commit()
+        timers_changed(venue_id, timers)
         
         return jsonify({
             'status': 'success',
@@ -765,51 +1761,98 @@ def set_timer_duration():
         return jsonify({'error': 'Invalid duration format'}), 400
 
 @app.route('/timer/stop', methods=['POST'])
+@admin_required
 def stop_timer():
-    if 'user' not in session:
-        return jsonify({'error': 'Unauthorized'}), 401
+    venue_id = current_venue_id()
+    timers = court_timers(venue_id)
+    now = datetime.now().timestamp()
+    for timer in timers:
+        stop_court_timer(timer, now)
+    db.session.commit()
+    timers_changed(venue_id, timers)
     
-    user = User.query.filter_by(username=session['user']).first()
-    if not user or not user.is_admin:
-        return jsonify({'error': 'Unauthorized'}), 401
+    return jsonify({
+        'status': 'success',
+        'remaining': timer_summary(timers, now)[1]
+    })
+
+@app.route('/timer/set-schedule', methods=['POST'])
+@admin_required
+def set_timer_schedule():
+    """Venue-wide stagger between courts and whether rounds run back to back"""
+    data = request.get_json() or {}
+    try:
+        stagger = int(data.get('stagger_seconds', 0))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid stagger format'}), 400
+    if not 0 <= stagger <= 3600:
+        return jsonify({'error': 'Stagger must be between 0 and 3600 seconds'}), 400
+    
+    settings = get_timer_state(current_venue_id())
+    settings.stagger_seconds = stagger
+    settings.auto_restart = bool(data.get('auto_restart', False))
+    db.session.commit()
+    return jsonify({
+        'status': 'success',
+        'stagger_seconds': settings.stagger_seconds,
+        'auto_restart': settings.auto_restart
+    })
+
+@app.route('/timer/court/<int:court_id>/<action>', methods=['POST'])
+@admin_required
+def court_timer_action(court_id, action):
+    """Start, stop, reset or set the duration of one court's timer"""
+    timer = CourtTimer.query.filter_by(court_id=court_id).first()
+    if not timer:
+        return jsonify({'error': 'Court not found'}), 404
     
-    timer_state = TimerState.query.first()
-    if timer_state.is_running:
-        now = datetime.now().timestamp()
-        elapsed = now - timer_state.start_time
-        timer_state.remaining_time = max(0, timer_state.remaining_time - elapsed)
-        timer_state.is_running = False
-        timer_state.start_time = None
-        timer_state.end_time = None
-        db.session.commit()
+    now = datetime.now().timestamp()
+    if action == 'start':
+        start_court_timer(timer, now)
+    elif action == 'stop':
+        stop_court_timer(timer, now)
+    elif action == 'reset':
+        reset_court_timer(timer)
+    elif action == 'set-duration':
+        try:
+            minutes = float((request.get_json() or {}).get('minutes', 15))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'Invalid duration format'}), 400
+        seconds = round(minutes * 60)
+        if not MIN_ROUND_SECONDS <= seconds <= 3600:
+            return jsonify({'error': f'Duration must be between {MIN_ROUND_SECONDS / 60:g} and 60 minutes'}), 400
+        reset_court_timer(timer, duration=seconds)
+    else:
+        return jsonify({'error': 'Invalid action'}), 400
+    
+    db.session.commit()
+    venue_id = timer.court.venue_id
+    estimates_for(venue_id).timer_changed(timer)
+    if timer.is_running:
+        scheduler_for(venue_id).ensure_running()
     
     return jsonify({
         'status': 'success',
-        'remaining': timer_state.remaining_time
+        'running': timer.is_running,
+        'remaining': timer_remaining(timer, now),
+        'duration': timer.duration,
+        'end_time': timer.end_time
     })
 @app.route('/clear-courts', methods=['POST'])
+@admin_required
 def clear_courts():
-    username = session.get('user')
-    if not username:
-        return jsonify({'error': 'Unauthorized'}), 401
-    
-    user = User.query.filter_by(username=username).first()
-    if not user or not user.is_admin:
-        return jsonify({'error': 'Unauthorized'}), 401
-
-    # Clear all groups from all courts
-    users = User.query.all()
-    for user in users:
-        user.group = None
-    
-    groups = Group.query.all()
+    # Clear all groups from this venue's courts
+    venue_id = current_venue_id()
+    courts = venue_courts(venue_id)
+    groups = Group.query.filter(Group.court_id.in_([court.id for court in courts])).all()
     for group in groups:
+        for player in group.players:
+            player.group = None
         db.session.delete(group)
     
     db.session.commit()
     
     # Create one empty active group per court
-    courts = Court.query.all()
     for court in courts:
         active_group = Group(
             court=court,
@@ -819,10 +1862,15 @@ def clear_courts():
         db.session.add(active_group)
     
     db.session.commit()
+    estimates_for(venue_id).rebuild()
     return jsonify({'status': 'success', 'message': 'All courts cleared'})
 
 @app.route('/create-empty-active-group/<int:court_id>', methods=['POST'])
 def create_empty_active_group(court_id):
+    # Any member's page may ask for this when it shows an empty court
+    if current_claims() is None:
+        return jsonify({'success': False, 'message': 'You must be logged in'}), 401
+    
     court = Court.query.get(court_id)
     if not court:
         return jsonify({'success': False, 'message': 'Court not found'})
@@ -851,16 +1899,9 @@ def create_empty_active_group(court_id):
         'message': 'Created new active group'
     })
 @app.route('/toggle-club-status', methods=['POST'])
+@admin_required
 def toggle_club_status():
-    username = session.get('user')
-    if not username:
-        return jsonify({'error': 'Unauthorized'}), 401
-    
-    user = User.query.filter_by(username=username).first()
-    if not user or not user.is_admin:
-        return jsonify({'error': 'Unauthorized'}), 401
-    
-    club_state = ClubState.query.first()
+    club_state = get_club_state(current_venue_id())
     club_state.is_active = not club_state.is_active
     club_state.last_modified = datetime.utcnow()
     db.session.commit()
@@ -870,6 +1911,85 @@ def toggle_club_status():
         'is_active': club_state.is_active
     })
 
+@app.route('/admin/pool-stats')
+@admin_required
+def admin_pool_stats():
+    """Connection pool metrics for the primary and (if configured) the read replica"""
+    return jsonify({name: metrics.snapshot() for name, metrics in pool_metrics.items()})
+
+# Profiling, all off until an admin turns it on: a sampling profiler whose
+# collapsed stacks can be downloaded and fed to flamegraph.pl or speedscope,
+# a log of slow SQL with the app line that ran it, and gevent's hub blocking
+# monitor. See profiling.py.
+from profiling import SamplingProfiler, SlowQueryLog, BlockingMonitor
+SLOW_QUERY_MS = int(os.getenv('SLOW_QUERY_MS', 100))
+BLOCKING_MS = int(os.getenv('BLOCKING_MS', 100))
+MAX_PROFILE_SECONDS = 300
+
+profiler = SamplingProfiler()
+with app.app_context():
+    slow_queries = SlowQueryLog(list(db.engines.values()), root=os.path.dirname(os.path.abspath(__file__)))
+blocking_monitor = BlockingMonitor()
+
+def _admin_start_profiler(seconds, interval_ms):
+    try:
+        seconds, interval_ms = float(seconds), float(interval_ms)
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'seconds and interval_ms must be numbers'}), 400
+    if not 1 <= seconds <= MAX_PROFILE_SECONDS or not 1 <= interval_ms <= 1000:
+        return jsonify({'success': False,
+                        'message': f'seconds must be 1-{MAX_PROFILE_SECONDS} and interval_ms 1-1000'}), 400
+    if not profiler.start(seconds, interval_ms / 1000):
+        return jsonify({'success': False, 'message': 'The profiler is already running'}), 409
+    app.logger.info(f"🔬 Sampling profiler started for {seconds:.0f}s by {session['user']}")
+    return jsonify({'success': True, **profiler.status()})
+
+def _admin_set_slow_query_log(enabled, threshold_ms):
+    try:
+        threshold_ms = float(threshold_ms)
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'threshold_ms must be a number'}), 400
+    if enabled:
+        slow_queries.enable(threshold_ms / 1000)
+    else:
+        slow_queries.disable()
+    return jsonify({'success': True, 'enabled': slow_queries.enabled, 'threshold_ms': threshold_ms})
+
+def _admin_set_blocking_monitor(enabled, threshold_ms):
+    try:
+        threshold_ms = float(threshold_ms)
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'threshold_ms must be a number'}), 400
+    if enabled:
+        blocking_monitor.enable(threshold_ms / 1000)
+    else:
+        blocking_monitor.disable()
+    return jsonify({'success': True, 'enabled': blocking_monitor.enabled, 'threshold_ms': threshold_ms})
+
+@app.route('/admin/profiling')
+@admin_required
+def admin_profiling():
+    """State of the profiler, the slow query log and the blocking monitor"""
+    return jsonify({
+        'profiler': profiler.status(),
+        'slow_queries': slow_queries.status(),
+        'blocking': blocking_monitor.status()
+    })
+
+@app.route('/admin/profiling/profile')
+@admin_required
+def admin_download_profile():
+    """The last finished profiler run, as collapsed stacks"""
+    if profiler.running:
+        return jsonify({'success': False, 'message': 'The profiler is still running'}), 409
+    if profiler.counts is None:
+        return jsonify({'success': False, 'message': 'No profile yet, start the profiler first'}), 404
+    
+    started = datetime.fromtimestamp(profiler.started_at).strftime('%Y%m%d-%H%M%S')
+    response = Response(profiler.collapsed(), mimetype='text/plain')
+    response.headers['Content-Disposition'] = f'attachment; filename=profile-{started}.collapsed'
+    return response
+
 @app.route('/technical-notes')
 def technical_notes():
     return render_template('technical_notes.html')
@@ -879,70 +1999,98 @@ def faq():
     return render_template('faq.html')
     
 @app.route('/club-status')
+@reads_from_replica
 def get_club_status():
-    club_state = ClubState.query.first()
+    club_state = get_club_state(current_venue_id())
     return jsonify({
         'is_active': club_state.is_active,
         'last_modified': club_state.last_modified.timestamp()
     })
 
-import hashlib
+STATS_MAX_HOURS = 24 * 7
 
-@app.route('/court-updates')
-def court_updates():
-    def generate():
-        last_hash = None
-        while True:
-            with app.app_context():
-                courts = Court.query.all()
-                
-                court_data = {}
-                for court in courts:
-                    # Get active groups on court
-                    active_groups = [g for g in court.groups if not g.is_in_queue]
-                    active_group_data = [{
-                        'id': g.id,
-                        'players': [p.username for p in g.players],
-                        'is_full': len(g.players) >= MAX_PLAYERS
-                    } for g in active_groups]
-                    
-                    # Get queue groups
-                    queue_groups = sorted(
-                        [g for g in court.groups if g.is_in_queue],
-                        key=lambda g: g.queue_position
-                    )
-                    queue_group_data = [{
-                        'id': g.id,
-                        'position': g.queue_position,
-                        'players': [p.username for p in g.players],
-                        'is_full': len(g.players) >= MAX_PLAYERS
-                    } for g in queue_groups]
-                    
-                    court_data[court.name] = {
-                        'id': court.id,
-                        'active_groups': active_group_data,
-                        'queue_groups': queue_group_data
-                    }
-                
-                # Calculate a hash of the data to see if it has changed
-                court_json = json.dumps({'courts': court_data})
-                current_hash = hashlib.md5(court_json.encode()).hexdigest()
-                
-                # Only send an update if the data has changed
-                if current_hash != last_hash:
-                    last_hash = current_hash
-                    data = f"data: {court_json}\n\n"
-                    yield data
-                    
-            sleep(1)
+@app.route('/stats')
+@rate_limited('poll')
+@reads_from_replica
+def get_stats():
+    """Play statistics for the venue, read from the rollups only"""
+    venue_id = current_venue_id()
+    try:
+        hours = min(int(request.args.get('hours', 24)), STATS_MAX_HOURS)
+        limit = min(int(request.args.get('limit', 50)), 500)
+    except ValueError:
+        return jsonify({'success': False, 'message': 'hours and limit must be whole numbers'}), 400
+    
+    players = db.session.execute(
+        db.select(User.username, PlayerStats.games, PlayerStats.play_seconds,
+                  PlayerStats.wait_seconds, PlayerStats.last_played)
+        .join(User, User.id == PlayerStats.user_id)
+        .where(PlayerStats.venue_id == venue_id)
+        .order_by(PlayerStats.games.desc(), User.username)
+        .limit(limit)
+    ).all()
+    totals = db.session.execute(
+        db.select(db.func.sum(PlayerStats.games), db.func.sum(PlayerStats.wait_seconds))
+        .where(PlayerStats.venue_id == venue_id)
+    ).one()
+    
+    since = int(datetime.now().timestamp() // 3600) * 3600 - (hours - 1) * 3600
+    court_names = dict(db.session.execute(
+        db.select(Court.id, Court.name).where(Court.venue_id == venue_id).order_by(Court.id)
+    ).all())
+    utilisation = {court_id: [] for court_id in court_names}
+    for court_id, hour, games, busy_seconds in db.session.execute(
+        db.select(CourtHourStats.court_id, CourtHourStats.hour, CourtHourStats.games, CourtHourStats.busy_seconds)
+        .where(CourtHourStats.venue_id == venue_id, CourtHourStats.hour >= since)
+        .order_by(CourtHourStats.court_id, CourtHourStats.hour)
+    ):
+        utilisation.setdefault(court_id, []).append({
+            'hour': datetime.fromtimestamp(hour).isoformat(timespec='minutes'),
+            'games': games,
+            'utilisation': round(min(busy_seconds / 3600, 1), 3)
+        })
     
-    return Response(generate(), mimetype='text/event-stream')
+    player_games, total_wait = totals
+    return jsonify({
+        'player_games': player_games or 0,
+        'average_wait_seconds': round(total_wait / player_games) if player_games else None,
+        'players': [{
+            'username': username,
+            'games': games,
+            'average_wait_seconds': round(wait_seconds / games) if games else None,
+            'play_minutes': round(play_seconds / 60),
+            'last_played': last_played
+        } for username, games, play_seconds, wait_seconds, last_played in players],
+        'courts': [{
+            'id': court_id,
+            'name': court_names.get(court_id),
+            'hours': court_hours
+        } for court_id, court_hours in utilisation.items()]
+    })
 
-# Also update the poll endpoint for consistency
-@app.route('/court-updates-poll')
-def court_updates_poll():
-    """Fallback endpoint for environments where SSE doesn't work"""
-    courts = Court.query.all()
+import hashlib
+import gzip
+
+try:
+    import msgpack  # optional: enables application/msgpack on the poll endpoint
+except ImportError:
+    msgpack = None
+
+try:
+    import brotli  # optional: enables Content-Encoding: br on the poll endpoint
+except ImportError:
+    brotli = None
+
+def build_court_snapshot(venue_id, db_session=None):
+    """Active and queued groups for every court at a venue, keyed by court name"""
+    db_session = db_session or db.session
+    # Three indexed queries whatever the venue's size: courts, their groups, the players
+    courts = db_session.scalars(
+        db.select(Court).where(Court.venue_id == venue_id).order_by(Court.id)
+        .options(db.selectinload(Court.groups).selectinload(Group.players))
+    ).all()
+    estimates = estimates_for(venue_id)
+    estimates.ensure_fresh([g.id for court in courts for g in court.groups if g.is_in_queue], db_session)
     
     court_data = {}
     for court in courts:
@@ -965,80 +2113,614 @@ def court_updates_poll():
             'players': [p.username for p in g.players],
             'is_full': len(g.players) >= MAX_PLAYERS
         } for g in queue_groups]
+        for group in queue_group_data:
+            group['starts_at'], group['starts_in'] = estimates.estimate(group['id'])
         
         court_data[court.name] = {
             'id': court.id,
             'active_groups': active_group_data,
             'queue_groups': queue_group_data
         }
+    return court_data
+
+# Compact live format (?format=compact). Courts become positional arrays and
+# players become indexes into a username table:
+#   {'b': base, 'n': [new usernames], 'c': [[name, id, active, queue], ...]}
+#   active = [[group_id, [player idx, ...]], ...]
+#   queue  = [[group_id, position, [player idx, ...], starts_at, starts_in], ...]
+# The table belongs to one connection: names the client already has aren't
+# resent, and 'b' says where 'n' starts so the client can resync after a
+# reconnect. is_full is left for the client to derive from MAX_PLAYERS.
+def encode_compact(court_data, names):
+    """Encode a snapshot against the username table names (updated in place)"""
+    base = len(names)
+    new_names = []
+    
+    def intern(username):
+        index = names.get(username)
+        if index is None:
+            index = names[username] = len(names)
+            new_names.append(username)
+        return index
+    
+    courts = [[
+        court_name,
+        court['id'],
+        [[g['id'], [intern(p) for p in g['players']]] for g in court['active_groups']],
+        [[g['id'], g['position'], [intern(p) for p in g['players']], g['starts_at'], g['starts_in']]
+         for g in court['queue_groups']]
+    ] for court_name, court in court_data.items()]
+    
+    return {'b': base, 'n': new_names, 'c': courts}
+
+def wants_compact():
+    return request.args.get('format') == 'compact'
+
+def compress_body(body, accepted, min_size=512):
+    """(body, Content-Encoding or None), gzip/brotli-compressed if accepted allows"""
+    if len(body) >= min_size:
+        if brotli and 'br' in accepted:
+            return brotli.compress(body, quality=5), 'br'
+        elif 'gzip' in accepted:
+            return gzip.compress(body, compresslevel=6), 'gzip'
+    return body, None
+
+def compressed_response(body, mimetype, min_size=512):
+    """Build a response, gzip/brotli-compressing body if the client accepts it"""
+    body, encoding = compress_body(body, request.headers.get('Accept-Encoding', ''), min_size)
+    response = Response(body, mimetype=mimetype)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept, Accept-Encoding'
+    return response
+
+# Poll pacing. Poll responses carry a weak ETag of the data they were built
+# from, so a client sending it back in If-None-Match gets a bodyless 304
+# while nothing changed. They also say in X-Poll-Interval how many seconds
+# to wait before polling again (static/transport.js follows it): longer for
+# tabs that report X-Page-Visibility: hidden, and longer still while the
+# connection pool is busy, background tabs first.
+POLL_INTERVALS = {'poll': 2, 'timer': 1}  # seconds, for a visible tab
+HIDDEN_POLL_INTERVAL = 30
+BUSY_POOL_LOAD = 0.75  # share of pool connections in use counted as busy
+
+def poll_interval(kind, hidden, load):
+    interval = HIDDEN_POLL_INTERVAL if hidden else POLL_INTERVALS[kind]
+    if load >= BUSY_POOL_LOAD:
+        interval *= 4 if hidden else 2
+    return interval
+
+def snapshot_hash(court_data):
+    return hashlib.md5(json.dumps({'courts': court_data}).encode()).hexdigest()
+
+def poll_response(kind, etag, encode):
+    """A 304 if the client already has etag, else the compressed body from
+    encode() -> (body, mimetype); either way with ETag and X-Poll-Interval"""
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        response = compressed_response(*encode())
+    # X-Poll-Interval depends on X-Page-Visibility
+    response.headers['Vary'] = 'Accept, Accept-Encoding, X-Page-Visibility'
+    response.set_etag(etag, weak=True)
+    hidden = request.headers.get('X-Page-Visibility') == 'hidden'
+    load = max(pool_load(engine) for engine in db.engines.values())
+    response.headers['X-Poll-Interval'] = str(poll_interval(kind, hidden, load))
+    return response
+
+class SnapshotChannel:
+    """Fans one venue's court snapshots out to all of its SSE connections.
+    
+    A single runner per venue builds the snapshot every interval seconds
+    and hands it to each subscriber only when it changed, so the database
+    work per venue doesn't grow with the number of phones watching, and a
+    busy venue's snapshots never delay another's. The runner exits when
+    the last subscriber leaves. Subclasses start the runner: a greenlet for
+    the gevent workers (LiveChannel), an asyncio task in asgi.py.
+    """
+    queue_class = Queue
+    
+    def __init__(self, venue_id, interval=1):
+        self.venue_id = venue_id
+        self.interval = interval
+        self.subscribers = set()
+        self.latest = None
+        self.last_hash = None
+        self.runner = None
+    
+    def start(self):
+        """Start the loop that calls snapshot_built() and, once it exits, stopped()"""
+        raise NotImplementedError
+    
+    def subscribe(self):
+        # A slow client only ever needs the newest snapshot, so one slot is enough
+        queue = self.queue_class(maxsize=1)
+        if self.latest is not None:
+            queue.put_nowait(self.latest)
+        self.subscribers.add(queue)
+        if self.runner is None:
+            self.runner = self.start()
+        return queue
+    
+    def unsubscribe(self, queue):
+        self.subscribers.discard(queue)
+    
+    def publish(self, court_data):
+        self.latest = court_data
+        for queue in list(self.subscribers):
+            # Greenlets and tasks only switch when they wait, so a full
+            # queue still has its item here
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(court_data)
+    
+    def snapshot_built(self, court_data):
+        # Hash the data to see if it has changed
+        current_hash = snapshot_hash(court_data)
+        if current_hash != self.last_hash:
+            self.last_hash = current_hash
+            self.publish(court_data)
+    
+    def snapshot_failed(self):
+        app.logger.exception(f"Live channel for venue {self.venue_id} failed to build a snapshot")
+    
+    def stopped(self):
+        self.runner = None
+        self.latest = self.last_hash = None
+
+class LiveChannel(SnapshotChannel):
+    """SnapshotChannel run by a greenlet"""
+    
+    def start(self):
+        return gevent.spawn(self.run)
+    
+    def run(self):
+        try:
+            while self.subscribers:
+                try:
+                    with app.app_context():
+                        db.session.info['read_only'] = True
+                        court_data = build_court_snapshot(self.venue_id)
+                    self.snapshot_built(court_data)
+                except Exception:
+                    self.snapshot_failed()
+                sleep(self.interval)
+        finally:
+            self.stopped()
+
+live_channels = {}  # venue_id -> LiveChannel
+
+def channel_for(venue_id):
+    if venue_id not in live_channels:
+        live_channels[venue_id] = LiveChannel(venue_id)
+    return live_channels[venue_id]
+
+SSE_KEEPALIVE = 15  # seconds; also how soon a closed connection is noticed
+
+def sse_event(court_data, compact, names):
+    """One /court-updates event; names is the connection's username table"""
+    if compact:
+        court_json = json.dumps(encode_compact(court_data, names), separators=(',', ':'))
+    else:
+        court_json = json.dumps({'courts': court_data})
+    return f"data: {court_json}\n\n"
+
+@app.route('/court-updates')
+def court_updates():
+    compact = wants_compact()
+    channel = channel_for(current_venue_id())
+    
+    def generate():
+        queue = channel.subscribe()
+        names = {}  # per-connection username table for the compact format
+        try:
+            while True:
+                try:
+                    court_data = queue.get(timeout=SSE_KEEPALIVE)
+                except Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                yield sse_event(court_data, compact, names)
+        finally:
+            channel.unsubscribe(queue)
+    
+    return Response(generate(), mimetype='text/event-stream')
+
+@app.route('/my-next-game')
+@rate_limited('poll')
+@reads_from_replica
+def my_next_game():
+    """Where and roughly when the logged-in player plays next"""
+    username = session.get('user')
+    if not username:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    group_id = db.session.scalar(db.select(User.group_id).where(User.username == username))
+    if group_id is None:
+        return jsonify({'in_group': False})
+    
+    group = db.session.execute(
+        db.select(Court.venue_id, Group.is_in_queue).join(Group, Group.court_id == Court.id).where(Group.id == group_id)
+    ).first()
+    if group and not group.is_in_queue:
+        return jsonify({'in_group': True, 'on_court': True})
+    
+    court_id = None
+    if group:
+        estimates = estimates_for(group.venue_id)
+        estimates.ensure_fresh()
+        if group_id not in estimates.court_of:
+            # Queued since the estimates were built, maybe by another worker
+            estimates.rebuild()
+        court_id = estimates.court_of.get(group_id)
+    if court_id is None:
+        # Queued but not placed yet (say, the replica hasn't caught up)
+        return jsonify({'in_group': True, 'on_court': False, 'court_id': None,
+                        'starts_at': None, 'starts_in': None})
+    
+    starts_at, starts_in = estimates.estimate(group_id)
+    return jsonify({
+        'in_group': True,
+        'on_court': False,
+        'court_id': court_id,
+        'court': estimates.court_names.get(court_id),
+        'groups_ahead': estimates.groups_ahead(group_id),
+        'starts_at': starts_at,
+        'starts_in': starts_in
+    })
+
+# Also update the poll endpoint for consistency
+@app.route('/court-updates-poll')
+@rate_limited('poll')
+@reads_from_replica
+def court_updates_poll():
+    """Fallback endpoint for environments where SSE doesn't work"""
+    court_data = build_court_snapshot(current_venue_id())
+    body_format = poll_format(wants_compact(), request.headers.get('Accept', ''))
+    return poll_response('poll', poll_etag(court_data, body_format),
+                         lambda: encode_poll(court_data, body_format))
+
+def poll_format(compact, accept):
+    """'msgpack', 'compact' (JSON) or 'json' (verbose), whichever body a
+    /court-updates-poll request gets"""
+    if 'application/msgpack' in accept:
+        return 'msgpack' if msgpack else 'compact'
+    return 'compact' if compact else 'json'
+
+def poll_etag(court_data, body_format):
+    # The same data encoded differently is a different representation
+    return f"{snapshot_hash(court_data)}-{body_format}"
+
+def encode_poll(court_data, body_format):
+    """(body, mimetype) of a /court-updates-poll response in body_format (see poll_format())"""
+    timestamp = datetime.now().timestamp()
+    
+    if body_format != 'json':
+        # Each poll is standalone, so it carries its whole username table
+        response_data = encode_compact(court_data, {})
+        response_data['t'] = timestamp
+        if body_format == 'msgpack':
+            return msgpack.packb(response_data), 'application/msgpack'
+        return json.dumps(response_data, separators=(',', ':')).encode(), 'application/json'
     
     # Add a timestamp to the data
     response_data = {
         'courts': court_data,
-        'timestamp': datetime.now().timestamp()
+        'timestamp': timestamp
     }
     
-    return jsonify(response_data)
+    return json.dumps(response_data).encode(), 'application/json'
+
+# Bump SCHEMA_VERSION and add a step to MIGRATIONS whenever a model gains a
+# column that create_all() can't add to an existing table.
+SCHEMA_VERSION = 10
+
+def _drop_global_court_name_unique():
+    # Court names are only unique per venue now
+    if db.engine.dialect.name == 'postgresql':
+        db.session.execute(db.text('ALTER TABLE court DROP CONSTRAINT IF EXISTS court_name_key'))
+        return
+    inspector = db.inspect(db.session.connection())
+    unique = [c['column_names'] for c in inspector.get_unique_constraints('court')]
+    unique += [i['column_names'] for i in inspector.get_indexes('court') if i['unique']]
+    if ['name'] not in unique:
+        return
+    # SQLite can't drop a constraint, so copy the courts into a table without
+    # it and swap that in. Foreign keys aren't enforced (no PRAGMA
+    # foreign_keys), and the ones pointing at court keep their ids.
+    for statement in [
+        'CREATE TABLE court_new (id INTEGER NOT NULL PRIMARY KEY, '
+        'venue_id INTEGER NOT NULL REFERENCES venue (id), name VARCHAR(80) NOT NULL)',
+        'INSERT INTO court_new (id, venue_id, name) SELECT id, venue_id, name FROM court',
+        'DROP TABLE court',
+        'ALTER TABLE court_new RENAME TO court',
+        'CREATE INDEX ix_court_venue_id ON court (venue_id)',
+    ]:
+        db.session.execute(db.text(statement))
+
+def _unique_court_name_per_venue():
+    # What Court's UniqueConstraint gives databases made by create_all()
+    inspector = db.inspect(db.session.connection())
+    unique = [c['column_names'] for c in inspector.get_unique_constraints('court')]
+    unique += [i['column_names'] for i in inspector.get_indexes('court') if i['unique']]
+    if ['venue_id', 'name'] not in unique:
+        db.session.execute(db.text('CREATE UNIQUE INDEX uq_court_venue_id_name ON court (venue_id, name)'))
+
+MIGRATIONS = {  # version -> SQL statements (or callables) that upgrade from version - 1
+    2: ['ALTER TABLE "group" ADD COLUMN version INTEGER NOT NULL DEFAULT 0'],
+    3: ['ALTER TABLE club_state ADD COLUMN auto_balance BOOLEAN NOT NULL DEFAULT FALSE'],
+    4: ['ALTER TABLE club_state ADD COLUMN auto_compact BOOLEAN NOT NULL DEFAULT FALSE',
+        'ALTER TABLE club_state ADD COLUMN compact_across_courts BOOLEAN NOT NULL DEFAULT FALSE'],
+    # Everything that existed becomes the default venue
+    5: [f"INSERT INTO venue (slug, name) VALUES ('{DEFAULT_VENUE[0]}', '{DEFAULT_VENUE[1]}')",
+        'ALTER TABLE court ADD COLUMN venue_id INTEGER REFERENCES venue (id)',
+        'ALTER TABLE timer_state ADD COLUMN venue_id INTEGER REFERENCES venue (id)',
+        'ALTER TABLE club_state ADD COLUMN venue_id INTEGER REFERENCES venue (id)',
+        'UPDATE court SET venue_id = (SELECT min(id) FROM venue)',
+        'UPDATE timer_state SET venue_id = (SELECT min(id) FROM venue) WHERE id = (SELECT min(id) FROM timer_state)',
+        'UPDATE club_state SET venue_id = (SELECT min(id) FROM venue) WHERE id = (SELECT min(id) FROM club_state)',
+        'DELETE FROM timer_state WHERE venue_id IS NULL',
+        'DELETE FROM club_state WHERE venue_id IS NULL',
+        'CREATE INDEX ix_court_venue_id ON court (venue_id)',
+        'CREATE UNIQUE INDEX ix_timer_state_venue_id ON timer_state (venue_id)',
+        'CREATE UNIQUE INDEX ix_club_state_venue_id ON club_state (venue_id)',
+        'CREATE INDEX ix_group_court_queue ON "group" (court_id, is_in_queue, queue_position)',
+        'CREATE INDEX ix_user_group_id ON "user" (group_id)',
+        _drop_global_court_name_unique,
+        _unique_court_name_per_venue],
+    # Per-court timers start out as copies of their venue's timer, except
+    # that a zero-length one gets the default 15 minutes
+    6: ['ALTER TABLE timer_state ADD COLUMN stagger_seconds INTEGER NOT NULL DEFAULT 0',
+        'ALTER TABLE timer_state ADD COLUMN auto_restart BOOLEAN NOT NULL DEFAULT FALSE',
+        'INSERT INTO court_timer (court_id, duration, remaining_time, is_running, start_time, end_time) '
+        'SELECT court.id, '
+        'CASE WHEN timer_state.duration > 0 THEN timer_state.duration ELSE 900 END, '
+        'CASE WHEN timer_state.duration > 0 THEN timer_state.remaining_time ELSE 900 END, '
+        'timer_state.is_running AND timer_state.duration > 0, '
+        'CASE WHEN timer_state.duration > 0 THEN timer_state.start_time END, '
+        'CASE WHEN timer_state.duration > 0 THEN timer_state.end_time END '
+        'FROM court JOIN timer_state ON timer_state.venue_id = court.venue_id'],
+    # Play history tables are new, create_all() makes them
+    7: ['ALTER TABLE "group" ADD COLUMN created_at FLOAT',
+        'ALTER TABLE "group" ADD COLUMN started_at FLOAT'],
+    # Version 5 used to drop the global court name unique without adding
+    # the per-venue one
+    8: [_unique_court_name_per_venue],
+    # Version 5 left SQLite databases with the global one
+    9: [_drop_global_court_name_unique,
+        _unique_court_name_per_venue],
+    10: ['ALTER TABLE "user" ADD COLUMN joined_at FLOAT'],
+}
+
+DEFAULT_COURTS = ['Court 1', 'Court 2', 'Court 3', 'Court 4']
+
+def bootstrap_db(court_names=DEFAULT_COURTS):
+    """Idempotently bring the database up to date without touching existing data"""
+    inspector = db.inspect(db.engine)
+    info = SchemaInfo.query.first() if inspector.has_table(SchemaInfo.__tablename__) else None
+
+    if info is None or info.version < SCHEMA_VERSION:
+        # Databases created before versioning existed are at version 1
+        if info:
+            current = info.version
+        else:
+            current = 1 if inspector.has_table(Court.__tablename__) else SCHEMA_VERSION
+        # create_all() only creates missing tables, it never drops anything
+        db.create_all()
+        for version in range(current + 1, SCHEMA_VERSION + 1):
+            for statement in MIGRATIONS.get(version, []):
+                if callable(statement):
+                    statement()
+                else:
+                    db.session.execute(db.text(statement))
+        if info is None:
+            info = SchemaInfo(version=SCHEMA_VERSION)
+            db.session.add(info)
+        info.version = SCHEMA_VERSION
+        db.session.flush()
+
+    if not db.session.query(Venue.id).first():
+        slug, name = DEFAULT_VENUE
+        db.session.add(Venue(slug=slug, name=name))
+        db.session.flush()
+    add_venue_courts(default_venue_id(), court_names)
+    db.session.commit()
 
-if __name__ == '__main__':
-    with app.app_context():
-        db.drop_all()
-        db.create_all()   # Create all tables if they don't exist
-
-        # Add default courts if none exist
-        if not Court.query.first():
-            default_courts = ['Court 1', 'Court 2', 'Court 3', 'Court 4']
-            for name in default_courts:
-                court = Court(name=name)
-                db.session.add(court)
-
-        # Create default TimerState if none exists
-        if not TimerState.query.first():
-            timer_state = TimerState(is_running=False)  # adjust fields as per your model
-            db.session.add(timer_state)
-
-        # Create default ClubState if none exists
-        if not ClubState.query.first():
-            club_state = ClubState()  # fill in default fields if needed
-            db.session.add(club_state)
-        
-        # Add admin user if not exists
-        if not User.query.filter_by(username='admin').first():
-            admin = User(
-                username='admin',
-                password_hash=generate_password_hash('adminpass'),
-                is_admin=True
-            )
-            db.session.add(admin)
-            
-        # Add test users
-        test_users = ['a', 'b', 'c']
-        for username in test_users:
-            if not User.query.filter_by(username=username).first():
-                user = User(
-                    username=username,
-                    password_hash=generate_password_hash(username),  # password same as username
-                    is_admin=False
-                )
-                db.session.add(user)
-                
-        # Commit to create courts and users first
+def add_venue_courts(venue_id, court_names):
+    """Create the venue's missing singleton rows, active groups and court timers, and
+    its courts if it has none yet (doesn't commit)"""
+    # Singleton rows
+    settings = get_timer_state(venue_id)
+    if not settings:
+        settings = TimerState(venue_id=venue_id, is_running=False)
+        db.session.add(settings)
+    if not db.session.query(ClubState.id).filter_by(venue_id=venue_id).first():
+        db.session.add(ClubState(venue_id=venue_id))
+    db.session.flush()
+
+    # Courts, only for a venue that has none yet: courts an admin deleted or
+    # renamed must not come back on the next start
+    if not db.session.scalar(db.select(Court.id).where(Court.venue_id == venue_id).limit(1)):
+        db.session.execute(db.insert(Court), [{'venue_id': venue_id, 'name': name} for name in court_names])
+
+    # Ensure every court has an active group, again in one round trip each way
+    court_ids = db.select(Court.id).where(Court.venue_id == venue_id)
+    covered = set(db.session.scalars(
+        db.select(Group.court_id).where(Group.court_id.in_(court_ids), Group.is_in_queue == False).distinct()
+    ))
+    uncovered = [court_id for court_id in db.session.scalars(court_ids) if court_id not in covered]
+    if uncovered:
+        db.session.execute(db.insert(Group), [
+            {'court_id': court_id, 'is_in_queue': False, 'queue_position': None}
+            for court_id in uncovered
+        ])
+
+    # And a timer, at the venue's default duration
+    timed = set(db.session.scalars(db.select(CourtTimer.court_id).where(CourtTimer.court_id.in_(court_ids))))
+    untimed = [court_id for court_id in db.session.scalars(court_ids) if court_id not in timed]
+    if untimed:
+        db.session.execute(db.insert(CourtTimer), [
+            {'court_id': court_id, 'duration': settings.duration, 'remaining_time': settings.duration, 'is_running': False}
+            for court_id in untimed
+        ])
+
+def ensure_users(users):
+    """Create any (username, password, is_admin) users that don't exist yet"""
+    usernames = [username for username, _, _ in users]
+    existing = set(db.session.scalars(db.select(User.username).where(User.username.in_(usernames))))
+    rows = [{
+        'username': username,
+        'password_hash': generate_password_hash(password),
+        'is_admin': is_admin
+    } for username, password, is_admin in users if username not in existing]
+    if rows:
+        db.session.execute(db.insert(User), rows)
         db.session.commit()
-                
-        # Create one empty active group per court
-        courts = Court.query.all()
-        for court in courts:
-            # Check if court already has an active group
-            existing_active = Group.query.filter_by(court=court, is_in_queue=False).first()
-            if not existing_active:
-                active_group = Group(
-                    court=court,
-                    is_in_queue=False,
-                    queue_position=None
-                )
-                db.session.add(active_group)
-                
-        # Commit all changes
+    return len(rows)
+
+DEV_USERS = [('admin', 'adminpass', True), ('a', 'a', False), ('b', 'b', False), ('c', 'c', False)]
+
+# State snapshots: every venue's courts, timers, groups and who is in them,
+# as JSON with the original ids, so a recorded trace (tracing.py) can be
+# replayed against exactly the state it started from. Play history and
+# stats aren't included, and neither are password hashes: users who already
+# exist in the importing database keep their password, and new ones get the
+# import's password, if one is given, or one nobody knows.
+SNAPSHOT_MODELS = [Venue, Court, ClubState, TimerState, CourtTimer, Group, User, QueueEntry]  # insert order
+SNAPSHOT_CLEARED = [PlayHistory, PlayerStats, CourtHourStats]  # refer to users and courts, so go first
+SNAPSHOT_SECRET_COLUMNS = {'password_hash'}
+
+def export_state():
+    """Every SNAPSHOT_MODELS row as JSON-able dicts"""
+    tables = {}
+    for model in SNAPSHOT_MODELS:
+        columns = [c for c in model.__table__.columns if c.name not in SNAPSHOT_SECRET_COLUMNS]
+        rows = db.session.execute(db.select(*columns).order_by(model.id)).all()
+        tables[model.__tablename__] = [{
+            column.name: value.isoformat() if isinstance(value, datetime) else value
+            for column, value in zip(columns, row)
+        } for row in rows]
+    return {'schema_version': SCHEMA_VERSION, 'exported_at': time.time(), 'tables': tables}
+
+def import_state(state, time_scale=1, password=None):
+    """Replace the database's courts, groups and users with an export_state() snapshot.
+
+    Running timers keep the time they had left at export, multiplied by
+    time_scale along with every timer's duration (replaying a trace at 10x
+    speed imports with time_scale=0.1 so rounds end on schedule). Users
+    keep the password they have here; users new to this database get
+    password, or none that can be used if it's None.
+    """
+    if state['schema_version'] != SCHEMA_VERSION:
+        raise ValueError(f"Snapshot is at schema version {state['schema_version']}, the database at {SCHEMA_VERSION}")
+    now = time.time()
+    shift = now - state['exported_at']
+    new_user_hash = generate_password_hash(password or secrets.token_urlsafe())
+    password_hashes = dict(db.session.execute(db.select(User.username, User.password_hash)).all())
+
+    # Referring rows first: SNAPSHOT_MODELS backwards deletes users before groups
+    for model in SNAPSHOT_CLEARED + SNAPSHOT_MODELS[::-1]:
+        db.session.execute(db.delete(model))
+
+    for model in SNAPSHOT_MODELS:
+        rows = [dict(row) for row in state['tables'].get(model.__tablename__, [])]
+        for column in model.__table__.columns:
+            if isinstance(column.type, db.DateTime):
+                for row in rows:
+                    if row.get(column.name):
+                        row[column.name] = datetime.fromisoformat(row[column.name])
+        for row in rows:
+            if model is User:
+                row['password_hash'] = password_hashes.get(row['username'], new_user_hash)
+                if row.get('joined_at') is not None:
+                    row['joined_at'] += shift
+            elif model is Group:
+                for name in ('created_at', 'started_at'):
+                    if row.get(name) is not None:
+                        row[name] += shift
+            elif model is CourtTimer:
+                for name in ('duration', 'remaining_time'):
+                    if row.get(name) is not None:
+                        row[name] = round(row[name] * time_scale)
+                if row['is_running'] and row['end_time'] is not None:
+                    left = max(0, (row['end_time'] - state['exported_at']) * time_scale)
+                    row['remaining_time'] = round(left)
+                    row['start_time'] = now
+                    row['end_time'] = now + left
+        if rows:
+            db.session.execute(db.insert(model), rows)
+
+    if db.engine.dialect.name == 'postgresql':
+        # Rows came with their ids, so move each sequence past them
+        for model in SNAPSHOT_MODELS:
+            table = model.__tablename__
+            db.session.execute(db.text(
+                f"SELECT setval(pg_get_serial_sequence('\"{table}\"', 'id'), COALESCE(MAX(id), 0) + 1, false) FROM \"{table}\""
+            ))
+    db.session.commit()
+
+    # In-process caches of the old state
+    venue_ids.clear()
+    claims.clear()
+    wait_estimates.clear()
+    return {name: len(rows) for name, rows in state['tables'].items()}
+
+# Request tracing, off unless REQUEST_TRACE names the file to append to
+from tracing import TraceRecorder
+REQUEST_TRACE = os.getenv('REQUEST_TRACE')
+trace_recorder = None
+if REQUEST_TRACE:
+    trace_recorder = TraceRecorder(REQUEST_TRACE, snapshot=export_state)
+    trace_recorder.init_app(app)
+
+@app.cli.command('init-db')
+def init_db_command():
+    """Create missing tables, courts and singleton rows (safe to run on every deploy)"""
+    bootstrap_db()
+    print(f"✅ Database at schema version {SCHEMA_VERSION}")
+
+@app.cli.command('create-venue')
+@click.argument('slug')
+@click.argument('name')
+@click.option('--courts', default=4, help='number of courts')
+def create_venue_command(slug, name, courts):
+    """Add a venue (hall or session) with its own courts, timer and club state"""
+    venue = Venue.query.filter_by(slug=slug).first()
+    if venue is None:
+        venue = Venue(slug=slug, name=name)
+        db.session.add(venue)
+        db.session.flush()
+    try:
+        add_venue_courts(venue.id, [f'Court {i}' for i in range(1, courts + 1)])
         db.session.commit()
-        
+    except IntegrityError:
+        db.session.rollback()
+        print(f"❌ Venue {slug} already has a court with one of those names")
+        raise SystemExit(1)
+    print(f"✅ Venue {slug} ready at /venue/{slug}")
+
+@app.cli.command('export-state')
+@click.argument('path')
+def export_state_command(path):
+    """Write every venue's courts, timers, groups and users to a JSON snapshot"""
+    with open(path, 'w') as f:
+        json.dump(export_state(), f)
+    print(f"✅ State written to {path}")
+
+@app.cli.command('import-state')
+@click.argument('path')
+@click.option('--password', help="password for imported users who don't exist here yet (default: they can't log in)")
+@click.confirmation_option(prompt='This replaces all courts, groups and users (and clears play history). Continue?')
+def import_state_command(path, password):
+    """Replace courts, timers, groups and users with a snapshot from export-state"""
+    bootstrap_db()
+    with open(path) as f:
+        counts = import_state(json.load(f), password=password)
+    print(f"✅ Imported {', '.join(f'{count} {table}' for table, count in counts.items())}")
+
+if __name__ == '__main__':
+    with app.app_context():
+        bootstrap_db()
+        ensure_users(DEV_USERS)
+
     app.run(host="0.0.0.0", port=5001, debug=True)
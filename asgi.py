@@ -0,0 +1,307 @@
+# asgi.py
+# asyncio serving path for the high-concurrency live endpoints:
+#
+#   /court-updates        SSE stream (one AsyncLiveChannel per venue)
+#   /court-updates-poll   polling fallback, same formats and compression
+#   /timer/status         timer poll, rotating due courts lazily
+#
+# The Flask app (app.py, under gevent) keeps serving everything else. Run the
+# two side by side and let the reverse proxy send these three paths here:
+#
+#   gunicorn -k gevent -b 127.0.0.1:5001 app:app
+#   uvicorn asgi:app --host 127.0.0.1 --port 5002
+#
+# Needs an ASGI server and an async driver for the database (aiosqlite for
+# SQLite, asyncpg for Postgres); neither is required by the Flask app. The
+# same models, snapshot builder and encoders are used as in app.py: the ORM
+# work runs on an AsyncSession through run_sync(), so the sync helpers in
+# app.py take the session as a parameter. ASYNC_DATABASE_URL and
+# ASYNC_READ_DATABASE_URL override the URLs derived from DATABASE_URL and
+# READ_DATABASE_URL.
+import asyncio
+import json
+import math
+import os
+from datetime import datetime
+from http.cookies import SimpleCookie
+from urllib.parse import parse_qs
+
+from itsdangerous import BadSignature
+from werkzeug.http import parse_etags
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+import app as badminton
+from app import app as flask_app, db, Venue, DEFAULT_VENUE, SSE_KEEPALIVE, TRUSTED_PROXIES, venue_ids, rate_limiter, \
+    build_court_snapshot, SnapshotChannel, encode_poll, compress_body, sse_event, timer_status, timer_etag, rotate_court, \
+    running_court_timers, snapshot_hash, poll_format, poll_etag, poll_interval
+from dbpool import engine_options, pool_load
+from ratelimit import MemoryStore, client_ip
+
+ASYNC_DRIVERS = {'sqlite': 'aiosqlite', 'postgresql': 'asyncpg', 'mysql': 'aiomysql'}
+
+def async_url(url):
+    """The same database as url, through its asyncio driver"""
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No asyncio driver known for {backend} databases")
+    return url.set(drivername=f'{backend}+{ASYNC_DRIVERS[backend]}')
+
+def make_engine(url, prefix):
+    return create_async_engine(async_url(url), **engine_options(str(url), prefix=prefix))
+
+ASYNC_DATABASE_URL = os.getenv('ASYNC_DATABASE_URL') or badminton.DATABASE_URL
+ASYNC_READ_DATABASE_URL = os.getenv('ASYNC_READ_DATABASE_URL') or badminton.READ_DATABASE_URL
+primary = make_engine(ASYNC_DATABASE_URL, 'DB')
+replica = make_engine(ASYNC_READ_DATABASE_URL, 'DB_READ') if ASYNC_READ_DATABASE_URL else primary
+write_session = async_sessionmaker(primary, expire_on_commit=False)
+read_session = async_sessionmaker(replica, expire_on_commit=False)
+
+class Request:
+    """The parts of an ASGI HTTP scope these endpoints look at"""
+
+    def __init__(self, scope):
+        self.path = scope['path']
+        self.method = scope['method']
+        self.args = {key: values[0] for key, values in parse_qs(scope['query_string'].decode()).items()}
+        self.headers = {name.decode('latin-1'): value.decode('latin-1') for name, value in scope['headers']}
+        self.remote_addr = client_ip(scope['client'][0] if scope.get('client') else None,
+                                     self.headers.get('x-forwarded-for'), TRUSTED_PROXIES)
+        self.session = self.flask_session()
+
+    def flask_session(self):
+        """Flask's signed session cookie, or {} if missing or tampered with"""
+        cookie = SimpleCookie(self.headers.get('cookie', ''))
+        morsel = cookie.get(flask_app.config['SESSION_COOKIE_NAME'])
+        serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+        if morsel is None or serializer is None:
+            return {}
+        try:
+            return serializer.loads(morsel.value, max_age=int(flask_app.permanent_session_lifetime.total_seconds()))
+        except BadSignature:
+            return {}
+
+async def send_response(send, status, body, content_type='application/json', headers=()):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', content_type.encode()),
+                    (b'content-length', str(len(body)).encode()),
+                    *((name.encode(), value.encode()) for name, value in headers)]
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+async def send_json(send, status, data, headers=()):
+    await send_response(send, status, json.dumps(data).encode(), headers=headers)
+
+async def current_venue_id(request, db_session):
+    """Same lookup as app.current_venue_id(), sharing its slug cache"""
+    slug = request.args.get('venue') or request.session.get('venue') or DEFAULT_VENUE[0]
+    venue_id = venue_ids.get(slug)
+    if venue_id is None:
+        venue_id = (await db_session.scalar(db.select(Venue.id).where(Venue.slug == slug))
+                    or await db_session.scalar(db.select(Venue.id).order_by(Venue.id).limit(1)))
+        venue_ids.set(slug, venue_id)
+    return venue_id
+
+async def over_rate_limit(request, send, limit_name):
+    """Send the same 429 as app.rate_limited() and return True if over the limit"""
+    identity = request.session.get('user') or request.remote_addr
+    # Scoped by path: these routes have no parameters, so it's the Flask rule too
+    if isinstance(rate_limiter.store, MemoryStore):
+        allowed, retry_after = rate_limiter.check(limit_name, identity, request.path)
+    else:
+        # A shared store is a network round trip; keep it off the event loop
+        allowed, retry_after = await asyncio.to_thread(rate_limiter.check, limit_name, identity, request.path)
+    if allowed:
+        return False
+    await send_json(send, 429, {
+        'success': False,
+        'message': 'Too many requests, please slow down',
+        'retry_after': retry_after
+    }, headers=[('Retry-After', str(math.ceil(retry_after)))])
+    return True
+
+class AsyncLiveChannel(SnapshotChannel):
+    """SnapshotChannel run by an asyncio task"""
+    queue_class = asyncio.Queue
+
+    def start(self):
+        return asyncio.create_task(self.run())
+
+    async def run(self):
+        try:
+            while self.subscribers:
+                try:
+                    async with read_session() as db_session:
+                        court_data = await db_session.run_sync(lambda s: build_court_snapshot(self.venue_id, s))
+                    self.snapshot_built(court_data)
+                except Exception:
+                    self.snapshot_failed()
+                await asyncio.sleep(self.interval)
+        finally:
+            self.stopped()
+
+live_channels = {}  # venue_id -> AsyncLiveChannel
+
+def channel_for(venue_id):
+    if venue_id not in live_channels:
+        live_channels[venue_id] = AsyncLiveChannel(venue_id)
+    return live_channels[venue_id]
+
+async def wait_for_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+async def court_updates(request, receive, send):
+    compact = request.args.get('format') == 'compact'
+    async with read_session() as db_session:
+        channel = channel_for(await current_venue_id(request, db_session))
+
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [(b'content-type', b'text/event-stream; charset=utf-8'), (b'cache-control', b'no-cache')]
+    })
+    if request.method == 'HEAD':
+        await send({'type': 'http.response.body', 'body': b''})
+        return
+    queue = channel.subscribe()
+    names = {}  # per-connection username table for the compact format
+    disconnected = asyncio.ensure_future(wait_for_disconnect(receive))
+    getter = None
+    try:
+        while True:
+            getter = getter or asyncio.ensure_future(queue.get())
+            done, _ = await asyncio.wait({getter, disconnected}, timeout=SSE_KEEPALIVE,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if disconnected in done:
+                break
+            if getter in done:
+                event = sse_event(getter.result(), compact, names)
+                getter = None
+            else:
+                event = ": keepalive\n\n"
+            await send({'type': 'http.response.body', 'body': event.encode(), 'more_body': True})
+    finally:
+        channel.unsubscribe(queue)
+        disconnected.cancel()
+        if getter is not None:
+            getter.cancel()
+
+async def send_poll(request, send, kind, etag, encode):
+    """Same as app.poll_response(): a 304 if the client already has etag,
+    else the compressed body from encode() -> (body, mimetype)"""
+    hidden = request.headers.get('x-page-visibility') == 'hidden'
+    load = max(pool_load(primary), pool_load(replica))
+    headers = [('Vary', 'Accept, Accept-Encoding, X-Page-Visibility'), ('ETag', f'W/"{etag}"'),
+               ('X-Poll-Interval', str(poll_interval(kind, hidden, load)))]
+    if parse_etags(request.headers.get('if-none-match')).contains_weak(etag):
+        await send({
+            'type': 'http.response.start',
+            'status': 304,
+            'headers': [(name.encode(), value.encode()) for name, value in headers]
+        })
+        await send({'type': 'http.response.body', 'body': b''})
+        return
+    body, mimetype = encode()
+    body, encoding = compress_body(body, request.headers.get('accept-encoding', ''))
+    if encoding:
+        headers.append(('Content-Encoding', encoding))
+    await send_response(send, 200, body, mimetype, headers)
+
+async def court_updates_poll(request, receive, send):
+    if await over_rate_limit(request, send, 'poll'):
+        return
+    async with read_session() as db_session:
+        venue_id = await current_venue_id(request, db_session)
+        court_data = await db_session.run_sync(lambda s: build_court_snapshot(venue_id, s))
+    body_format = poll_format(request.args.get('format') == 'compact', request.headers.get('accept', ''))
+    await send_poll(request, send, 'poll', poll_etag(court_data, body_format),
+                    lambda: encode_poll(court_data, body_format))
+
+def rotate_in_app_context(court_id):
+    with flask_app.app_context():
+        return rotate_court(court_id)
+
+async def get_timer_status(request, receive, send):
+    if await over_rate_limit(request, send, 'poll'):
+        return
+    now = datetime.now().timestamp()
+    async with write_session() as db_session:
+        venue_id = await current_venue_id(request, db_session)
+        timers = await db_session.run_sync(lambda s: running_court_timers(venue_id, now, s))
+    
+    # Rotation happens once per round per court and shares its logic
+    # (compaction, balancing, logging) with the Flask app, so it runs on
+    # the sync engine in a worker thread rather than being ported
+    for court_id, end_time in timers:
+        if end_time - now <= 0.1:
+            await asyncio.to_thread(rotate_in_app_context, court_id)
+    
+    async with write_session() as db_session:
+        status = await db_session.run_sync(lambda s: timer_status(venue_id, now, s))
+    await send_poll(request, send, 'timer', timer_etag(status), lambda: (json.dumps(status).encode(), 'application/json'))
+
+ROUTES = {
+    '/court-updates': court_updates,
+    '/court-updates-poll': court_updates_poll,
+    '/timer/status': get_timer_status,
+}
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await primary.dispose()
+            if replica is not primary:
+                await replica.dispose()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+def without_body(send):
+    """send for a HEAD request: the GET response's status and headers, no body"""
+    async def send_head(message):
+        if message['type'] == 'http.response.body':
+            message = {**message, 'body': b''}
+        await send(message)
+    return send_head
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+
+    request = Request(scope)
+    if request.method == 'HEAD':
+        send = without_body(send)
+    view = ROUTES.get(request.path)
+    if view is None:
+        return await send_json(send, 404, {'error': 'Not found: served by the Flask app'})
+    if request.method not in ('GET', 'HEAD'):
+        return await send_json(send, 405, {'error': 'Method not allowed'})
+
+    started = False
+
+    async def tracking_send(message):
+        nonlocal started
+        started = started or message['type'] == 'http.response.start'
+        await send(message)
+
+    try:
+        await view(request, receive, tracking_send)
+    except PoolTimeoutError as error:
+        # Every connection is busy: tell the client to come back rather than hang
+        flask_app.logger.warning(f"Async database pool exhausted: {error}")
+        if not started:
+            await send_json(send, 503, {'success': False, 'message': 'Server busy, please retry', 'retry_after': 1},
+                            headers=[('Retry-After', '1')])
+    except Exception:
+        flask_app.logger.exception(f"{request.path} failed")
+        if not started:
+            await send_json(send, 500, {'error': 'Internal server error'})
+
+app = application
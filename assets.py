@@ -0,0 +1,102 @@
+# assets.py
+# Build step for static assets: bundles and minifies the CSS/JS that every
+# page loads, writes content-hashed copies (plus .gz/.br variants) to
+# static/dist/ and records them in static/dist/manifest.json.
+#
+#   python assets.py        # run on deploy, after pulling new static files
+#
+# The app serves static/dist/ with immutable caching (see asset_url() in
+# app.py) and falls back to the plain files when no manifest exists, so
+# development works without building.
+import gzip
+import hashlib
+import json
+import os
+import re
+
+try:
+    import brotli  # optional: also write .br variants
+except ImportError:
+    brotli = None
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+DIST_DIR = os.path.join(STATIC_DIR, 'dist')
+MANIFEST_PATH = os.path.join(DIST_DIR, 'manifest.json')
+
+# bundle name -> source files (relative to static/), concatenated in order
+BUNDLES = {
+    'site.css': ['styles.css'],
+    'site.js': ['theme.js', 'transport.js', 'live-updates.js', 'js/app.js'],
+    'home.js': ['js/home.js'],
+}
+
+def minify_css(source):
+    source = re.sub(r'/\*.*?\*/', '', source, flags=re.S)
+    source = re.sub(r'\s+', ' ', source)
+    source = re.sub(r'\s*([{};,>])\s*', r'\1', source)
+    source = re.sub(r':\s+', ':', source)
+    return source.replace(';}', '}').strip()
+
+def minify_js(source):
+    """Conservative line-based minifier: drops indentation, blank lines and
+    whole-line // comments. It never rewrites code, so it can't break it."""
+    lines = []
+    for line in source.splitlines():
+        line = line.strip()
+        if not line or line.startswith('//'):
+            continue
+        lines.append(line)
+    return '\n'.join(lines) + '\n'
+
+def build_bundle(name, sources):
+    with_separator = '\n;\n' if name.endswith('.js') else '\n'
+    contents = []
+    for source in sources:
+        with open(os.path.join(STATIC_DIR, source), encoding='utf-8') as f:
+            contents.append(f.read())
+    combined = with_separator.join(contents)
+    return minify_js(combined) if name.endswith('.js') else minify_css(combined)
+
+def write_variants(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+    with open(path + '.gz', 'wb') as f:
+        f.write(gzip.compress(data, compresslevel=9))
+    if brotli:
+        with open(path + '.br', 'wb') as f:
+            f.write(brotli.compress(data, quality=11))
+
+def build():
+    os.makedirs(DIST_DIR, exist_ok=True)
+    manifest = {}
+    for name, sources in BUNDLES.items():
+        data = build_bundle(name, sources).encode('utf-8')
+        digest = hashlib.sha256(data).hexdigest()[:12]
+        stem, ext = os.path.splitext(name)
+        hashed = f'{stem}.{digest}{ext}'
+        write_variants(os.path.join(DIST_DIR, hashed), data)
+        manifest[name] = hashed
+        original = sum(os.path.getsize(os.path.join(STATIC_DIR, s)) for s in sources)
+        print(f'{name:<10} {original:>7} -> {len(data):>7} bytes  dist/{hashed}')
+
+    with open(MANIFEST_PATH, 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    # Drop builds the manifest no longer points at
+    keep = set(manifest.values())
+    for filename in os.listdir(DIST_DIR):
+        base = filename[:-3] if filename.endswith(('.gz', '.br')) else filename
+        if filename != 'manifest.json' and base not in keep:
+            os.remove(os.path.join(DIST_DIR, filename))
+    return manifest
+
+def load_manifest():
+    """Bundle name -> hashed filename, or {} if assets haven't been built"""
+    try:
+        with open(MANIFEST_PATH) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+if __name__ == '__main__':
+    build()
@@ -0,0 +1,76 @@
+# balancer.py
+# Cross-court queue balancing.
+#
+# Each court runs its own clock, so the n-th group in a court's queue (n
+# from 0) starts once the court's current round is over plus n of its
+# rounds: clocks gives each court's (seconds left, round seconds). Moving
+# the *last* group of a queue to the end of a queue where it would start
+# sooner changes nobody else's wait, and it never lets anyone overtake a
+# group that queued earlier on the target court. What a move is worth
+# depends on who moves: a full group saves four players the time, an empty
+# one saves nobody anything. So each step makes the move that saves the
+# most player-seconds (to the court with the earliest free slot, emptiest on
+# ties, taking the tail with the most to gain) and planning stops once no
+# move lowers expected_wait(). A court without a clock has a whole round
+# left and rounds of 1, so without clocks waits come out in rounds.
+
+DEFAULT_CLOCK = (1, 1)
+
+def start_after(clocks, court_id, groups_ahead):
+    """Seconds until the group with groups_ahead in front of it on court_id starts"""
+    left, round_seconds = clocks.get(court_id, DEFAULT_CLOCK)
+    return left + groups_ahead * round_seconds
+
+def plan_moves(queues, clocks=None, max_moves=None):
+    """Plan tail moves that lower the player-weighted expected wait.
+
+    queues: {court_id: [(group_id, player_count), ...]} in queue order.
+    clocks: {court_id: (seconds_left, round_seconds)}; courts missing from
+    it get DEFAULT_CLOCK.
+    Returns [(group_id, from_court_id, to_court_id), ...] in the order
+    they should be applied. Runs in O(groups + courts * moves).
+    """
+    clocks = clocks or {}
+    queues = {court_id: list(queue) for court_id, queue in queues.items()}
+    players = {court_id: sum(count for _, count in queue) for court_id, queue in queues.items()}
+
+    moves = []
+    while queues and (max_moves is None or len(moves) < max_moves):
+        target = min(queues, key=lambda court_id: (start_after(clocks, court_id, len(queues[court_id])),
+                                                   players[court_id]))
+        target_start = start_after(clocks, target, len(queues[target]))
+        source, saved = None, 0
+        for court_id, queue in queues.items():
+            if queue and court_id != target:
+                # The tail's players each wait this much less
+                gain = queue[-1][1] * (start_after(clocks, court_id, len(queue) - 1) - target_start)
+                if gain > saved:
+                    source, saved = court_id, gain
+        if source is None:
+            break
+
+        group = queues[source].pop()
+        queues[target].append(group)
+        players[source] -= group[1]
+        players[target] += group[1]
+        moves.append((group[0], source, target))
+    return moves
+
+def expected_wait(queues, clocks=None):
+    """Mean time until a queued player's group starts, weighted by group size"""
+    clocks = clocks or {}
+    players = waited = 0
+    for court_id, queue in queues.items():
+        for groups_ahead, (_, player_count) in enumerate(queue):
+            players += player_count
+            waited += player_count * start_after(clocks, court_id, groups_ahead)
+    return waited / players if players else 0.0
+
+def apply_moves(queues, moves):
+    """Return a copy of queues with moves applied (for reporting)"""
+    queues = {court_id: list(queue) for court_id, queue in queues.items()}
+    for group_id, source, target in moves:
+        queue = queues[source]
+        index = next(i for i, group in enumerate(queue) if group[0] == group_id)
+        queues[target].append(queue.pop(index))
+    return queues
@@ -0,0 +1,2 @@
+# Benchmark and simulation scripts. Run from the repo root, e.g.
+#   python -m benchmarks.concurrency
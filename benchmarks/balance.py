@@ -0,0 +1,59 @@
+"""Simulate a club night with skewed court choice, with and without balancing.
+
+    python -m benchmarks.balance --courts 12 --rounds 40 --arrivals 30
+
+Each round --arrivals new groups join, --skew of them picking Court 1 and
+the rest a random court; then every court rotates (the head of each queue
+goes on). Reports the mean number of rounds groups waited and the time
+spent planning, with balancing after every rotation versus none.
+"""
+import argparse
+import random
+import time
+
+from balancer import plan_moves
+
+def simulate(courts, rounds, arrivals, skew, balance, seed):
+    rng = random.Random(seed)
+    queues = {court: [] for court in range(courts)}
+    joined_at = {}
+    waits = []
+    planning = 0.0
+    next_id = 0
+
+    for round_number in range(rounds):
+        for _ in range(arrivals):
+            court = 0 if rng.random() < skew else rng.randrange(courts)
+            queues[court].append((next_id, rng.randint(1, 4)))
+            joined_at[next_id] = round_number
+            next_id += 1
+
+        # Rotation: each court promotes the head of its queue
+        for queue in queues.values():
+            if queue:
+                group_id, _ = queue.pop(0)
+                waits.append(round_number - joined_at.pop(group_id))
+
+        if balance:
+            started = time.perf_counter()
+            for group, source, target in plan_moves(queues):
+                queues[target].append(queues[source].pop())
+            planning += time.perf_counter() - started
+
+    still_waiting = len(joined_at)
+    return sum(waits) / len(waits), max(waits), still_waiting, planning / rounds
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--courts', type=int, default=12)
+    parser.add_argument('--rounds', type=int, default=40)
+    parser.add_argument('--arrivals', type=int, default=12, help='new groups per round')
+    parser.add_argument('--skew', type=float, default=0.4, help='share of arrivals that pick Court 1')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"{args.courts} courts, {args.rounds} rounds, {args.arrivals} groups/round, {args.skew:.0%} pick Court 1")
+    for label, balance in (('no balancing', False), ('balanced', True)):
+        mean, worst, left, plan_time = simulate(args.courts, args.rounds, args.arrivals, args.skew, balance, args.seed)
+        print(f"{label:>13}: mean wait {mean:5.2f} rounds, worst {worst:3d}, "
+              f"{left:4d} groups still queued, {plan_time * 1e6:7.1f} us planning/round")
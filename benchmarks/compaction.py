@@ -0,0 +1,79 @@
+"""Simulate court utilisation with and without merging partial queue groups.
+
+    python -m benchmarks.compaction --courts 4 --hours 3
+
+Players arrive in small parties (mostly 1-2) and queue as their own group
+on a random court, as create_new_group does. Every --round-minutes each
+court plays the head of its queue. Reports players on court per hour and
+court utilisation, with compaction before each rotation (per court and
+across courts) versus none, plus the cost of planning a large queue.
+"""
+import argparse
+import random
+import time
+
+from compaction import plan_merges
+
+MAX_PLAYERS = 4
+
+def simulate(courts, rounds, parties_per_round, mode, seed):
+    rng = random.Random(seed)
+    queues = {court: [] for court in range(courts)}
+    played = 0
+    next_id = 0
+
+    for _ in range(rounds):
+        for _ in range(parties_per_round):
+            size = rng.choices([1, 2, 3, 4], weights=[5, 3, 1, 1])[0]
+            queues[rng.randrange(courts)].append((next_id, size))
+            next_id += 1
+
+        if mode == 'per court':
+            for court, queue in queues.items():
+                queues[court] = merge(queue, queue)
+        elif mode == 'across courts':
+            # Interleave by position, as the app does, then put survivors back
+            interleaved = [g for position in range(max(map(len, queues.values()), default=0))
+                           for q in queues.values() if position < len(q) for g in [q[position]]]
+            merged = dict(merge(interleaved, interleaved))
+            for court, queue in queues.items():
+                queues[court] = [(g, merged[g]) for g, _ in queue if g in merged]
+
+        for queue in queues.values():
+            if queue:
+                played += queue.pop(0)[1]
+
+    return played
+
+def merge(order, queue):
+    merges, empty = plan_merges(order, MAX_PLAYERS)
+    sizes = dict(queue)
+    for source, target in merges:
+        sizes[target] += sizes.pop(source)
+    for group in empty:
+        sizes.pop(group, None)
+    return [(g, sizes[g]) for g, _ in queue if g in sizes]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--courts', type=int, default=4)
+    parser.add_argument('--hours', type=float, default=3)
+    parser.add_argument('--round-minutes', type=int, default=15)
+    parser.add_argument('--parties', type=int, default=9, help='parties arriving per round')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rounds = int(args.hours * 60 / args.round_minutes)
+    capacity = args.courts * MAX_PLAYERS * rounds
+    print(f"{args.courts} courts, {rounds} rounds of {args.round_minutes} min, {args.parties} parties/round")
+    for mode in ('none', 'per court', 'across courts'):
+        played = simulate(args.courts, rounds, args.parties, mode, args.seed)
+        print(f"{mode:>14}: {played / args.hours:6.1f} players on court per hour, "
+              f"utilisation {played / capacity:5.1%}")
+
+    queue = [(i, random.choice([0, 1, 1, 2, 2, 3, 4])) for i in range(500)]
+    runs = 200
+    started = time.perf_counter()
+    for _ in range(runs):
+        plan_merges(queue, MAX_PLAYERS)
+    print(f"plan_merges on 500 queue groups: {(time.perf_counter() - started) / runs * 1e6:.0f} us")
@@ -0,0 +1,89 @@
+"""Fire many simultaneous joins at one group and check it never overfills.
+
+    python -m benchmarks.concurrency --joins 300 --threads 50
+
+Runs every mode in --modes ('optimistic' = version compare-and-swap with
+retries, 'locking' = SELECT ... FOR UPDATE and no CAS or retries) against a
+fresh database and prints throughput and the final group size. Uses
+DATABASE_URL if set, otherwise a throwaway SQLite file. SQLite has no row
+locks, so there the locking mode falls back to the CAS; compare the two on
+Postgres.
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+if not os.getenv('DATABASE_URL'):
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'concurrency.db')
+os.environ.setdefault('SECRET_KEY', 'benchmark')
+
+import app as badminton
+from app import app, db, Group, User, MAX_PLAYERS, bootstrap_db
+from seed import bulk_seed
+
+def run(mode, joins, threads):
+    badminton.GROUP_CONCURRENCY = mode
+    badminton.rate_limiter.enabled = False
+
+    with app.app_context():
+        db.drop_all()
+        bootstrap_db()
+        bulk_seed(joins, 0)
+        target = Group(court_id=1, is_in_queue=True, queue_position=1)
+        db.session.add(target)
+        db.session.commit()
+        target_id = target.id
+        usernames = list(db.session.scalars(db.select(User.username).where(User.username.like('load%'))))
+
+    results = {'joined': 0, 'full': 0, 'busy': 0, 'other': 0}
+    lock = threading.Lock()
+    start_line = threading.Barrier(threads)
+
+    def worker(names):
+        client = app.test_client()
+        start_line.wait()
+        for name in names:
+            with client.session_transaction() as sess:
+                sess['user'] = name
+            data = client.post(f'/join-slot/{target_id}', headers={'X-Requested-With': 'XMLHttpRequest'}).get_json()
+            if data['success']:
+                outcome = 'joined'
+            elif data['message'] == 'Group is full':
+                outcome = 'full'
+            elif 'busy' in data['message']:
+                outcome = 'busy'
+            else:
+                outcome = 'other'
+            with lock:
+                results[outcome] += 1
+
+    chunks = [usernames[i::threads] for i in range(threads)]
+    workers = [threading.Thread(target=worker, args=(chunk,)) for chunk in chunks]
+    started = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - started
+
+    with app.app_context():
+        size = db.session.scalar(db.select(db.func.count(User.id)).where(User.group_id == target_id))
+        version = db.session.get(Group, target_id).version
+
+    ok = size <= MAX_PLAYERS and results['joined'] == size
+    print(f"{mode:>10}: {joins / elapsed:8.1f} joins/s  group size {size}/{MAX_PLAYERS}  "
+          f"version {version}  {results}  {'OK' if ok else 'INVARIANT VIOLATED'}")
+    return ok
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--joins', type=int, default=300)
+    parser.add_argument('--threads', type=int, default=50)
+    parser.add_argument('--modes', default='optimistic,locking')
+    args = parser.parse_args()
+
+    print(f"{args.joins} joins from {args.threads} threads against {os.environ['DATABASE_URL']}")
+    all_ok = all([run(mode, args.joins, args.threads) for mode in args.modes.split(',')])
+    raise SystemExit(0 if all_ok else 1)
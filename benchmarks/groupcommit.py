@@ -0,0 +1,128 @@
+"""Compare commits and mutations per second with and without group commit (GROUP_COMMIT_MS).
+
+    python -m benchmarks.groupcommit --players 200 --actions 10
+    python -m benchmarks.groupcommit --windows 0,1,3,10
+
+Every player is a greenlet with its own test client that, --actions times,
+leaves its group if it is in one, and otherwise joins a random queue group
+or creates one on a random court, as players do right after a rotation.
+Window 0 commits each request on its own; any other window batches the
+mutations that arrive within that many milliseconds. Each run starts from a
+fresh copy of the same database and prints mutations/s, database commits/s
+and the average batch, then checks that no group overfilled, that every
+player ended up where its responses said, and that no court's queue has two
+groups at the same position. Uses DATABASE_URL if set, otherwise a
+throwaway SQLite file.
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+if not os.getenv('DATABASE_URL'):
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'groupcommit.db')
+os.environ.setdefault('SECRET_KEY', 'benchmark')
+
+import gevent
+from sqlalchemy import event
+
+import app as badminton
+from app import app, db, Court, Group, User, MAX_PLAYERS, bootstrap_db
+from groupcommit import CommitBatcher
+from seed import bulk_seed
+
+XHR = {'X-Requested-With': 'XMLHttpRequest'}
+
+def reset(players, groups):
+    with app.app_context():
+        db.drop_all()
+        bootstrap_db()
+        bulk_seed(players, 0)
+        # Empty queue groups for the first joiners
+        court_ids = list(db.session.scalars(db.select(Court.id)))
+        db.session.add_all(Group(court_id=court_ids[i % len(court_ids)], is_in_queue=True,
+                                 queue_position=i // len(court_ids) + 1) for i in range(groups))
+        db.session.commit()
+        usernames = list(db.session.scalars(db.select(User.username).where(User.username.like('load%'))))
+    badminton.idempotency_cache.clear()
+    return court_ids, usernames
+
+def player(username, actions, court_ids, queue_groups, rng, counts):
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['user'] = username
+    in_group = False
+    for _ in range(actions):
+        if in_group:
+            data = client.post('/leave-group', headers=XHR).get_json()
+            in_group = not data['success']
+        elif queue_groups and rng.random() < 0.7:
+            data = client.post(f'/join-slot/{rng.choice(queue_groups)}', headers=XHR).get_json()
+            in_group = data['success']
+        else:
+            data = client.post(f'/create-new-group/{rng.choice(court_ids)}', headers=XHR).get_json()
+            in_group = data['success']
+            if in_group:
+                queue_groups.append(data['group_id'])
+        counts['ok' if data['success'] else 'rejected'] += 1
+    return username, in_group
+
+def check(expected):
+    with app.app_context():
+        over = db.session.scalar(
+            db.select(db.func.count()).select_from(
+                db.select(User.group_id).where(User.group_id != None)
+                .group_by(User.group_id).having(db.func.count(User.id) > MAX_PLAYERS).subquery()))
+        placed = dict(db.session.execute(
+            db.select(User.username, User.group_id != None).where(User.username.in_(list(expected)))).all())
+        duplicates = db.session.scalar(
+            db.select(db.func.count()).select_from(
+                db.select(Group.court_id, Group.queue_position).where(Group.is_in_queue == True)
+                .group_by(Group.court_id, Group.queue_position).having(db.func.count(Group.id) > 1).subquery()))
+    wrong = sum(bool(placed[name]) != in_group for name, in_group in expected.items())
+    return over, wrong, duplicates
+
+def run(window_ms, args):
+    court_ids, usernames = reset(args.players, args.groups)
+    with app.app_context():
+        queue_groups = list(db.session.scalars(db.select(Group.id).where(Group.is_in_queue == True)))
+        engine = db.engine
+    badminton.commit_batcher = CommitBatcher(badminton.commit_mutation_batch, window=window_ms / 1000) if window_ms else None
+
+    commits = [0]
+    def count_commit(connection):
+        commits[0] += 1
+    event.listen(engine, 'commit', count_commit)
+
+    rng = random.Random(args.seed)
+    counts = {'ok': 0, 'rejected': 0}
+    started = time.perf_counter()
+    greenlets = [gevent.spawn(player, name, args.actions, court_ids, queue_groups, random.Random(rng.random()), counts)
+                 for name in usernames]
+    gevent.joinall(greenlets, raise_error=True)
+    elapsed = time.perf_counter() - started
+    event.remove(engine, 'commit', count_commit)
+
+    over, wrong, duplicates = check(dict(g.value for g in greenlets))
+    mutations = counts['ok'] + counts['rejected']
+    batching = badminton.commit_batcher.status()['average'] if window_ms else 1
+    ok = not (over or wrong or duplicates)
+    print(f"{f'{window_ms:g} ms' if window_ms else 'off':>8}: {mutations / elapsed:8.1f} mutations/s "
+          f"{commits[0] / elapsed:8.1f} commits/s  {batching:6.1f} per batch  "
+          f"{counts['rejected']} rejected  {'OK' if ok else f'{over} overfull, {wrong} misplaced, {duplicates} clashing positions'}")
+    return ok
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--players', type=int, default=200)
+    parser.add_argument('--actions', type=int, default=10, help='join/create/leave requests per player')
+    parser.add_argument('--groups', type=int, default=20, help='empty queue groups to start with')
+    parser.add_argument('--windows', default='0,3', help='comma separated batch windows in ms; 0 is no batching')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    badminton.rate_limiter.enabled = False
+    print(f"{args.players} players x {args.actions} actions against {os.environ['DATABASE_URL']}")
+    all_ok = all([run(float(window), args) for window in args.windows.split(',')])
+    raise SystemExit(0 if all_ok else 1)
@@ -0,0 +1,94 @@
+"""Bytes per live update and decode time, verbose vs compact encodings.
+
+    python -m benchmarks.payload --courts 20 --queue 6
+
+Builds a club with --courts courts, one full group on each and --queue
+queue groups behind it, then measures every encoding /court-updates and
+/court-updates-poll can produce. Decode time is json.loads (or msgpack)
+plus expanding the compact form back to the verbose shape, as the browser
+does. It is a proxy for client cost, not a browser measurement.
+"""
+import argparse
+import gzip
+import json
+import os
+import random
+import tempfile
+import timeit
+
+if not os.getenv('DATABASE_URL'):
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'payload.db')
+os.environ.setdefault('SECRET_KEY', 'benchmark')
+
+from app import app, db, Court, Group, User, MAX_PLAYERS, bootstrap_db, default_venue_id, build_court_snapshot, encode_compact, msgpack, brotli
+
+def build_club(num_courts, queue_length):
+    db.drop_all()
+    bootstrap_db([f'Court {i}' for i in range(1, num_courts + 1)])
+    court_ids = list(db.session.scalars(db.select(Court.id)))
+    rows = []
+    for court_id in court_ids:
+        for position in range(1, queue_length + 1):
+            rows.append({'court_id': court_id, 'is_in_queue': True, 'queue_position': position})
+    db.session.execute(db.insert(Group), rows)
+    db.session.flush()
+
+    users = []
+    for group in Group.query.all():
+        size = MAX_PLAYERS if not group.is_in_queue else random.randint(1, MAX_PLAYERS)
+        for _ in range(size):
+            users.append({'username': f'player{len(users):04d}', 'password_hash': '-', 'group_id': group.id})
+    db.session.execute(db.insert(User), users)
+    db.session.commit()
+    return len(users)
+
+def expand(message, names):
+    del names[message['b']:]
+    names.extend(message['n'])
+    courts = {}
+    for name, court_id, active, queue in message['c']:
+        courts[name] = {
+            'id': court_id,
+            'active_groups': [{'id': g, 'players': [names[i] for i in p], 'is_full': len(p) >= MAX_PLAYERS}
+                              for g, p in active],
+            'queue_groups': [{'id': g, 'position': pos, 'players': [names[i] for i in p], 'is_full': len(p) >= MAX_PLAYERS,
+                              'starts_at': starts_at, 'starts_in': starts_in}
+                             for g, pos, p, starts_at, starts_in in queue]
+        }
+    return courts
+
+def measure(label, body, decode, repeat=2000):
+    per_call = min(timeit.repeat(decode, number=repeat, repeat=3)) / repeat
+    print(f"{label:<34} {len(body):>7} bytes  {per_call * 1e6:8.1f} us decode")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--courts', type=int, default=20)
+    parser.add_argument('--queue', type=int, default=6)
+    args = parser.parse_args()
+    random.seed(1)
+
+    with app.app_context():
+        players = build_club(args.courts, args.queue)
+        snapshot = build_court_snapshot(default_venue_id())
+
+    print(f"{args.courts} courts, {args.queue} queue groups each, {players} players")
+    verbose = json.dumps({'courts': snapshot}).encode()
+    measure('verbose JSON', verbose, lambda: json.loads(verbose))
+    verbose_gz = gzip.compress(verbose)
+    measure('verbose JSON + gzip', verbose_gz, lambda: json.loads(gzip.decompress(verbose_gz)))
+
+    names = {}
+    first = json.dumps(encode_compact(snapshot, names), separators=(',', ':')).encode()
+    steady = json.dumps(encode_compact(snapshot, names), separators=(',', ':')).encode()
+    measure('compact, first SSE message', first, lambda: expand(json.loads(first), []))
+    measure('compact, later SSE messages', steady, lambda: expand(json.loads(steady), list(names)))
+    first_gz = gzip.compress(first)
+    measure('compact poll + gzip', first_gz, lambda: expand(json.loads(gzip.decompress(first_gz)), []))
+
+    if brotli:
+        first_br = brotli.compress(first, quality=5)
+        measure('compact poll + brotli', first_br, lambda: expand(json.loads(brotli.decompress(first_br)), []))
+    if msgpack:
+        packed = msgpack.packb(encode_compact(snapshot, {}))
+        measure('compact poll as MessagePack', packed, lambda: expand(msgpack.unpackb(packed), []))
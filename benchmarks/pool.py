@@ -0,0 +1,117 @@
+"""Pollers and writers sharing the connection pool, with and without a read replica.
+
+    python -m benchmarks.pool --pollers 40 --writers 8 --seconds 5
+    python -m benchmarks.pool --replica --pool-size 4
+
+Pollers hit /court-updates-poll and writers join and leave queue groups,
+each from its own thread, for --seconds. With --replica, polling reads go
+to READ_DATABASE_URL, here a read-only view of the same SQLite file, so
+any write wrongly routed there fails. Prints throughput, latency, 503s
+from pool exhaustion and /admin/pool-stats for each engine.
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+parser.add_argument('--pollers', type=int, default=40)
+parser.add_argument('--writers', type=int, default=8)
+parser.add_argument('--seconds', type=float, default=5)
+parser.add_argument('--pool-size', type=int, default=4, help='DB_POOL_SIZE (and DB_READ_POOL_SIZE)')
+parser.add_argument('--replica', action='store_true', help='route polling to a read-only stand-in replica')
+args = parser.parse_args()
+
+# The app reads its database settings at import time
+path = os.path.join(tempfile.mkdtemp(), 'pool.db')
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + path)
+if args.replica and os.environ['DATABASE_URL'].startswith('sqlite:///'):
+    os.environ['READ_DATABASE_URL'] = f"sqlite:///file:{os.environ['DATABASE_URL'][len('sqlite:///'):]}?mode=ro&uri=true"
+for prefix in ('DB', 'DB_READ'):
+    os.environ[f'{prefix}_POOL_SIZE'] = str(args.pool_size)
+    os.environ[f'{prefix}_MAX_OVERFLOW'] = '0'
+    os.environ[f'{prefix}_POOL_TIMEOUT'] = '2'
+os.environ.setdefault('SECRET_KEY', 'benchmark')
+
+import app as badminton
+from app import app, db, Court, User, DEV_USERS, bootstrap_db, ensure_users, pool_metrics
+from seed import bulk_seed
+
+def setup(writers):
+    with app.app_context():
+        db.drop_all()
+        bootstrap_db()
+        ensure_users(DEV_USERS)
+        bulk_seed(writers, 40)
+        badminton.ClubState.query.first().is_active = True
+        db.session.commit()
+        usernames = list(db.session.scalars(db.select(User.username).where(User.username.like('load%'))))
+        return list(db.session.scalars(db.select(Court.id))), usernames
+
+def login(username, password):
+    client = app.test_client()
+    # Logging in needs a connection too; keep trying if the pool is exhausted
+    while client.post('/login', data={'username': username, 'password': password}).status_code == 503:
+        pass
+    return client
+
+def run():
+    badminton.rate_limiter.enabled = False
+    court_ids, usernames = setup(args.writers)
+    stop_at = time.perf_counter() + args.seconds
+    results = {'poll': [], 'write': [], 'busy': 0, 'errors': 0}
+    lock = threading.Lock()
+
+    def record(kind, started, status):
+        with lock:
+            if status == 503:
+                results['busy'] += 1
+            elif status >= 400:
+                results['errors'] += 1
+            else:
+                results[kind].append(time.perf_counter() - started)
+
+    def poller():
+        client = app.test_client()
+        while time.perf_counter() < stop_at:
+            started = time.perf_counter()
+            record('poll', started, client.get('/court-updates-poll?format=compact').status_code)
+
+    def writer(index):
+        client = login(usernames[index], 'loadtest')
+        headers = {'X-Requested-With': 'XMLHttpRequest'}
+        while time.perf_counter() < stop_at:
+            started = time.perf_counter()
+            record('write', started, client.post('/leave-group', headers=headers).status_code)
+            started = time.perf_counter()
+            court_id = court_ids[index % len(court_ids)]
+            record('write', started, client.post(f'/create-new-group/{court_id}', headers=headers).status_code)
+
+    threads = [threading.Thread(target=poller) for _ in range(args.pollers)]
+    threads += [threading.Thread(target=writer, args=(i,)) for i in range(args.writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    mode = 'primary + read replica' if args.replica else 'primary only'
+    print(f"{mode}: {args.pollers} pollers, {args.writers} writers, pool size {args.pool_size}, {args.seconds:.0f}s")
+    for kind in ('poll', 'write'):
+        latencies = sorted(results[kind])
+        if not latencies:
+            print(f"  {kind:>5}: none completed (starved)")
+            continue
+        p95 = latencies[int(len(latencies) * 0.95)]
+        print(f"  {kind:>5}: {len(latencies) / args.seconds:8.1f}/s  median {statistics.median(latencies) * 1000:6.1f} ms  "
+              f"p95 {p95 * 1000:6.1f} ms")
+    print(f"  503 (pool exhausted): {results['busy']}  other errors: {results['errors']}")
+    for name, metrics in pool_metrics.items():
+        stats = metrics.snapshot()
+        print(f"  {name:>8} pool: {stats['checkouts']} checkouts, peak {stats['peak_in_use']} in use, "
+              f"{stats['timeouts']} timeouts, {stats['connects']} connections")
+    return results['errors'] == 0
+
+if __name__ == '__main__':
+    raise SystemExit(0 if run() else 1)
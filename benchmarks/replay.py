@@ -0,0 +1,142 @@
+"""Replay a recorded request trace (REQUEST_TRACE, see tracing.py) against a fresh database.
+
+    python -m benchmarks.replay night.jsonl                 # real pacing
+    python -m benchmarks.replay night.jsonl --speed 10
+    python -m benchmarks.replay night.jsonl --speed max --repeat 3
+
+Loads the state snapshot recorded with the trace (night.jsonl.snapshot.json,
+or --snapshot) into a throwaway SQLite database, or --database, then sends
+every recorded request through the app in order, each as the user who sent
+it. At --speed N the gaps between requests are divided by N, and so are the
+imported timers, so rounds still end between the same requests; at max
+there are no gaps and timers run at normal speed, so rotations that
+depended on time passing won't happen.
+
+Logging in and out isn't replayed (each request just runs as its recorded
+user), and neither are SSE streams. Rate limits are off unless
+--rate-limits. Prints throughput and, per route, replayed against recorded
+latency, then any responses whose status differs from the recording.
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+
+parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+parser.add_argument('trace')
+parser.add_argument('--snapshot', help='state to start from (default: <trace>.snapshot.json)')
+parser.add_argument('--speed', default='1', help="pacing multiplier, or 'max' for no gaps")
+parser.add_argument('--repeat', type=int, default=1, help='replay this many times, each from the snapshot')
+parser.add_argument('--database', help='database URL to replay into (its courts, groups and users are replaced)')
+parser.add_argument('--rate-limits', action='store_true', help='keep rate limiting on')
+parser.add_argument('--mismatches', type=int, default=10, help='status mismatches to list')
+args = parser.parse_args()
+speed = None if args.speed == 'max' else float(args.speed)
+
+os.environ['DATABASE_URL'] = args.database or 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'replay.db')
+os.environ.setdefault('SECRET_KEY', 'benchmark')
+os.environ.pop('REQUEST_TRACE', None)  # don't record the replay
+
+import gevent
+import app as badminton
+from app import app, bootstrap_db, import_state
+from tracing import read_trace, snapshot_path
+
+SKIPPED_ROUTES = {'/login', '/logout'}
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+class Replayer:
+    """One test client per recorded user, so cookies (and idempotency keys) stay per user"""
+
+    def __init__(self):
+        self.clients = {}
+        self.identity = {}
+
+    def client_for(self, user, venue):
+        client = self.clients.get(user)
+        if client is None:
+            client = self.clients[user] = app.test_client()
+        if self.identity.get(user) != (user, venue):
+            with client.session_transaction() as session:
+                session.clear()
+                if user:
+                    session['user'] = user
+                if venue:
+                    session['venue'] = venue
+            self.identity[user] = (user, venue)
+        return client
+
+    def send(self, record):
+        client = self.client_for(record['user'], record['venue'])
+        options = {'query_string': record['args'], 'headers': record['headers']}
+        if record.get('json') is not None:
+            options['json'] = record['json']
+        elif record.get('form'):
+            options['data'] = record['form']
+        started = time.perf_counter()
+        response = client.open(record['path'], method=record['method'], **options)
+        response.get_data()
+        elapsed = (time.perf_counter() - started) * 1000
+        response.close()
+        return response.status_code, elapsed
+
+def replay(records, snapshot):
+    with app.app_context():
+        bootstrap_db()
+        import_state(snapshot, time_scale=1 / speed if speed else 1)
+    # A repeat sends the same Idempotency-Keys; they must run, not be answered from memory
+    badminton.idempotency_cache.clear()
+
+    replayer = Replayer()
+    replayed, recorded, mismatches = {}, {}, []
+    behind = 0.0
+    first = records[0]['t']
+    started = time.perf_counter()
+    for record in records:
+        if speed:
+            delay = started + (record['t'] - first) / speed - time.perf_counter()
+            behind = max(behind, -delay)
+            # gevent.sleep, so the rotation scheduler's greenlets get to run
+            gevent.sleep(max(0, delay))
+        else:
+            gevent.sleep(0)
+        status, elapsed = replayer.send(record)
+        route = f"{record['method']} {record['route'] or record['path']}"
+        replayed.setdefault(route, []).append(elapsed)
+        recorded.setdefault(route, []).append(record['ms'])
+        if status != record['status']:
+            mismatches.append((record['path'], record['user'], record['status'], status))
+    return time.perf_counter() - started, replayed, recorded, mismatches, behind
+
+def run():
+    if not args.rate_limits:
+        badminton.rate_limiter.enabled = False
+    with open(args.snapshot or snapshot_path(args.trace)) as f:
+        snapshot = json.load(f)
+    records = [r for r in read_trace(args.trace) if not r['stream'] and r['route'] not in SKIPPED_ROUTES]
+    if not records:
+        print('Nothing to replay')
+        return False
+    span = records[-1]['t'] - records[0]['t']
+    print(f"{len(records)} requests over {span:.0f}s recorded, replaying at {f'{speed:g}x' if speed else 'max speed'}")
+
+    for run_number in range(1, args.repeat + 1):
+        seconds, replayed, recorded, mismatches, behind = replay(records, snapshot)
+        print(f"run {run_number}: {seconds:.2f}s, {len(records) / seconds:.1f} requests/s"
+              + (f", at most {behind * 1000:.0f} ms behind schedule" if speed else ''))
+        print(f"  {'route':<45} {'count':>6} {'p50 ms':>8} {'p95 ms':>8} {'recorded p50':>13} {'p95':>8}")
+        for route, times in sorted(replayed.items(), key=lambda item: -sum(item[1])):
+            print(f"  {route:<45} {len(times):6d} {statistics.median(times):8.2f} {percentile(times, 0.95):8.2f} "
+                  f"{statistics.median(recorded[route]):13.2f} {percentile(recorded[route], 0.95):8.2f}")
+        print(f"  {len(mismatches)} responses with a different status than recorded")
+        for path, user, expected, got in mismatches[:args.mismatches]:
+            print(f"    {path} as {user}: recorded {expected}, replayed {got}")
+    return True
+
+if __name__ == '__main__':
+    raise SystemExit(0 if run() else 1)
@@ -0,0 +1,159 @@
+"""Idle SSE subscribers under gevent (app.py) and asyncio (asgi.py): memory and fan-out.
+
+    python -m benchmarks.subscribers --step 250 --max 2000
+    python -m benchmarks.subscribers --modes asyncio --step 1000 --max 10000
+
+Starts each server in its own process on a throwaway SQLite file, then opens
+/court-updates connections --step at a time. After each step it waits for
+every connection's first event, records the server's resident memory, then
+changes a queue and times how long until every subscriber has the change.
+Reports memory per idle connection and the most subscribers that were all
+served within --deadline seconds. Stops a mode at the first step that
+misses the deadline or fails to connect.
+
+The asyncio mode needs uvicorn and aiosqlite installed.
+"""
+import argparse
+import asyncio
+import os
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+parser.add_argument('--modes', default='gevent,asyncio', help='comma-separated: gevent, asyncio')
+parser.add_argument('--step', type=int, default=250, help='connections opened per step')
+parser.add_argument('--max', type=int, default=2000, help='stop after this many connections')
+parser.add_argument('--deadline', type=float, default=3, help='seconds a change may take to reach everyone')
+parser.add_argument('--port', type=int, default=5077)
+args = parser.parse_args()
+
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'subscribers.db')
+os.environ.setdefault('SECRET_KEY', 'benchmark')
+os.environ['RATE_LIMIT_ENABLED'] = '0'
+
+from app import app, db, Court, Group, bootstrap_db, ensure_users, DEV_USERS
+
+GEVENT_SERVER = """
+import sys
+from gevent import monkey; monkey.patch_all()
+from gevent.pywsgi import WSGIServer
+from app import app
+WSGIServer(('127.0.0.1', int(sys.argv[1])), app, log=None, backlog=2048).serve_forever()
+"""
+
+def server_command(mode, port):
+    if mode == 'gevent':
+        return [sys.executable, '-c', GEVENT_SERVER, str(port)]
+    return [sys.executable, '-m', 'uvicorn', 'asgi:app', '--port', str(port), '--backlog', '2048',
+            '--log-level', 'warning', '--no-access-log']
+
+def resident_kb(pid):
+    with open(f'/proc/{pid}/status') as status:
+        for line in status:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+
+def wait_for_port(port, timeout=20):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+def change_queue(position):
+    with app.app_context():
+        court_id = db.session.scalar(db.select(Court.id).order_by(Court.id).limit(1))
+        db.session.add(Group(court_id=court_id, is_in_queue=True, queue_position=position))
+        db.session.commit()
+
+class Subscriber:
+    """One /court-updates connection, noting when each event arrives"""
+
+    def __init__(self, port):
+        self.port = port
+        self.last_event = None
+        self.task = None
+
+    async def run(self):
+        reader, writer = await asyncio.open_connection('127.0.0.1', self.port, limit=2 ** 20)
+        writer.write(b'GET /court-updates?format=compact HTTP/1.1\r\nHost: localhost\r\n\r\n')
+        await writer.drain()
+        try:
+            while True:
+                # Chunk framing sits between events, so look for the event itself
+                chunk = await reader.readuntil(b'\n\n')
+                if b'data: ' in chunk:
+                    self.last_event = time.perf_counter()
+        finally:
+            writer.close()
+
+async def wait_until(condition, timeout):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if condition():
+            return True
+        await asyncio.sleep(0.01)
+    return condition()
+
+async def measure(mode):
+    process = subprocess.Popen(server_command(mode, args.port))
+    try:
+        if not wait_for_port(args.port):
+            print(f"{mode}: server didn't start")
+            return
+        await asyncio.sleep(1)
+        baseline = resident_kb(process.pid)
+        subscribers = []
+        served = 0
+        position = 0
+        print(f"{mode}: {baseline / 1024:.1f} MB resident before any subscriber")
+        while len(subscribers) < args.max:
+            batch = [Subscriber(args.port) for _ in range(args.step)]
+            for subscriber in batch:
+                subscriber.task = asyncio.create_task(subscriber.run())
+            subscribers += batch
+            connected = await wait_until(lambda: all(s.last_event or s.task.done() for s in batch), args.deadline * 5)
+            failed = sum(1 for s in subscribers if s.task.done())
+            if not connected or failed:
+                print(f"  {len(subscribers):6d} subscribers: {failed} failed to connect or get a first event")
+                break
+            await asyncio.sleep(1)
+            per_connection = (resident_kb(process.pid) - baseline) / len(subscribers)
+
+            position += 1
+            changed_at = time.perf_counter()
+            change_queue(position)
+            delivered = await wait_until(
+                lambda: all(s.last_event and s.last_event >= changed_at for s in subscribers), args.deadline)
+            latency = max((s.last_event or changed_at) for s in subscribers) - changed_at
+            print(f"  {len(subscribers):6d} subscribers: {per_connection:6.1f} KB each, "
+                  f"change reached all in {latency * 1000:7.0f} ms{'' if delivered else ' (missed deadline)'}")
+            if not delivered:
+                break
+            served = len(subscribers)
+        print(f"  {mode}: {served} concurrent subscribers served within {args.deadline:.0f}s")
+        for subscriber in subscribers:
+            subscriber.task.cancel()
+        await asyncio.gather(*(s.task for s in subscribers), return_exceptions=True)
+    finally:
+        process.terminate()
+        process.wait()
+
+if __name__ == '__main__':
+    # Both ends need a descriptor per connection
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    with app.app_context():
+        db.drop_all()
+        bootstrap_db()
+        ensure_users(DEV_USERS)
+    for mode in args.modes.split(','):
+        asyncio.run(measure(mode))
@@ -0,0 +1,144 @@
+"""Many venues in one process: snapshot cost and live-update latency per venue.
+
+    python -m benchmarks.venues --venues 50 --subscribers 20 --busy-groups 2000
+
+Creates --venues venues with four courts each, one of them busy (its
+queues hold --busy-groups full groups), then:
+
+  1. times build_court_snapshot() for a quiet venue and for the busy one,
+     showing a quiet venue's cost doesn't depend on the busy venue's rows;
+  2. attaches --subscribers SSE-style subscribers to every venue's live
+     channel for --seconds, counting how many snapshots were built (one per
+     venue per interval, whatever the subscriber count);
+  3. changes a quiet venue's queue and measures how long until its
+     subscribers see the change, with every other channel running.
+
+Uses DATABASE_URL if set, otherwise a throwaway SQLite file.
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+import timeit
+
+if not os.getenv('DATABASE_URL'):
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'venues.db')
+os.environ.setdefault('SECRET_KEY', 'benchmark')
+
+import gevent
+import app as badminton
+from app import app, db, Court, Group, User, Venue, MAX_PLAYERS, bootstrap_db, add_venue_courts, channel_for
+
+def build_venues(num_venues, busy_groups):
+    db.drop_all()
+    bootstrap_db()
+    for i in range(2, num_venues + 1):
+        db.session.add(Venue(slug=f'venue{i}', name=f'Venue {i}'))
+    db.session.flush()
+    venue_ids = list(db.session.scalars(db.select(Venue.id).order_by(Venue.id)))
+    for venue_id in venue_ids[1:]:
+        add_venue_courts(venue_id, ['Court 1', 'Court 2', 'Court 3', 'Court 4'])
+    db.session.flush()
+
+    # The first venue is the busy one
+    busy = venue_ids[0]
+    court_ids = list(db.session.scalars(db.select(Court.id).where(Court.venue_id == busy)))
+    db.session.execute(db.insert(Group), [{
+        'court_id': court_ids[i % len(court_ids)],
+        'is_in_queue': True,
+        'queue_position': i // len(court_ids) + 1
+    } for i in range(busy_groups)])
+    db.session.flush()
+    group_ids = list(db.session.scalars(
+        db.select(Group.id).where(Group.court_id.in_(court_ids), Group.is_in_queue == True)
+    ))
+    db.session.execute(db.insert(User), [{
+        'username': f'busy{i}',
+        'password_hash': '-',
+        'group_id': group_ids[i // MAX_PLAYERS]
+    } for i in range(len(group_ids) * MAX_PLAYERS)])
+    db.session.commit()
+    return busy, venue_ids[1:]
+
+def time_snapshot(venue_id, repeat):
+    with app.app_context():
+        badminton.build_court_snapshot(venue_id)  # warm the venue's wait estimates
+        runs = timeit.repeat(lambda: badminton.build_court_snapshot(venue_id), number=1, repeat=repeat)
+    return statistics.median(runs) * 1000
+
+def run_channels(venue_ids, subscribers, seconds):
+    builds = {venue_id: 0 for venue_id in venue_ids}
+    original = badminton.build_court_snapshot
+
+    def counting_snapshot(venue_id):
+        builds[venue_id] += 1
+        return original(venue_id)
+
+    badminton.build_court_snapshot = counting_snapshot
+    received = {}
+
+    def subscriber(venue_id, index):
+        channel = channel_for(venue_id)
+        queue = channel.subscribe()
+        try:
+            while True:
+                court_data = queue.get()
+                received[(venue_id, index)] = (time.perf_counter(), court_data)
+        finally:
+            channel.unsubscribe(queue)
+
+    greenlets = [gevent.spawn(subscriber, venue_id, i) for venue_id in venue_ids for i in range(subscribers)]
+    gevent.sleep(seconds)
+    badminton.build_court_snapshot = original
+    return greenlets, builds, received
+
+def change_latency(venue_id, subscribers, received, samples):
+    """Seconds from a committed queue change until every subscriber of venue_id has it"""
+    latencies = []
+    with app.app_context():
+        court_id = db.session.scalar(db.select(Court.id).where(Court.venue_id == venue_id).limit(1))
+    for position in range(1, samples + 1):
+        with app.app_context():
+            db.session.add(Group(court_id=court_id, is_in_queue=True, queue_position=position))
+            db.session.commit()
+        changed_at = time.perf_counter()
+        deadline = changed_at + 10
+        while time.perf_counter() < deadline:
+            gevent.sleep(0.01)
+            seen = [received.get((venue_id, i)) for i in range(subscribers)]
+            if all(entry and entry[0] >= changed_at for entry in seen):
+                latencies.append(max(entry[0] for entry in seen) - changed_at)
+                break
+    return latencies
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--venues', type=int, default=50)
+    parser.add_argument('--subscribers', type=int, default=20, help='SSE subscribers per venue')
+    parser.add_argument('--busy-groups', type=int, default=2000, help='queue groups at the busy venue')
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--samples', type=int, default=5, help='queue changes to time')
+    args = parser.parse_args()
+
+    with app.app_context():
+        busy, quiet = build_venues(args.venues, args.busy_groups)
+    print(f"{args.venues} venues, busy venue has {args.busy_groups} queue groups, against {os.environ['DATABASE_URL']}")
+
+    print(f"snapshot, quiet venue: {time_snapshot(quiet[0], 20):8.2f} ms")
+    print(f"snapshot, busy venue:  {time_snapshot(busy, 5):8.2f} ms")
+
+    all_venues = [busy] + quiet
+    greenlets, builds, received = run_channels(all_venues, args.subscribers, args.seconds)
+    total = sum(builds.values())
+    print(f"{len(all_venues) * args.subscribers} subscribers for {args.seconds:.0f}s: {total} snapshots built "
+          f"({total / args.seconds / len(all_venues):.2f} per venue per second)")
+
+    latencies = change_latency(quiet[-1], args.subscribers, received, args.samples)
+    gevent.killall(greenlets)
+    if latencies:
+        print(f"change -> all {args.subscribers} subscribers of a quiet venue: "
+              f"median {statistics.median(latencies) * 1000:.0f} ms, max {max(latencies) * 1000:.0f} ms "
+              f"({len(latencies)}/{args.samples} seen)")
+    else:
+        print("no change was delivered")
@@ -0,0 +1,48 @@
+# compaction.py
+# Merging partial queue groups.
+#
+# Emptied groups are kept around on purpose (see leave_group), so queues
+# fill up with groups of one or two that then play under-filled. A
+# compaction pass folds later partial groups into the earliest earlier
+# group that has room for all of them. Groups are never split, so friends
+# who queued together stay together. Players only ever move forward, and
+# groups that aren't merged keep their relative order. Empty queue groups
+# are dropped, since promoting one wastes a whole round.
+from collections import deque
+
+def plan_merges(queue, capacity):
+    """Plan merges for one queue in O(len(queue) * capacity).
+
+    queue: [(group_id, player_count), ...] in queue order (for cross-court
+    compaction, every court's groups interleaved by position).
+    Returns (merges, empty): merges is [(source_group_id, target_group_id)]
+    meaning all of source's players join target, and empty lists the group
+    ids with no players. Every source and empty group should be deleted.
+    """
+    # with_room[n]: groups with at least n free seats, earliest first. A group
+    # goes into every deque it qualifies for when it opens; once merges fill
+    # it past a deque's threshold it's stale there and is dropped on sight.
+    with_room = [deque() for _ in range(capacity)]
+    size = {}
+    merges = []
+    empty = []
+
+    for group_id, players in queue:
+        if players == 0:
+            empty.append(group_id)
+            continue
+
+        candidates = with_room[players] if players < capacity else None
+        while candidates and capacity - size[candidates[0]] < players:
+            candidates.popleft()
+
+        if candidates:
+            target = candidates[0]
+            merges.append((group_id, target))
+            size[target] += players
+        else:
+            size[group_id] = players
+            for room in range(1, capacity - players + 1):
+                with_room[room].append(group_id)
+
+    return merges, empty
@@ -0,0 +1,130 @@
+# dbpool.py
+# Connection pool settings, read/write routing and pool metrics.
+#
+# Under gevent, greenlets are cheap but database connections aren't: the pool
+# should be sized for concurrent database work, not concurrent clients, and
+# a request that can't get a connection should fail fast instead of queueing
+# behind long-lived streams. Settings come from the environment:
+#
+#   DB_POOL_SIZE / DB_MAX_OVERFLOW / DB_POOL_TIMEOUT / DB_POOL_RECYCLE
+#   DB_READ_POOL_SIZE / ... the same for the read replica, if any
+#
+# Set READ_DATABASE_URL to send snapshot reads and polling to a read replica
+# (see RoutingSession). Locally, a read-only view of the same SQLite file is a
+# good stand-in, since anything wrongly routed to it fails loudly:
+#
+#   DATABASE_URL=sqlite:////tmp/badminton.db
+#   READ_DATABASE_URL='sqlite:///file:/tmp/badminton.db?mode=ro&uri=true'
+import os
+import threading
+
+from sqlalchemy import event
+from flask_sqlalchemy.session import Session
+
+REPLICA = 'replica'  # bind key of the read replica
+
+def engine_options(url, prefix='DB'):
+    """Pool settings for url from {prefix}_POOL_SIZE etc."""
+    if not url or url in ('sqlite://', 'sqlite:///:memory:'):
+        return {}  # in-memory SQLite uses a single shared connection
+    return {
+        'pool_size': int(os.getenv(f'{prefix}_POOL_SIZE', 10)),
+        'max_overflow': int(os.getenv(f'{prefix}_MAX_OVERFLOW', 10)),
+        'pool_timeout': float(os.getenv(f'{prefix}_POOL_TIMEOUT', 5)),
+        'pool_recycle': int(os.getenv(f'{prefix}_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': True,
+    }
+
+def make_driver_cooperative(url):
+    """psycopg2 blocks the whole gevent hub unless it's told to yield"""
+    if not url or not url.startswith('postgres'):
+        return False
+    try:
+        from gevent import monkey
+        from psycogreen.gevent import patch_psycopg  # optional dependency
+    except ImportError:
+        return False
+    if not monkey.is_module_patched('socket'):
+        return False
+    patch_psycopg()
+    return True
+
+class RoutingSession(Session):
+    """Flask-SQLAlchemy session that reads from the replica bind while
+    session.info['read_only'] is set. Flushes and explicit INSERT/UPDATE/
+    DELETE statements always go to the primary."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None
+                and self.info.get('read_only')
+                and not self._flushing
+                and not getattr(clause, 'is_dml', False)):
+            engines = self._db.engines
+            if REPLICA in engines:
+                return engines[REPLICA]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+def pool_load(engine):
+    """Fraction of engine's pool capacity checked out right now, overflow
+    included; 0 for pools without a fixed size (in-memory SQLite)"""
+    pool = engine.pool
+    if not hasattr(pool, 'checkedout'):
+        return 0.0
+    capacity = pool.size() + max(getattr(pool, '_max_overflow', 0), 0)
+    return pool.checkedout() / capacity if capacity else 0.0
+
+class PoolMetrics:
+    """Checkouts, peak concurrent use and failures of one engine's pool"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.checkouts = 0
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.connects = 0
+        self.invalidated = 0
+        self.timeouts = 0
+        self.lock = threading.Lock()
+        event.listen(engine, 'connect', self._on_connect)
+        event.listen(engine, 'checkout', self._on_checkout)
+        event.listen(engine, 'checkin', self._on_checkin)
+        event.listen(engine, 'invalidate', self._on_invalidate)
+
+    def _on_connect(self, *args):
+        with self.lock:
+            self.connects += 1
+
+    def _on_checkout(self, *args):
+        with self.lock:
+            self.checkouts += 1
+            self.in_use += 1
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+
+    def _on_checkin(self, *args):
+        with self.lock:
+            self.in_use = max(0, self.in_use - 1)
+
+    def _on_invalidate(self, *args):
+        with self.lock:
+            self.invalidated += 1
+
+    def timed_out(self):
+        with self.lock:
+            self.timeouts += 1
+
+    def snapshot(self):
+        pool = self.engine.pool
+        stats = {
+            'url': self.engine.url.render_as_string(hide_password=True),
+            'pool': type(pool).__name__,
+            'checkouts': self.checkouts,
+            'in_use': self.in_use,
+            'peak_in_use': self.peak_in_use,
+            'connects': self.connects,
+            'invalidated': self.invalidated,
+            'timeouts': self.timeouts,
+        }
+        for name in ('size', 'checkedin', 'checkedout', 'overflow'):
+            if hasattr(pool, name):
+                stats[name] = getattr(pool, name)()
+        return stats
@@ -0,0 +1,80 @@
+# groupcommit.py
+# Group commit for short write transactions under gevent. Right after a
+# rotation dozens of players join and leave within a second, and each of
+# those requests committing on its own means one fsync each. A
+# CommitBatcher collects the work that arrives within a few milliseconds of
+# each other and hands it to one commit_batch() call, which is expected to
+# apply it all in a single transaction. Every submitter waits for that
+# commit and gets its own item's result.
+#
+# The waiting uses gevent primitives, so submitters must be greenlets of
+# the same hub (gevent workers), not OS threads.
+import time
+
+import gevent
+from gevent.event import AsyncResult
+from gevent.queue import Queue, Empty
+
+class CommitBatcher:
+    """Feeds batches of submitted items to commit_batch(items), which returns
+    one result per item; a result that is an exception is raised in its
+    submitter instead of returned. One greenlet does the committing, started
+    on the first submit."""
+
+    def __init__(self, commit_batch, window=0.003, max_batch=50):
+        self.commit_batch = commit_batch
+        self.window = window
+        self.max_batch = max_batch
+        self.queue = Queue()
+        self.greenlet = None
+        self.batches = 0
+        self.items = 0
+        self.largest = 0
+
+    def submit(self, item):
+        waiter = AsyncResult()
+        self.queue.put((item, waiter))
+        if self.greenlet is None:
+            self.greenlet = gevent.spawn(self.run)
+        result = waiter.get()
+        if isinstance(result, BaseException):
+            raise result
+        return result
+
+    def next_batch(self):
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except Empty:
+                break
+        return batch
+
+    def run(self):
+        try:
+            while True:
+                batch = self.next_batch()
+                try:
+                    results = self.commit_batch([item for item, _ in batch])
+                except Exception as error:
+                    results = [error] * len(batch)
+                self.batches += 1
+                self.items += len(batch)
+                self.largest = max(self.largest, len(batch))
+                for (_, waiter), result in zip(batch, results):
+                    waiter.set(result)
+        finally:
+            self.greenlet = None
+
+    def status(self):
+        return {
+            'window_ms': self.window * 1000,
+            'batches': self.batches,
+            'items': self.items,
+            'largest': self.largest,
+            'average': round(self.items / self.batches, 2) if self.batches else 0,
+        }
@@ -0,0 +1,236 @@
+# profiling.py
+# On-demand diagnostics for a session that bogs down, all off by default:
+#
+#   SamplingProfiler  samples every thread's stack for N seconds and produces
+#                     collapsed stacks ("a;b;c count" lines), the input format
+#                     of flamegraph.pl and speedscope
+#   SlowQueryLog      records SQL statements slower than a threshold with the
+#                     app line that issued them, via SQLAlchemy cursor events
+#   BlockingMonitor   counts how long gevent's hub was kept from switching
+#                     greenlets, via gevent's monitoring thread
+#
+# Nothing is hooked in until enabled: a disabled profiler has no thread, a
+# disabled query log has no event listeners, and the blocking monitor only
+# starts gevent's monitoring thread while on.
+import os
+import sys
+import time
+import traceback
+import warnings
+from collections import Counter, deque
+from datetime import datetime
+
+import gevent
+import zope.event  # installed with gevent
+from gevent.events import EventLoopBlocked
+from gevent._monitor import MonitorWarning
+from gevent.monkey import get_original
+from sqlalchemy import event
+
+# The sampler must be a real OS thread even when gevent has patched threading
+_start_new_thread = get_original('_thread', 'start_new_thread')
+_get_ident = get_original('_thread', 'get_ident')
+_thread_sleep = get_original('time', 'sleep')
+
+def frame_name(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+class SamplingProfiler:
+    """Wall-clock stack sampler. Under gevent all greenlets share one thread,
+    so a sample is whatever greenlet held the hub at that moment."""
+
+    def __init__(self):
+        self.running = False
+        self.counts = None      # collapsed stack -> samples, once a run finishes
+        self.samples = 0
+        self.started_at = None
+        self.seconds = 0
+        self.interval = 0
+
+    def start(self, seconds, interval=0.005):
+        if self.running:
+            return False
+        self.running = True
+        self.samples = 0
+        self.started_at = time.time()
+        self.seconds = seconds
+        self.interval = interval
+        _start_new_thread(self._run, (seconds, interval))
+        return True
+
+    def _run(self, seconds, interval):
+        # Counted privately and published at the end, so readers never see
+        # a Counter that's being written to from this thread
+        counts = Counter()
+        own = _get_ident()
+        deadline = time.monotonic() + seconds
+        try:
+            while time.monotonic() < deadline:
+                for ident, frame in sys._current_frames().items():
+                    if ident == own:
+                        continue
+                    stack = []
+                    while frame is not None:
+                        stack.append(frame_name(frame))
+                        frame = frame.f_back
+                    counts[';'.join(reversed(stack))] += 1
+                    self.samples += 1
+                _thread_sleep(interval)
+        finally:
+            self.counts = counts
+            self.running = False
+
+    def collapsed(self):
+        """The last finished run as collapsed-stack text, hottest first"""
+        return ''.join(f"{stack} {count}\n" for stack, count in (self.counts or Counter()).most_common())
+
+    def status(self):
+        return {
+            'running': self.running,
+            'started_at': self.started_at,
+            'seconds': self.seconds,
+            'interval_ms': self.interval * 1000,
+            'samples': self.samples,
+            'profile_ready': self.counts is not None and not self.running,
+        }
+
+class SlowQueryLog:
+    """The latest slow SQL statements of some engines, with their call sites"""
+
+    def __init__(self, engines, root, keep=50):
+        self.engines = engines
+        self.root = root  # frames under here (and not in this file) count as call sites
+        self.enabled = False
+        self.threshold = 0.1
+        self.queries = deque(maxlen=keep)
+        self.total = 0
+
+    def enable(self, threshold):
+        self.threshold = threshold
+        if not self.enabled:
+            for engine in self.engines:
+                event.listen(engine, 'before_cursor_execute', self._before)
+                event.listen(engine, 'after_cursor_execute', self._after)
+                event.listen(engine, 'handle_error', self._failed)
+            self.enabled = True
+
+    def disable(self):
+        if self.enabled:
+            for engine in self.engines:
+                event.remove(engine, 'before_cursor_execute', self._before)
+                event.remove(engine, 'after_cursor_execute', self._after)
+                event.remove(engine, 'handle_error', self._failed)
+            self.enabled = False
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    def _failed(self, context):
+        # A failed statement never reaches _after; drop its start time
+        starts = context.connection.info.get('query_start') if context.connection else None
+        if starts:
+            starts.pop()
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get('query_start')
+        if not starts:
+            return  # enabled mid-statement
+        elapsed = time.perf_counter() - starts.pop()
+        if elapsed < self.threshold:
+            return
+        self.total += 1
+        self.queries.append({
+            'at': datetime.now().isoformat(timespec='seconds'),
+            'ms': round(elapsed * 1000, 1),
+            'statement': ' '.join(statement.split())[:500],
+            'database': conn.engine.url.render_as_string(hide_password=True),
+            'call_site': self._call_site(),
+        })
+
+    def _call_site(self):
+        """The innermost app frame (file:line in function) that led here"""
+        for frame in reversed(traceback.extract_stack()):
+            if (frame.filename.startswith(self.root) and frame.filename != __file__
+                    and 'site-packages' not in frame.filename):
+                return f"{os.path.relpath(frame.filename, self.root)}:{frame.lineno} in {frame.name}"
+        return None
+
+    def status(self):
+        return {
+            'enabled': self.enabled,
+            'threshold_ms': self.threshold * 1000,
+            'total': self.total,
+            'queries': list(reversed(self.queries)),
+        }
+
+class BlockingMonitor:
+    """Time the gevent hub spent unable to switch greenlets.
+
+    gevent's monitoring thread checks every threshold seconds whether the
+    hub has switched since its last look and reports an EventLoopBlocked
+    event if not; each report means at least threshold seconds of blocking,
+    so blocked_seconds is a lower bound. Only meaningful when serving under
+    gevent.
+    """
+
+    def __init__(self, keep=20):
+        self.enabled = False
+        self.threshold = 0.1
+        self.reports = deque(maxlen=keep)
+        self.events = 0
+        self.blocked_seconds = 0.0
+        self.hub = None
+
+    def enable(self, threshold):
+        gevent.config.max_blocking_time = threshold
+        gevent.config.print_blocking_reports = False
+        self.threshold = threshold
+        if self.enabled:
+            return
+        gevent.config.monitor_thread = True
+        if self._on_event not in zope.event.subscribers:
+            zope.event.subscribers.append(self._on_event)
+        self.hub = gevent.get_hub()
+        if self.hub.periodic_monitoring_thread is not None and not self.hub.periodic_monitoring_thread.should_run:
+            self.hub.periodic_monitoring_thread = None
+        with warnings.catch_warnings():
+            # It also watches memory if psutil is installed, and warns if not
+            warnings.simplefilter('ignore', MonitorWarning)
+            # The monitoring thread stops for good if it finds the hub not
+            # started yet, so make sure it is (a started hub also starts it)
+            gevent.sleep(0)
+            self.hub.start_periodic_monitoring_thread()
+        self.enabled = True
+
+    def disable(self):
+        if not self.enabled:
+            return
+        if self._on_event in zope.event.subscribers:
+            zope.event.subscribers.remove(self._on_event)
+        if self.hub.periodic_monitoring_thread is not None:
+            self.hub.periodic_monitoring_thread.kill()
+            self.hub.periodic_monitoring_thread = None
+        gevent.config.monitor_thread = False
+        self.hub = None
+        self.enabled = False
+
+    def _on_event(self, gevent_event):
+        if not isinstance(gevent_event, EventLoopBlocked):
+            return
+        self.events += 1
+        self.blocked_seconds += gevent_event.blocking_time
+        self.reports.append({
+            'at': datetime.now().isoformat(timespec='seconds'),
+            'greenlet': repr(gevent_event.greenlet),
+            'report': [line for line in gevent_event.info if line.strip()][:60],
+        })
+
+    def status(self):
+        return {
+            'enabled': self.enabled,
+            'threshold_ms': self.threshold * 1000,
+            'events': self.events,
+            'blocked_seconds': round(self.blocked_seconds, 3),
+            'reports': list(reversed(self.reports)),
+        }
@@ -0,0 +1,103 @@
+# ratelimit.py
+# Token-bucket rate limiting for the Flask app.
+#
+# Each bucket holds up to `capacity` tokens and refills at `rate` tokens per
+# second. A request spends one token; when the bucket is empty the request is
+# rejected and told how long to wait. Buckets live in a store: MemoryStore
+# keeps them in this process, RedisStore shares them between workers.
+import threading
+import time
+
+class MemoryStore:
+    """In-process bucket store. Cheap, but each worker counts separately."""
+
+    def __init__(self, max_keys=10000):
+        self.buckets = {}  # key -> (tokens, last_refill, seconds to refill completely)
+        self.max_keys = max_keys
+        self.lock = threading.Lock()
+
+    def take(self, key, capacity, rate, now=None):
+        """Spend one token. Returns (allowed, seconds until next token)"""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            tokens, last, _ = self.buckets.get(key, (capacity, now, 0))
+            tokens = min(capacity, tokens + (now - last) * rate)
+            if tokens >= 1:
+                tokens -= 1
+                allowed, retry_after = True, 0.0
+            else:
+                allowed, retry_after = False, (1 - tokens) / rate
+            self.buckets[key] = (tokens, now, (capacity - tokens) / rate)
+
+            if len(self.buckets) > self.max_keys:
+                self._prune(now)
+        return allowed, retry_after
+
+    def _prune(self, now):
+        # A bucket that would be full again is indistinguishable from a
+        # missing one, so it can be dropped
+        stale = [key for key, (_, last, refill) in self.buckets.items() if now - last >= refill]
+        for key in stale:
+            del self.buckets[key]
+
+# Refill and spend atomically on the Redis side so workers can't race
+_REDIS_TAKE = """
+local tokens = tonumber(redis.call('HGET', KEYS[1], 't') or ARGV[1])
+local last = tonumber(redis.call('HGET', KEYS[1], 'l') or ARGV[3])
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+tokens = math.min(capacity, tokens + (now - last) * rate)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 't', tokens, 'l', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return {allowed, tostring(tokens)}
+"""
+
+class RedisStore:
+    """Bucket store shared between workers through Redis"""
+
+    def __init__(self, url, prefix='ratelimit:'):
+        import redis  # optional dependency, only needed when a shared store is configured
+        self.client = redis.Redis.from_url(url)
+        self.script = self.client.register_script(_REDIS_TAKE)
+        self.prefix = prefix
+
+    def take(self, key, capacity, rate, now=None):
+        now = time.time() if now is None else now
+        allowed, tokens = self.script(keys=[self.prefix + key], args=[capacity, rate, now])
+        if allowed:
+            return True, 0.0
+        return False, (1 - float(tokens)) / rate
+
+class RateLimiter:
+    """Applies named limits ({name: (capacity, refill per second)}) against a store"""
+
+    def __init__(self, limits, store=None, enabled=True):
+        self.limits = limits
+        self.store = store or MemoryStore()
+        self.enabled = enabled
+
+    def check(self, limit_name, identity, scope=''):
+        """Returns (allowed, retry_after) for one request by identity. Each
+        scope (the app passes the route) gets buckets of its own."""
+        if not self.enabled:
+            return True, 0.0
+        capacity, rate = self.limits[limit_name]
+        return self.store.take(f'{limit_name}:{scope}:{identity}', capacity, rate)
+
+def client_ip(remote_addr, forwarded_for, trusted_proxies):
+    """The client's address behind trusted_proxies reverse proxies, each of
+    which appended the address it got the request from to X-Forwarded-For.
+    Anything further left could have been sent by the client itself. Same
+    rule as werkzeug's ProxyFix(x_for=trusted_proxies)."""
+    if not trusted_proxies or not forwarded_for:
+        return remote_addr
+    hops = [hop.strip() for hop in forwarded_for.split(',')]
+    if len(hops) < trusted_proxies:
+        return remote_addr
+    return hops[-trusted_proxies]
@@ -1,63 +1,85 @@
 # seed.py
-from app import app, db, Court, TimerState, ClubState, User, Group
+#
+#   python seed.py                          # bootstrap + dev users (non-destructive)
+#   python seed.py --reset                  # wipe everything first
+#   python seed.py --bulk-users 5000 --bulk-groups 1000   # load-test data
+import argparse
+import time
+
+from app import app, db, Court, Group, User, MAX_PLAYERS, DEV_USERS, bootstrap_db, ensure_users
 from werkzeug.security import generate_password_hash
-with app.app_context():
-    db.drop_all()
-    db.create_all()   # Create all tables if they don't exist
-
-    # Add default courts if none exist
-    if not Court.query.first():
-        default_courts = ['Court 1', 'Court 2', 'Court 3', 'Court 4']
-        for name in default_courts:
-            court = Court(name=name)
-            db.session.add(court)
-
-    # Create default TimerState if none exists
-    if not TimerState.query.first():
-        timer_state = TimerState(is_running=False)
-        db.session.add(timer_state)
-
-    # Create default ClubState if none exists
-    if not ClubState.query.first():
-        club_state = ClubState()  # fill in default fields if needed
-        db.session.add(club_state)
-    
-    # Add admin user if not exists
-    if not User.query.filter_by(username='admin').first():
-        admin = User(
-            username='admin',
-            password_hash=generate_password_hash('adminpass'),
-            is_admin=True
-        )
-        db.session.add(admin)
-        
-    # Add test users
-    test_users = ['a', 'b', 'c']
-    for username in test_users:
-        if not User.query.filter_by(username=username).first():
-            user = User(
-                username=username,
-                password_hash=generate_password_hash(username),  # password same as username
-                is_admin=False
-            )
-            db.session.add(user)
-            
-    # Commit to create courts and users first
-    db.session.commit()
-            
-    # Create one empty active group per court
-    courts = Court.query.all()
-    for court in courts:
-        # Check if court already has an active group
-        existing_active = Group.query.filter_by(court=court, is_in_queue=False).first()
-        if not existing_active:
-            active_group = Group(
-                court=court,
-                is_in_queue=False,
-                queue_position=None
-            )
-            db.session.add(active_group)
-            
-    # Commit all changes
+
+BULK_PASSWORD = 'loadtest'
+BATCH_SIZE = 1000
+
+def bulk_seed(num_users, num_groups):
+    """Insert num_users users and num_groups queue groups in large batches.
+
+    Every bulk user shares one password hash (password 'loadtest') so seeding
+    thousands of users isn't dominated by the cost of hashing.
+    """
+    password_hash = generate_password_hash(BULK_PASSWORD)
+    offset = db.session.scalar(db.select(db.func.count(User.id)))
+
+    for start in range(0, num_users, BATCH_SIZE):
+        db.session.execute(db.insert(User), [{
+            'username': f'load{offset + i}',
+            'password_hash': password_hash,
+            'is_admin': False
+        } for i in range(start, min(start + BATCH_SIZE, num_users))])
+
+    # Spread the queue groups round-robin over the courts, appending after
+    # whatever each court already has queued
+    court_ids = list(db.session.scalars(db.select(Court.id).order_by(Court.id)))
+    next_position = dict(db.session.execute(
+        db.select(Group.court_id, db.func.max(Group.queue_position))
+        .where(Group.is_in_queue == True)
+        .group_by(Group.court_id)
+    ).all())
+    group_rows = []
+    for i in range(num_groups):
+        court_id = court_ids[i % len(court_ids)]
+        position = (next_position.get(court_id) or 0) + 1
+        next_position[court_id] = position
+        group_rows.append({'court_id': court_id, 'is_in_queue': True, 'queue_position': position})
+    for start in range(0, len(group_rows), BATCH_SIZE):
+        db.session.execute(db.insert(Group), group_rows[start:start + BATCH_SIZE])
+    db.session.flush()
+
+    # Fill the new groups with the new users, MAX_PLAYERS at a time
+    group_ids = list(db.session.scalars(
+        db.select(Group.id).order_by(Group.id.desc()).limit(num_groups)
+    ))[::-1]
+    user_ids = list(db.session.scalars(
+        db.select(User.id).where(User.group_id == None, User.username.like('load%')).order_by(User.id)
+    ))
+    assignments = [
+        {'id': user_id, 'group_id': group_ids[i // MAX_PLAYERS]}
+        for i, user_id in enumerate(user_ids[:len(group_ids) * MAX_PLAYERS])
+    ]
+    for start in range(0, len(assignments), BATCH_SIZE):
+        db.session.execute(db.update(User), assignments[start:start + BATCH_SIZE])
+
     db.session.commit()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Bootstrap and seed the database')
+    parser.add_argument('--reset', action='store_true', help='drop all tables first (destroys data!)')
+    parser.add_argument('--bulk-users', type=int, default=0, help='number of load-test users to create')
+    parser.add_argument('--bulk-groups', type=int, default=0, help='number of load-test queue groups to create')
+    args = parser.parse_args()
+
+    with app.app_context():
+        if args.reset:
+            db.drop_all()
+
+        bootstrap_db()
+        ensure_users(DEV_USERS)
+
+        if args.bulk_users or args.bulk_groups:
+            started = time.perf_counter()
+            bulk_seed(args.bulk_users, args.bulk_groups)
+            print(f"Bulk seeded {args.bulk_users} users and {args.bulk_groups} groups "
+                  f"in {time.perf_counter() - started:.2f}s")
+
     print("✅ Seeding done!")
@@ -135,35 +135,15 @@ async function refreshCourts() {
     }
 }
 
-// Test if server-sent events are working, and if not, set up manual refresh
-let sseWorkingTest = false;
+// LiveTransport (transport.js) falls back to polling on its own; while it is
+// polling, fetch a fresh snapshot soon after a court action instead of
+// waiting for the next poll
 document.addEventListener('DOMContentLoaded', () => {
-    setTimeout(() => {
-        if (!sseWorkingTest && courtManager) {
-            console.log("SSE might not be working, setting up manual refresh trigger");
-            
-            // Add a manual refresh after court actions
-            document.querySelectorAll('.court-action-form').forEach(form => {
-                const originalSubmit = form.onsubmit;
-                form.onsubmit = async function(e) {
-                    if (originalSubmit) {
-                        originalSubmit.call(this, e);
-                    }
-                    
-                    // After a short delay, manually refresh
-                    setTimeout(refreshCourts, 500);
-                };
-            });
-            
-            // Also set up periodic refresh just in case
-            setInterval(refreshCourts, 5000);
-        }
-    }, 5000); // Check after 5 seconds
-});
-
-// Update the sse test flag when a message is received
-if (courtManager && courtManager.evtSource) {
-    courtManager.evtSource.addEventListener('message', () => {
-        sseWorkingTest = true;
+    document.querySelectorAll('.court-action-form').forEach(form => {
+        form.addEventListener('submit', () => {
+            if (courtManager && courtManager.transport.mode === 'polling') {
+                setTimeout(() => courtManager.transport.poller.pollNow(), 500);
+            }
+        });
     });
-}
\ No newline at end of file
+});
\ No newline at end of file
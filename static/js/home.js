@@ -0,0 +1,237 @@
+// CourtManager (live-updates.js) polls the timer and fills in #timer; when a
+// round ends, reload to pick up the new court assignments
+document.addEventListener('timer-expired', () => location.reload());
+
+// Add event listeners for joining slots and creating groups
+document.addEventListener('DOMContentLoaded', function() {
+  // Global click handler to close leave buttons when clicking elsewhere
+  document.addEventListener('click', function(event) {
+    // Find any open leave buttons
+    const openLeaveButtons = document.querySelectorAll('.player-slot.my-slot.show-leave-button');
+    
+    // If there are open buttons, check if the click was outside them
+    openLeaveButtons.forEach(slot => {
+      // If the click was outside this slot, close the leave button
+      if (!slot.contains(event.target)) {
+        slot.classList.remove('show-leave-button');
+        
+        // Update global state
+        const playerName = slot.querySelector('.player-name')?.textContent;
+        if (playerName && window.activeLeaveSlots) {
+          window.activeLeaveSlots.delete(playerName);
+        }
+      }
+    });
+  });
+  
+  // Handle taps on player slots
+  document.querySelectorAll('.player-slot.my-slot').forEach(slot => {
+    slot.addEventListener('click', function(e) {
+      // Don't toggle if clicking directly on the leave button
+      if (e.target.classList.contains('leave-button')) {
+        return;
+      }
+      
+      // Toggle the show-leave-button class
+      this.classList.toggle('show-leave-button');
+      
+      // Store this state globally to persist through updates
+      const playerName = this.querySelector('.player-name')?.textContent;
+      if (playerName) {
+        if (!window.activeLeaveSlots) {
+          window.activeLeaveSlots = new Set();
+        }
+        
+        if (this.classList.contains('show-leave-button')) {
+          window.activeLeaveSlots.add(playerName);
+        } else {
+          window.activeLeaveSlots.delete(playerName);
+        }
+      }
+      
+      // Stop event propagation to prevent the document click handler from immediately closing it
+      e.stopPropagation();
+    });
+  });
+  
+  // Handle empty slot clicks to join a group
+  document.querySelectorAll('.player-slot.empty[data-group-id]').forEach(slot => {
+    slot.addEventListener('click', function() {
+      const groupId = this.getAttribute('data-group-id');
+      joinGroup(groupId);
+    });
+  });
+  
+  // Handle create new group buttons
+  document.querySelectorAll('.create-group-button').forEach(button => {
+    button.addEventListener('click', function() {
+      const courtId = this.getAttribute('data-court-id');
+      createNewGroup(courtId);
+    });
+  });
+});
+
+function joinGroup(groupId) {
+  // Disable the clicked slot
+  const clickedSlot = document.querySelector(`.player-slot.empty[data-group-id="${groupId}"]`);
+  if (clickedSlot) {
+    clickedSlot.style.opacity = '0.5';
+    clickedSlot.style.pointerEvents = 'none';
+  }
+
+  postPlayerAction(`/join-slot/${groupId}`)
+  .then(response => response.json())
+  .then(data => {
+    if (data.success) {
+      showFlashMessage(data.message, 'success');
+      
+      // Force an immediate refresh of the display
+      sessionStorage.setItem('forceUpdate', 'true');
+      // Immediate reload for the most reliable update
+      location.reload();
+    } else {
+      showFlashMessage(data.message, 'error');
+      
+      // Re-enable the slot if there was an error
+      if (clickedSlot) {
+        clickedSlot.style.opacity = '';
+        clickedSlot.style.pointerEvents = '';
+      }
+    }
+  })
+  .catch(error => {
+    console.error('Error joining group:', error);
+    showFlashMessage('Error joining group', 'error');
+    
+    // Re-enable the slot if there was an error
+    if (clickedSlot) {
+      clickedSlot.style.opacity = '';
+      clickedSlot.style.pointerEvents = '';
+    }
+  });
+}
+
+function createNewGroup(courtId) {
+  // Disable the clicked button
+  const clickedButton = document.querySelector(`.create-group-button[data-court-id="${courtId}"]`);
+  if (clickedButton) {
+    clickedButton.disabled = true;
+    clickedButton.textContent = 'Creating...';
+  }
+
+  postPlayerAction(`/create-new-group/${courtId}`)
+  .then(response => response.json())
+  .then(data => {
+    if (data.success) {
+      showFlashMessage(data.message, 'success');
+      
+      // Force an immediate refresh of the display
+      sessionStorage.setItem('forceUpdate', 'true');
+      // Immediate reload for the most reliable update
+      location.reload();
+    } else {
+      showFlashMessage(data.message, 'error');
+      
+      // Re-enable the button if there was an error
+      if (clickedButton) {
+        clickedButton.disabled = false;
+        clickedButton.textContent = 'Create New Group';
+      }
+    }
+  })
+  .catch(error => {
+    console.error('Error creating group:', error);
+    showFlashMessage('Error creating group', 'error');
+    
+    // Re-enable the button if there was an error
+    if (clickedButton) {
+      clickedButton.disabled = false;
+      clickedButton.textContent = 'Create New Group';
+    }
+  });
+}
+
+function leaveGroup() {
+  // Disable all leave buttons
+  document.querySelectorAll('.leave-button').forEach(button => {
+    button.disabled = true;
+    button.textContent = 'Leaving...';
+  });
+
+  postPlayerAction('/leave-group')
+  .then(response => response.json())
+  .then(data => {
+    if (data.success) {
+      showFlashMessage(data.message, 'warning');
+      
+      // Force an immediate refresh of the display
+      sessionStorage.setItem('forceUpdate', 'true');
+      // Immediate reload for the most reliable update
+      location.reload();
+    } else {
+      showFlashMessage(data.message, 'error');
+      
+      // Re-enable all leave buttons if there was an error
+      document.querySelectorAll('.leave-button').forEach(button => {
+        button.disabled = false;
+        button.textContent = 'Leave';
+      });
+    }
+  })
+  .catch(error => {
+    console.error('Error leaving group:', error);
+    showFlashMessage('Error leaving group', 'error');
+    
+    // Re-enable all leave buttons if there was an error
+    document.querySelectorAll('.leave-button').forEach(button => {
+      button.disabled = false;
+      button.textContent = 'Leave';
+    });
+  });
+}
+
+function showFlashMessage(message, category) {
+  const flashContainer = document.getElementById('flashMessages');
+  const msgElement = document.createElement('div');
+  msgElement.className = `flash-message ${category}`;
+  
+  // Create message content with truncation if needed
+  if (message.length > 60) {
+    message = message.substring(0, 57) + '...';
+  }
+  
+  msgElement.textContent = message;
+  
+  flashContainer.appendChild(msgElement);
+  
+  // Set color based on category - using more subtle, transparent colors
+  switch(category) {
+    case 'success':
+      msgElement.style.backgroundColor = 'rgba(52, 199, 89, 0.9)'; // iOS Green with transparency
+      break;
+    case 'error':
+      msgElement.style.backgroundColor = 'rgba(255, 59, 48, 0.9)'; // iOS Red with transparency
+      break;
+    case 'warning':
+      msgElement.style.backgroundColor = 'rgba(255, 149, 0, 0.9)'; // iOS Orange with transparency
+      break;
+    default:
+      msgElement.style.backgroundColor = 'rgba(0, 122, 255, 0.9)'; // iOS Blue with transparency
+      break;
+  }
+  
+  // Trigger reflow for animation to work
+  void msgElement.offsetWidth;
+  
+  // Fade in
+  msgElement.classList.add('fade-in');
+  
+  // Fade out after 3 seconds (shorter time)
+  setTimeout(() => {
+    msgElement.classList.remove('fade-in');
+    msgElement.classList.add('fade-out');
+    setTimeout(() => {
+      msgElement.remove();
+    }, 300);
+  }, 2000);  // Show for only 2 seconds
+}
@@ -1,132 +1,114 @@
 class CourtManager {
     constructor() {
-        this.connectionAttempts = 0;
-        this.maxConnectionAttempts = 5;
-        this.retryInterval = 3000; // 3 seconds
-        
         // Initialize global state for persistent mobile click state
         window.activeLeaveSlots = new Set();
         
-        this.initializeEventSource();
+        this.initializeTransport();
         this.initializeTimer();
         
         // Add global click handler for closing leave buttons
         this.setupGlobalClickHandler();
     }
 
-    initializeEventSource() {
-        this.evtSource = new EventSource('/court-updates');
-        
-        this.evtSource.onmessage = (event) => {
-            console.log("SSE message received"); // Debug log
-            this.connectionAttempts = 0; // Reset connection attempts on successful message
-            try {
-                const data = JSON.parse(event.data);
-                if (data.courts) {
-                    // First check if any user is interacting with the leave button
-                    const userInteracting = document.querySelector('.player-slot.my-slot:hover, .player-slot.my-slot.show-leave-button');
-                    if (userInteracting) {
-                        console.log("User is interacting with a leave button, skipping update");
-                        return; // Skip update if user is interacting
-                    }
-                    
-                    // Store the previous court data to compare
-                    const prevCourtData = JSON.stringify(this.courts || {});
-                    const newCourtData = JSON.stringify(data.courts);
-                    
-                    // Only update if the data has actually changed
-                    if (prevCourtData !== newCourtData) {
-                        this.updateCourtsDisplay(data.courts);
-                    } else {
-                        console.log("Court data unchanged, skipping update");
-                    }
-                }
-            } catch (err) {
-                console.error("Error parsing SSE data:", err);
-            }
-        };
-        
-        this.evtSource.onerror = (err) => {
-            console.error('EventSource failed:', err);
-            this.evtSource.close();
-            
-            // Increment connection attempts
-            this.connectionAttempts++;
-            
-            if (this.connectionAttempts < this.maxConnectionAttempts) {
-                console.log(`Retrying SSE connection (${this.connectionAttempts}/${this.maxConnectionAttempts})...`);
-                setTimeout(() => this.initializeEventSource(), this.retryInterval);
-            } else {
-                console.error("Max SSE connection attempts reached. Falling back to polling.");
-                this.startPolling();
-            }
-        };
-        
-        this.evtSource.onopen = () => {
-            console.log("SSE connection opened");
-            // If we were polling, stop it
-            if (this.pollingInterval) {
-                console.log("Stopping fallback polling");
-                clearInterval(this.pollingInterval);
-                this.pollingInterval = null;
+    // Expand a ?format=compact message (see encode_compact in app.py) back
+    // into the {courtName: {id, active_groups, queue_groups}} shape the rest
+    // of this class works with. names is the connection's username table.
+    expandCompactCourts(message, names) {
+        names.length = message.b;
+        names.push(...message.n);
+        const toGroup = (id, position, players, startsAt, startsIn) => {
+            const group = {
+                id: id,
+                players: players.map(index => names[index]),
+                is_full: players.length >= MAX_PLAYERS
+            };
+            if (position !== null) {
+                group.position = position;
+                group.starts_at = startsAt;
+                group.starts_in = startsIn;
             }
+            return group;
         };
+        const courts = {};
+        for (const [name, id, active, queue] of message.c) {
+            courts[name] = {
+                id: id,
+                active_groups: active.map(([groupId, players]) => toGroup(groupId, null, players)),
+                queue_groups: queue.map(([groupId, position, players, startsAt, startsIn]) =>
+                    toGroup(groupId, position, players, startsAt, startsIn))
+            };
+        }
+        return courts;
     }
-    
-    // Fallback to polling if SSE fails
-    startPolling() {
-        console.log("Starting fallback polling for court updates");
-        this.pollingInterval = setInterval(async () => {
-            try {
-                const response = await fetch('/court-updates-poll');
-                const data = await response.json();
-                if (data.courts) {
-                    this.updateCourtsDisplay(data.courts);
-                }
-            } catch (error) {
-                console.error('Error polling for updates:', error);
+
+    // Court snapshots arrive over SSE, or by polling when SSE keeps failing;
+    // LiveTransport (transport.js) handles the switching and backoff
+    initializeTransport() {
+        this.transport = new LiveTransport((message, names) => {
+            const courts = this.expandCompactCourts(message, names);
+            // First check if any user is interacting with the leave button
+            const userInteracting = document.querySelector('.player-slot.my-slot:hover, .player-slot.my-slot.show-leave-button');
+            if (userInteracting) {
+                console.log("User is interacting with a leave button, skipping update");
+                return; // Skip update if user is interacting
+            }
+            
+            // Only update if the data has actually changed
+            if (JSON.stringify(this.courts || {}) !== JSON.stringify(courts)) {
+                this.updateCourtsDisplay(courts);
             }
-        }, 2000); // Poll every 2 seconds
+        });
     }
 
     initializeTimer() {
-        // Get initial timer state
-        this.updateTimerDisplay();
-        // Update timer every second
-        this.timerInterval = setInterval(() => this.updateTimerDisplay(), 1000);
+        // Poll while the page is visible (pausing in the background), and
+        // count down locally in between so a slowed-down poll still shows
+        // every second
+        this.timerPoller = new Poller('/timer/status', data => this.showTimerStatus(data),
+                                      { interval: 1000, hiddenInterval: null });
+        this.timerPoller.start();
+        this.countdownInterval = setInterval(() => this.renderCountdown(), 1000);
     }
 
-    async updateTimerDisplay() {
-        try {
-            const response = await fetch('/timer/status');
-            const data = await response.json();
-            const timerElement = document.getElementById('timer');
-            if (timerElement) {
-                timerElement.textContent = this.formatTime(data.remaining);
-            }
-            
-            // If timer expired, update courts immediately
-            if (data.expired) {
-                console.log("Timer expired, updating courts...");
-                // If the data includes courts info, use it directly
-                if (data.courts) {
-                    this.updateCourtsDisplay(data.courts);
-                } else {
-                    // Otherwise fetch the latest court data
-                    try {
-                        const courtsResponse = await fetch('/court-updates-poll');
-                        const courtsData = await courtsResponse.json();
-                        if (courtsData.courts) {
-                            this.updateCourtsDisplay(courtsData.courts);
-                        }
-                    } catch (error) {
-                        console.error('Error fetching courts after timer expiration:', error);
-                    }
-                }
-            }
-        } catch (error) {
-            console.error('Error updating timer:', error);
+    showTimerStatus(data) {
+        this.timerStatus = data;
+        this.timerStatusAt = Date.now();
+        this.renderCountdown();
+        
+        // If timer expired, update courts immediately
+        if (data.expired) {
+            console.log("Timer expired, updating courts...");
+            this.updateCourtsDisplay(data.courts);
+            document.dispatchEvent(new CustomEvent('timer-expired', { detail: data }));
+        }
+    }
+
+    renderCountdown() {
+        if (!this.timerStatus || document.hidden) return;
+        const elapsed = (Date.now() - this.timerStatusAt) / 1000;
+        const countDown = (remaining, running) => running ? Math.max(0, remaining - elapsed) : remaining;
+        
+        const timerElement = document.getElementById('timer');
+        if (timerElement) {
+            timerElement.textContent = this.formatTime(countDown(this.timerStatus.remaining, this.timerStatus.running));
+        }
+        const timers = {};
+        for (const [courtId, timer] of Object.entries(this.timerStatus.timers || {})) {
+            timers[courtId] = { ...timer, remaining: countDown(timer.remaining, timer.running) };
         }
+        updateCourtTimers(timers);
+    }
+
+    // Server-side wait estimate for a queue group (see WaitEstimates in app.py)
+    formatEstimate(group) {
+        if (group.starts_at) {
+            const minutes = Math.max(0, Math.round((group.starts_at - Date.now() / 1000) / 60));
+            return minutes === 0 ? 'up next' : `~${minutes} min`;
+        }
+        if (group.starts_in !== null && group.starts_in !== undefined) {
+            return `~${Math.round(group.starts_in / 60)} min (timer paused)`;
+        }
+        return '';
     }
 
     formatTime(seconds) {
@@ -211,6 +193,7 @@ class CourtManager {
                             <div class="queue-group">
                                 <div class="queue-header">
                                     <span class="queue-number">${group.position}</span>
+                                    <span class="queue-eta">${this.formatEstimate(group)}</span>
                                 </div>
                                 
                                 <div class="queue-slots">
@@ -461,15 +444,9 @@ class CourtManager {
     }
 
     cleanup() {
-        if (this.evtSource) {
-            this.evtSource.close();
-        }
-        if (this.timerInterval) {
-            clearInterval(this.timerInterval);
-        }
-        if (this.pollingInterval) {
-            clearInterval(this.pollingInterval);
-        }
+        this.transport.close();
+        this.timerPoller.stop();
+        clearInterval(this.countdownInterval);
         
         // Remove the global click handler
         document.removeEventListener('click', this.documentClickHandler);
@@ -706,6 +683,46 @@ function initLiveUpdates() {
     }
 }
 
+// Each court runs its own timer (see CourtTimer in app.py); fill in any
+// [data-court-timer="<court id>"] element from /timer/status
+function updateCourtTimers(timers) {
+  if (!timers) return;
+  document.querySelectorAll('[data-court-timer]').forEach(element => {
+    const timer = timers[element.dataset.courtTimer];
+    if (!timer) return;
+    const mins = Math.floor(timer.remaining / 60);
+    const secs = Math.floor(timer.remaining % 60);
+    element.textContent = `${mins}:${secs.toString().padStart(2, '0')}${timer.running ? '' : ' (paused)'}`;
+  });
+}
+
+// Player actions carry a per-click idempotency key, so when a POST times out
+// on flaky Wi-Fi and is re-sent, the server replays its stored answer
+// instead of running the action a second time.
+function newIdempotencyKey() {
+  if (window.crypto && crypto.randomUUID) {
+    return crypto.randomUUID();
+  }
+  return `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+}
+
+async function postPlayerAction(url, retries = 2) {
+  const key = newIdempotencyKey();
+  for (let attempt = 0; ; attempt++) {
+    try {
+      return await fetch(url, {
+        method: 'POST',
+        headers: { 'X-Requested-With': 'XMLHttpRequest', 'Idempotency-Key': key }
+      });
+    } catch (error) {
+      // Network failure: the request may or may not have reached the server,
+      // so retry with the same key
+      if (attempt >= retries) throw error;
+      await new Promise(resolve => setTimeout(resolve, 500 * (attempt + 1)));
+    }
+  }
+}
+
 function createNewGroup(courtId) {
   console.log('Creating new group for court:', courtId);
   
@@ -742,10 +759,7 @@ function createNewGroup(courtId) {
     btn.disabled = true;
   });
   
-  fetch(`/create-new-group/${courtId}`, {
-    method: 'POST',
-    headers: { 'X-Requested-With': 'XMLHttpRequest' }
-  })
+  postPlayerAction(`/create-new-group/${courtId}`)
   .then(response => response.json())
   .then(data => {
     if (data.success) {
@@ -791,10 +805,7 @@ function joinGroup(groupId) {
     clickedSlot.style.pointerEvents = 'none';
   }
   
-  fetch(`/join-slot/${groupId}`, {
-    method: 'POST',
-    headers: { 'X-Requested-With': 'XMLHttpRequest' }
-  })
+  postPlayerAction(`/join-slot/${groupId}`)
   .then(response => response.json())
   .then(data => {
     if (data.success) {
@@ -845,10 +856,7 @@ function leaveGroup() {
     button.textContent = 'Leaving...';
   });
   
-  fetch('/leave-group', {
-    method: 'POST',
-    headers: { 'X-Requested-With': 'XMLHttpRequest' }
-  })
+  postPlayerAction('/leave-group')
   .then(response => response.json())
   .then(data => {
     if (data.success) {
@@ -993,6 +1001,7 @@ document.addEventListener('DOMContentLoaded', function() {
 async function refreshCourts() {
   try {
     const response = await fetch('/court-updates-poll');
+    if (response.status === 429) return;
     const data = await response.json();
     if (data.courts && courtManager) {
       courtManager.updateCourtsDisplay(data.courts);
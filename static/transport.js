@@ -0,0 +1,246 @@
+// Client transport for the live endpoints (/court-updates, /court-updates-poll
+// and /timer/status in app.py).
+//
+// - Pollers reschedule themselves with setTimeout after each response, so a
+//   slow server is never asked again before it has answered.
+// - The server says how often to poll in X-Poll-Interval (seconds), and can
+//   stretch that under load. Requests carry X-Page-Visibility so background
+//   tabs can be told to back off the most.
+// - Failures back off exponentially with full jitter, and Retry-After from a
+//   429/503 is honoured, so clients that failed together don't all come back
+//   at the same moment.
+// - Polls send If-None-Match; an unchanged snapshot comes back as a bodyless
+//   304.
+// - LiveTransport prefers SSE, switches to polling after repeated SSE
+//   failures, and probes SSE again later.
+
+// Full jitter: a random delay up to base * 2^failures, capped
+function jitteredBackoff(failures, base = 1000, cap = 60000) {
+    return Math.random() * Math.min(cap, base * 2 ** failures);
+}
+
+function retryAfterMs(response) {
+    const seconds = parseFloat(response.headers.get('Retry-After'));
+    return Number.isFinite(seconds) ? seconds * 1000 : 0;
+}
+
+class Poller {
+    // onData(parsed body) runs for every 200. Options:
+    //   interval        ms between polls while visible, until the server says otherwise
+    //   hiddenInterval  ms while the tab is hidden; null pauses polling instead
+    //   parse           response -> data
+    constructor(url, onData, { interval = 2000, hiddenInterval = 30000, parse = response => response.json() } = {}) {
+        this.url = url;
+        this.onData = onData;
+        this.interval = interval;
+        this.hiddenInterval = hiddenInterval;
+        this.parse = parse;
+        this.etag = null;
+        this.failures = 0;
+        this.advertised = null; // ms, from X-Poll-Interval
+        this.timeout = null;
+        this.running = false;
+        this.inFlight = false;
+        this.onVisibilityChange = () => {
+            // Coming back into view: refresh right away instead of waiting out a
+            // background interval
+            if (!document.hidden && this.running) this.pollNow();
+        };
+    }
+
+    start() {
+        if (this.running) return;
+        this.running = true;
+        document.addEventListener('visibilitychange', this.onVisibilityChange);
+        this.pollNow();
+    }
+
+    stop() {
+        this.running = false;
+        clearTimeout(this.timeout);
+        this.timeout = null;
+        document.removeEventListener('visibilitychange', this.onVisibilityChange);
+    }
+
+    pollNow() {
+        clearTimeout(this.timeout);
+        this.timeout = null;
+        if (!this.inFlight) this.tick();
+    }
+
+    schedule(delay) {
+        clearTimeout(this.timeout);
+        if (!this.running) return;
+        if (delay === null) return; // paused until the tab is visible again
+        this.timeout = setTimeout(() => this.tick(), delay);
+    }
+
+    nextDelay() {
+        if (document.hidden) {
+            if (this.hiddenInterval === null) return null;
+            return Math.max(this.hiddenInterval, this.advertised || 0);
+        }
+        return this.advertised || this.interval;
+    }
+
+    async tick() {
+        if (!this.running) return;
+        if (document.hidden && this.hiddenInterval === null) return this.schedule(null);
+
+        this.inFlight = true;
+        let delay;
+        try {
+            const headers = { 'X-Page-Visibility': document.visibilityState };
+            if (this.etag) headers['If-None-Match'] = this.etag;
+            const response = await fetch(this.url, { headers, cache: 'no-store' });
+
+            const advertised = parseFloat(response.headers.get('X-Poll-Interval'));
+            if (Number.isFinite(advertised)) this.advertised = advertised * 1000;
+
+            if (response.status === 429 || response.status >= 500) {
+                this.failures++;
+                delay = Math.max(retryAfterMs(response), jitteredBackoff(this.failures));
+            } else {
+                this.failures = 0;
+                if (response.status === 200) {
+                    this.etag = response.headers.get('ETag');
+                    this.onData(await this.parse(response));
+                }
+                // A 304 means nothing changed; anything else isn't worth retrying sooner
+                delay = this.nextDelay();
+            }
+        } catch (error) {
+            console.error(`Polling ${this.url} failed:`, error);
+            this.failures++;
+            delay = jitteredBackoff(this.failures);
+        } finally {
+            this.inFlight = false;
+        }
+        this.schedule(delay);
+    }
+}
+
+class LiveTransport {
+    // Court snapshots over SSE, or polling when SSE keeps failing.
+    // onMessage(compact message, username table) runs for every snapshot.
+    constructor(onMessage, { maxSseFailures = 3, hiddenGrace = 60000, firstEventWait = 10000 } = {}) {
+        this.onMessage = onMessage;
+        this.maxSseFailures = maxSseFailures;
+        this.hiddenGrace = hiddenGrace;
+        this.firstEventWait = firstEventWait;
+        this.sseFailures = 0;
+        this.probes = 0;
+        this.evtSource = null;
+        this.retryTimeout = null;
+        this.hiddenTimeout = null;
+        this.firstEventTimeout = null;
+        // Each poll carries its whole username table
+        this.poller = new Poller('/court-updates-poll?format=compact', message => this.onMessage(message, []));
+        this.onVisibilityChange = () => this.visibilityChanged();
+        document.addEventListener('visibilitychange', this.onVisibilityChange);
+
+        // Remember for this tab if SSE never works here (say, a proxy that
+        // buffers streams), so a reload goes straight to polling
+        const pollingSince = parseInt(sessionStorage.getItem('livePollingSince') || '0', 10);
+        if (Date.now() - pollingSince < 10 * 60 * 1000) {
+            this.startPolling();
+        } else {
+            this.connect();
+        }
+    }
+
+    get mode() {
+        return this.poller.running ? 'polling' : 'sse';
+    }
+
+    connect() {
+        clearTimeout(this.retryTimeout);
+        if (this.evtSource) this.evtSource.close();
+        const names = []; // username table for this connection
+        let received = false;
+        this.evtSource = new EventSource('/court-updates?format=compact');
+        // The server sends a snapshot as soon as a stream opens, so silence
+        // means something in between is buffering the stream
+        clearTimeout(this.firstEventTimeout);
+        this.firstEventTimeout = setTimeout(() => this.evtSource.onerror(), this.firstEventWait);
+
+        this.evtSource.onmessage = (event) => {
+            if (!received) {
+                received = true;
+                clearTimeout(this.firstEventTimeout);
+                this.sseWorks();
+            }
+            try {
+                this.onMessage(JSON.parse(event.data), names);
+            } catch (err) {
+                console.error('Error parsing SSE data:', err);
+            }
+        };
+
+        this.evtSource.onerror = () => {
+            // Reconnect on our own schedule rather than the browser's fixed one
+            clearTimeout(this.firstEventTimeout);
+            this.evtSource.close();
+            this.evtSource = null;
+            this.sseFailed();
+        };
+    }
+
+    sseWorks() {
+        this.sseFailures = 0;
+        this.probes = 0;
+        sessionStorage.removeItem('livePollingSince');
+        if (this.poller.running) {
+            console.log('SSE is back, stopping fallback polling');
+            this.poller.stop();
+        }
+    }
+
+    sseFailed() {
+        this.sseFailures++;
+        if (this.poller.running) {
+            // A probe failed; try again later, less and less often
+            this.probes++;
+            this.retryTimeout = setTimeout(() => this.connect(), 30000 + jitteredBackoff(this.probes, 30000, 600000));
+        } else if (this.sseFailures >= this.maxSseFailures) {
+            console.warn(`SSE failed ${this.sseFailures} times, falling back to polling`);
+            sessionStorage.setItem('livePollingSince', String(Date.now()));
+            this.startPolling();
+        } else {
+            this.retryTimeout = setTimeout(() => this.connect(), jitteredBackoff(this.sseFailures));
+        }
+    }
+
+    startPolling() {
+        this.poller.start();
+        this.probes = 0;
+        this.retryTimeout = setTimeout(() => this.connect(), 30000 + jitteredBackoff(0, 30000));
+    }
+
+    visibilityChanged() {
+        clearTimeout(this.hiddenTimeout);
+        if (document.hidden) {
+            // Let go of the stream if the tab stays in the background; the poller
+            // slows down by itself
+            this.hiddenTimeout = setTimeout(() => {
+                if (this.evtSource) {
+                    clearTimeout(this.firstEventTimeout);
+                    this.evtSource.close();
+                    this.evtSource = null;
+                }
+            }, this.hiddenGrace);
+        } else if (!this.evtSource && !this.poller.running) {
+            // The channel sends its latest snapshot straight away on connect
+            this.connect();
+        }
+    }
+
+    close() {
+        clearTimeout(this.retryTimeout);
+        clearTimeout(this.firstEventTimeout);
+        clearTimeout(this.hiddenTimeout);
+        document.removeEventListener('visibilitychange', this.onVisibilityChange);
+        if (this.evtSource) this.evtSource.close();
+        this.poller.stop();
+    }
+}
@@ -0,0 +1,22 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# app.py reads its configuration at import time
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'test.db')
+os.environ.setdefault('SECRET_KEY', 'test')
+os.environ.pop('REQUEST_TRACE', None)
+
+@pytest.fixture
+def app_db():
+    """A fresh database with the default venue and courts, inside an app context"""
+    from app import app, db, bootstrap_db
+    with app.app_context():
+        db.drop_all()
+        bootstrap_db()
+        yield db
+        db.session.remove()
@@ -0,0 +1,125 @@
+import random
+
+from compaction import plan_merges
+
+CAPACITY = 4
+
+def apply_plan(queue, merges, empty):
+    sizes = dict(queue)
+    for source, target in merges:
+        sizes[target] += sizes.pop(source)
+    for group_id in empty:
+        del sizes[group_id]
+    return sizes
+
+def test_merges_never_split_or_overfill():
+    rng = random.Random(1)
+    for _ in range(200):
+        queue = [(i, rng.randint(0, CAPACITY)) for i in range(rng.randint(0, 40))]
+        merges, empty = plan_merges(queue, CAPACITY)
+        sources = [source for source, _ in merges]
+        # Each source moves whole, once, into a group that survives
+        assert len(sources) == len(set(sources))
+        assert not set(sources) & {target for _, target in merges}
+        assert not set(sources) & set(empty)
+        sizes = apply_plan(queue, merges, empty)
+        assert all(0 < players <= CAPACITY for players in sizes.values())
+        assert sum(sizes.values()) == sum(players for _, players in queue)
+
+def test_earliest_group_with_room_gets_the_players():
+    position = {group_id: i for i, group_id in enumerate('abcde')}
+    queue = [('a', 3), ('b', 2), ('c', 1), ('d', 1), ('e', 2)]
+    merges, empty = plan_merges(queue, CAPACITY)
+    # c fills a, d goes into b, and e (2) no longer fits anywhere earlier
+    assert merges == [('c', 'a'), ('d', 'b')]
+    assert empty == []
+    # Players only ever move forward in the queue
+    assert all(position[target] < position[source] for source, target in merges)
+
+def test_full_queue_is_left_alone():
+    queue = [(i, CAPACITY) for i in range(10)]
+    assert plan_merges(queue, CAPACITY) == ([], [])
+    assert plan_merges([], CAPACITY) == ([], [])
+
+def test_empty_groups_are_dropped_not_merged():
+    merges, empty = plan_merges([(1, 0), (2, 2), (3, 0), (4, 2)], CAPACITY)
+    assert merges == [(4, 2)]
+    assert empty == [1, 3]
+
+def test_interleaved_queues_merge_across_courts():
+    # Two courts with one pair each: apart nothing merges, interleaved they do
+    court_1, court_2 = [(1, 2)], [(2, 2)]
+    assert plan_merges(court_1, CAPACITY) == ([], [])
+    assert plan_merges(court_2, CAPACITY) == ([], [])
+    assert plan_merges(court_1 + court_2, CAPACITY) == ([(2, 1)], [])
+
+class CountingCapacity(int):
+    """A capacity that counts how often plan_merges works out free seats
+    (capacity - size), i.e. how many groups it looks at"""
+    def __sub__(self, other):
+        self.subtractions += 1
+        return int(self) - other
+
+def test_planning_is_linear():
+    # Groups of three never fit together, the worst case for a scan of
+    # every earlier group; ones and random sizes churn the deques
+    rng = random.Random(1)
+    queues = [
+        [(i, 3) for i in range(5000)],
+        [(i, 1) for i in range(5000)],
+        [(i, rng.randint(0, CAPACITY)) for i in range(5000)],
+    ]
+    for queue in queues:
+        capacity = CountingCapacity(CAPACITY)
+        capacity.subtractions = 0
+        plan_merges(queue, capacity)
+        # Each group is looked at a bounded number of times, not once per earlier group
+        assert capacity.subtractions <= CAPACITY * len(queue)
+
+def add_queue(db, court_id, sizes, prefix):
+    from app import Group, User
+    groups = []
+    for position, players in enumerate(sizes, start=1):
+        group = Group(court_id=court_id, is_in_queue=True, queue_position=position)
+        db.session.add(group)
+        db.session.flush()
+        for i in range(players):
+            db.session.add(User(username=f'{prefix}{position}-{i}', password_hash='x', group=group))
+        groups.append(group.id)
+    db.session.commit()
+    return groups
+
+def queue_of(db, court_id):
+    from app import Group, User
+    rows = db.session.execute(
+        db.select(Group.id, Group.queue_position, db.func.count(User.id))
+        .outerjoin(User, User.group_id == Group.id)
+        .where(Group.court_id == court_id, Group.is_in_queue == True)
+        .group_by(Group.id, Group.queue_position)
+        .order_by(Group.queue_position)
+    ).all()
+    return [tuple(row) for row in rows]
+
+def test_compact_queues_deletes_merged_groups_and_renumbers(app_db):
+    from app import Group, compact_queues, default_venue_id
+    a, b, c, d, e = add_queue(app_db, 1, [2, 0, 3, 2, 1], 'p')
+    result = compact_queues(default_venue_id())
+    app_db.session.commit()
+
+    assert result['merged'] == 2 and result['dropped'] == 1
+    # d (2) fills a, e (1) fills c, and b was empty
+    assert queue_of(app_db, 1) == [(a, 1, 4), (c, 2, 4)]
+    assert app_db.session.scalars(app_db.select(Group.id).where(Group.id.in_([b, d, e]))).all() == []
+
+def test_compact_queues_per_court_and_across_courts(app_db):
+    from app import compact_queues, default_venue_id
+    (first,) = add_queue(app_db, 1, [2], 'p')
+    (second,) = add_queue(app_db, 2, [2], 'q')
+
+    result = compact_queues(default_venue_id())
+    assert result['merged'] == 0
+    result = compact_queues(default_venue_id(), across_courts=True)
+    app_db.session.commit()
+    assert result['merged'] == 1
+    assert queue_of(app_db, 1) == [(first, 1, 4)]
+    assert queue_of(app_db, 2) == []
@@ -0,0 +1,143 @@
+# tracing.py
+# Request traces for reproducing a real club night offline. With
+# REQUEST_TRACE=<path> set, every request is appended to <path> as one JSON
+# line:
+#
+#   {"t": 1792428155.8, "method": "POST", "path": "/join-slot/12",
+#    "route": "/join-slot/<int:group_id>", "args": {}, "form": {}, "json": null,
+#    "headers": {"X-Requested-With": "XMLHttpRequest"}, "user": "a",
+#    "venue": null, "status": 200, "ms": 4.2, "stream": false}
+#
+# Before the first request is recorded, the court/queue state is written to
+# <path>.snapshot.json (see export_state() in app.py), so that
+# benchmarks/replay.py can load it into a fresh database and send the same
+# requests again. Passwords are never recorded.
+#
+# A trace only makes sense with the snapshot taken before its first request,
+# so a pair left over from an earlier run isn't appended to: if the trace
+# hasn't been written for RESUME_SECONDS, it and its snapshot are renamed
+# aside (night.jsonl -> night.20261017-190102.jsonl) and a fresh pair is
+# started. Workers of the same server, including one restarted mid-session,
+# find the trace still warm and join it.
+import json
+import logging
+import os
+import threading
+import time
+
+from flask import g, request, session
+
+RECORDED_HEADERS = ('X-Requested-With', 'Idempotency-Key', 'Accept', 'X-Page-Visibility')
+RESUME_SECONDS = 600
+
+logger = logging.getLogger(__name__)
+
+def redact(params):
+    if not isinstance(params, dict):
+        return params
+    return {key: '***' if 'password' in key.lower() else value for key, value in params.items()}
+
+def snapshot_path(trace_path):
+    return trace_path + '.snapshot.json'
+
+def rotate_stale(path, idle=RESUME_SECONDS):
+    """Rename the trace at path and its snapshot aside if the trace hasn't
+    been written for idle seconds (or there's a snapshot but no trace).
+    Returns whether an existing trace is being resumed instead."""
+    try:
+        modified = os.path.getmtime(path)
+    except FileNotFoundError:
+        modified = None
+    if modified is not None and time.time() - modified < idle:
+        return True
+    snapshot = snapshot_path(path)
+    if modified is None and not os.path.exists(snapshot):
+        return False
+    if modified is None:
+        modified = os.path.getmtime(snapshot)
+    base, extension = os.path.splitext(path)
+    rotated = f"{base}.{time.strftime('%Y%m%d-%H%M%S', time.localtime(modified))}{extension}"
+    for source, target in ((path, rotated), (snapshot, snapshot_path(rotated))):
+        try:
+            os.rename(source, target)
+        except FileNotFoundError:
+            pass  # not there, or another worker just moved it
+    logger.info(f"Moved the previous request trace aside to {rotated}")
+    return False
+
+class TraceRecorder:
+    """Appends one JSON line per request to path. snapshot() -> JSON-able
+    state is written next to it once, before the first recorded request."""
+
+    def __init__(self, path, snapshot=None, skip_endpoints=('static', 'built_asset')):
+        self.path = path
+        self.snapshot = snapshot
+        self.skip_endpoints = set(skip_endpoints)
+        self.lock = threading.Lock()
+        self.file = None
+        self.recorded = 0
+
+    def init_app(self, app):
+        app.before_request(self._start)
+        app.after_request(self._record)
+
+    def _start(self):
+        if request.endpoint in self.skip_endpoints:
+            return
+        if self.file is None:
+            self._open()
+        # Who sent it, as of before the request (login and logout change it)
+        g.trace_user = (session.get('user'), session.get('venue'))
+        g.trace_start = time.time()
+        g.trace_timer = time.perf_counter()
+
+    def _open(self):
+        with self.lock:
+            if self.file is not None:
+                return
+            if rotate_stale(self.path):
+                logger.info(f"Resuming the request trace in {self.path}")
+            # Line buffered, so each record is one append to the file. Opened
+            # first, so other workers see a live trace rather than a stray snapshot.
+            trace = open(self.path, 'a', buffering=1)
+            if self.snapshot is not None:
+                try:
+                    # 'x': with several workers, only the first one writes it
+                    with open(snapshot_path(self.path), 'x') as f:
+                        json.dump(self.snapshot(), f)
+                except FileExistsError:
+                    pass
+            self.file = trace
+
+    def _record(self, response):
+        started = g.pop('trace_start', None)
+        if started is None:
+            return response
+        user, venue = g.pop('trace_user')
+        record = {
+            't': started,
+            'method': request.method,
+            'path': request.path,
+            'route': request.url_rule.rule if request.url_rule else None,
+            'args': request.args.to_dict(),
+            'form': redact(request.form.to_dict()),
+            'json': redact(request.get_json(silent=True)),
+            'headers': {name: request.headers[name] for name in RECORDED_HEADERS if name in request.headers},
+            'user': user,
+            'venue': venue,
+            'status': response.status_code,
+            'ms': round((time.perf_counter() - g.pop('trace_timer')) * 1000, 2),
+            'stream': response.mimetype == 'text/event-stream',
+        }
+        line = json.dumps(record, separators=(',', ':')) + '\n'
+        with self.lock:
+            self.file.write(line)
+            self.recorded += 1
+        return response
+
+def read_trace(path):
+    """The records of a trace file, in the order they were written"""
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)